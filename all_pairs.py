@@ -0,0 +1,226 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+#
+# Author: Brian Wong and Kevin Mu
+# Class: Computer Science 143
+# Date: December 2, 2014
+# Description: Batched shortest paths from many starts at once, giving
+#              dense distance and next-hop matrices for a CSRGraph
+#              instead of one pure-Python Dijkstra's run per start.
+#
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+import numpy as np
+
+try:
+    import scipy.sparse
+    import scipy.sparse.csgraph
+except ImportError:
+    scipy = None
+
+# Floyd-Warshall takes O(V^3) time and O(V^2) memory whatever the number
+# of starts, so 'auto' only uses it for graphs up to this size
+FLOYD_WARSHALL_MAX_NODES = 400
+
+# Roughly the number of (start, edge) pairs handled at once when finding
+# the predecessors, to bound the size of the temporary arrays
+CHUNK_SIZE = 1 << 21
+
+BACKENDS = ['auto', 'python', 'scipy', 'numpy']
+
+def pick_backend(graph, backend='auto'):
+    '''
+    Resolve backend 'auto' to the fastest available backend for graph:
+    'scipy' if SciPy is installed, 'numpy' (Floyd-Warshall) for small
+    graphs, and 'python' (main.dijkstra from every start) otherwise.
+    '''
+    if backend not in BACKENDS:
+        raise ValueError('unknown routing backend %r' % (backend,))
+    if backend == 'scipy' and scipy is None:
+        raise ValueError('the scipy routing backend needs SciPy installed')
+    if backend != 'auto':
+        return backend
+    if scipy is not None:
+        return 'scipy'
+    if graph.num_nodes <= FLOYD_WARSHALL_MAX_NODES:
+        return 'numpy'
+    return 'python'
+
+def all_pairs(graph, starts=None, backend='auto'):
+    '''
+    Find the shortest paths in a CSRGraph from every node in starts (all
+    nodes if None). Returns (dist, next_hop), two arrays with a row for
+    each start and a column for each node: dist[i][v] is the distance
+    from starts[i] to v, and next_hop[i][v] the first node after
+    starts[i] on the way to v, or -1 if there is none.
+
+    The 'scipy' backend breaks ties between equally short paths the same
+    way main.dijkstra does, so its next hops match the 'python' backend.
+    The 'numpy' backend keeps whichever path Floyd-Warshall finds first.
+    '''
+    if starts is None:
+        starts = xrange(graph.num_nodes)
+    starts = np.asarray(list(starts), dtype=np.int64)
+    backend = pick_backend(graph, backend)
+    if backend == 'scipy':
+        return dijkstra_scipy(graph, starts)
+    if backend == 'numpy':
+        return floyd_warshall(graph, starts)
+    raise ValueError('all_pairs has no python backend; use main.gen_routing_table')
+
+def dijkstra_scipy(graph, starts):
+    '''
+    Run scipy.sparse.csgraph's Dijkstra's algorithm from all starts in
+    one call, then rebuild the predecessors with the tie-breaking rule of
+    main.dijkstra.
+    '''
+    matrix = scipy.sparse.csr_matrix((graph.cost, graph.targets, graph.offsets),
+                                     shape=(graph.num_nodes, graph.num_nodes))
+    dist = scipy.sparse.csgraph.dijkstra(matrix, directed=True, indices=starts)
+    dist = np.atleast_2d(dist)
+    pred = canonical_pred(graph, dist, starts)
+    return dist, first_hops(pred, starts)
+
+def canonical_pred(graph, dist, starts):
+    '''
+    Return the predecessor matrix implied by the distance matrix dist:
+    pred[i][v] is the in-neighbor u of v with the smallest (dist[i][u], u)
+    among those with dist[i][u] + cost = dist[i][v], which is the node
+    main.dijkstra picks, or -1 for the start and unreachable nodes.
+
+    Scipy's heap breaks ties in its own order, but the distances are the
+    same sums of the same costs, so the tight edges are exactly found.
+    '''
+    num_nodes = graph.num_nodes
+    # Edges grouped by their target, as in the in_edges order
+    order = graph.in_edges
+    sources = graph.sources[order]
+    targets = graph.targets[order]
+    cost = graph.cost[order]
+    has_in = np.diff(graph.in_offsets) > 0
+    segments = graph.in_offsets[:-1][has_in]
+
+    pred = np.full(dist.shape, -1, dtype=np.int64)
+    rows = max(1, CHUNK_SIZE // max(graph.num_edges, 1))
+    for lo in xrange(0, len(starts), rows):
+        d = dist[lo:lo+rows]
+        du = d[:, sources]
+        tight = (du + cost == d[:, targets]) & np.isfinite(du)
+
+        best = np.full(d.shape, np.inf)
+        best[:, has_in] = np.minimum.reduceat(np.where(tight, du, np.inf), segments, axis=1)
+        tight &= du == best[:, targets]
+
+        chosen = np.full(d.shape, num_nodes, dtype=np.int64)
+        chosen[:, has_in] = np.minimum.reduceat(np.where(tight, sources, num_nodes), segments, axis=1)
+        chosen[chosen == num_nodes] = -1
+        chosen[np.arange(len(d)), starts[lo:lo+rows]] = -1
+        pred[lo:lo+rows] = chosen
+    return pred
+
+def first_hops(pred, starts):
+    '''
+    Turn a predecessor matrix into a next-hop matrix by pointer jumping:
+    every node repeatedly skips to its pointer's pointer until it points
+    at a child of the start, which is its first hop. This takes
+    O(log(path length)) vectorized passes.
+    '''
+    rows = np.arange(len(starts))[:, None]
+    nodes = np.arange(pred.shape[1])
+    reachable = pred >= 0
+    # Children of the start (and nodes with no path) point at themselves
+    hop = np.where(reachable & (pred != starts[:, None]), pred, nodes)
+    while True:
+        jumped = hop[rows, hop]
+        if np.array_equal(jumped, hop):
+            break
+        hop = jumped
+    hop[~reachable] = -1
+    return hop
+
+def floyd_warshall(graph, starts):
+    '''
+    Vectorized Floyd-Warshall over the dense cost matrix: each of the V
+    rounds relaxes every pair through one intermediate node with a single
+    NumPy operation.
+    '''
+    num_nodes = graph.num_nodes
+    dist = np.full((num_nodes, num_nodes), np.inf)
+    dist[graph.sources, graph.targets] = graph.cost
+    np.fill_diagonal(dist, 0)
+    hop = np.full((num_nodes, num_nodes), -1, dtype=np.int64)
+    hop[graph.sources, graph.targets] = graph.targets
+
+    for k in xrange(num_nodes):
+        through = dist[:, k, None] + dist[None, k, :]
+        better = through < dist
+        dist = np.where(better, through, dist)
+        hop = np.where(better, hop[:, k, None], hop)
+
+    np.fill_diagonal(hop, -1)
+    return dist[starts], hop[starts]
+
+class RoutingMatrix:
+    """
+    class wrapping a next-hop matrix from all_pairs so that it can be
+    used like the routing tables built by main.gen_routing_table:
+    table[start][dest] is the next hop from start toward dest, or None.
+
+    The next hops are stored as a single 2-D integer array. If full, it
+    has a row for every node, and row i is node i's; otherwise it has one
+    row per start, in sorted order, so a table for a few starts takes a
+    few rows however large the graph is. rows maps each start to its row.
+    Looking up a node that is not a start raises KeyError, as it does for
+    a dict routing table. The arrays are used as given, so they can be
+    memory-mapped (see graph_store.py).
+    """
+    def __init__(self, starts, next_hop, dist=None, full=False):
+        starts = sorted(set(int(s) for s in starts))
+        if full:
+            self.rows = dict((start, start) for start in starts)
+        else:
+            if len(next_hop) != len(starts):
+                raise ValueError('%r rows for %r starts' % (len(next_hop), len(starts)))
+            self.rows = dict((start, i) for i, start in enumerate(starts))
+        self.full = full
+        self.starts = set(starts)
+        self.next_hop = next_hop
+        self.dist = dist
+
+    @staticmethod
+    def build(graph, starts=None, backend='auto'):
+        if starts is None:
+            starts = range(graph.num_nodes)
+        starts = sorted(set(starts))
+        dist, rows = all_pairs(graph, starts, backend)
+        return RoutingMatrix(starts, np.asarray(rows, dtype=np.int32), dist,
+                             full=len(starts) == graph.num_nodes)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __contains__(self, start):
+        return start in self.starts
+
+    def __iter__(self):
+        return iter(sorted(self.starts))
+
+    def __getitem__(self, start):
+        if start not in self.rows:
+            raise KeyError(start)
+        return RoutingRow(self.next_hop[self.rows[start]])
+
+class RoutingRow:
+    """
+    One row of a RoutingMatrix, translating -1 back to None.
+    """
+    def __init__(self, row):
+        self.row = row
+
+    def __len__(self):
+        return len(self.row)
+
+    def __getitem__(self, dest):
+        hop = self.row[dest]
+        if hop < 0:
+            return None
+        return int(hop)
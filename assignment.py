@@ -0,0 +1,116 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+#
+# Author: Brian Wong and Kevin Mu
+# Class: Computer Science 143
+# Date: December 2, 2014
+# Description: Batched traffic assignment for the cars waiting at
+#              junctions in a timestep, with the method of successive
+#              averages, as a cheaper alternative to rerouting after
+#              every car as the centralized algorithm does.
+#
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+import numpy as np
+import instrument
+from all_pairs import all_pairs, pick_backend
+from dynamic_sssp import DynamicRoutingTable
+
+# Default number of averaging iterations after the first all-or-nothing
+# assignment; 0 routes every car by the costs at the start of the timestep
+ITERATIONS = 5
+
+def shortest_hops(cost_graph, starts, backend='auto'):
+    '''
+    Return {start: row}, where row[dest] is the next hop from start toward
+    dest in cost_graph, or None or -1 if there is none.
+    '''
+    backend = pick_backend(cost_graph, backend)
+    if backend == 'python':
+        table = DynamicRoutingTable(cost_graph, starts).table
+        return dict((start, table[start]) for start in starts)
+    _, hops = all_pairs(cost_graph, starts, backend)
+    return dict(zip(starts, hops.tolist()))
+
+def assign(traffic_state, starts, dests, iterations=ITERATIONS, backend='auto'):
+    '''
+    Choose the next hop of each of the waiting cars, where car i is at
+    junction starts[i] headed to dests[i], and return them in car order.
+
+    The cars are grouped by (junction, destination), and each group's
+    cars are split between next hops with a Frank-Wolfe iteration using
+    the step sizes of the method of successive averages. Each iteration
+    finds every group's shortest path under the costs of the current
+    traffic plus the cars assigned so far, moves a share 1/(n+1) of the
+    group toward its first road, and recomputes the load. As with the
+    centralized algorithm, a car only adds to the traffic of the road it
+    enters. So that a car does not count itself when choosing, one car of
+    every group, spread over the group's current split, is taken off the
+    load before the costs are computed. All groups search one common cost
+    graph, so each group also sees the other groups one car lighter; this
+    keeps a search per iteration rather than one per group. Otherwise a
+    lone car sees its own road as busier than the alternatives and the
+    averages swing between them. iterations bounds the work per
+    timestep; each one is a single batched shortest path search from the
+    junctions where cars wait.
+
+    The final fractional split of each group is rounded to whole cars
+    by largest remainder, and the group's cars, in order, take the next
+    hops with the largest shares first.
+    '''
+    graph = traffic_state.graph
+    road_cost_map = traffic_state.road_cost_map
+    traffic = np.array(traffic_state.traffic, dtype=np.float64)
+    targets = graph.structure[1]
+
+    groups = {}
+    for i, key in enumerate(zip(starts, dests)):
+        groups.setdefault(key, []).append(i)
+    keys = sorted(groups)
+    junctions = sorted(set(starts))
+
+    # split[k][e] is the share of group k's cars entering edge e, load is
+    # the cars on each edge, and presence is one car of every group, all
+    # of it removed from the one cost graph the groups share
+    split = [None] * len(keys)
+    load = np.zeros(graph.num_edges)
+    presence = np.zeros(graph.num_edges)
+    for n in xrange(iterations + 1):
+        cost_graph = graph.with_cost(road_cost_map.costs(traffic + load - presence))
+        hops = shortest_hops(cost_graph, junctions, backend)
+        step = 1.0 / (n + 1)
+        load = np.zeros(graph.num_edges)
+        presence = np.zeros(graph.num_edges)
+        for k, (u, dest) in enumerate(keys):
+            hop = hops[u][dest]
+            if hop is None or hop < 0:
+                continue
+            e = graph.edge(u, hop)
+            shares = split[k] or {}
+            shares = dict((f, (1 - step) * share) for f, share in shares.items())
+            shares[e] = shares.get(e, 0) + step
+            split[k] = shares
+            demand = len(groups[(u, dest)])
+            for f, share in shares.items():
+                load[f] += demand * share
+                presence[f] += share
+    if instrument.active is not None:
+        instrument.active.count('assignment_iterations', iterations + 1)
+
+    next_hops = [None] * len(starts)
+    for k, key in enumerate(keys):
+        cars = groups[key]
+        if split[k] is None:
+            continue
+        # Largest remainder rounding, ties going to the lower edge ID
+        quotas = sorted(((len(cars) * share, e) for e, share in split[k].items()),
+                        key=lambda (quota, e): (-quota, e))
+        counts = dict((e, int(quota)) for quota, e in quotas)
+        left = len(cars) - sum(counts.values())
+        for quota, e in sorted(quotas, key=lambda (quota, e): (-(quota - int(quota)), e))[:left]:
+            counts[e] += 1
+        i = 0
+        for _, e in quotas:
+            for car in cars[i:i + counts[e]]:
+                next_hops[car] = targets[e]
+            i += counts[e]
+    return next_hops
@@ -0,0 +1,628 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+# 
+# Author: Brian Wong and Kevin Mu
+# Class: Computer Science 143
+# Date: December 2, 2014
+# Description: Benchmarks for the routing and simulation code. Run with
+#              python benchmark.py heap
+#              python benchmark.py run --out results.json
+#              python benchmark.py compare old.json new.json
+#              python benchmark.py regions
+#              python benchmark.py assignment
+#              python benchmark.py demand
+#              python benchmark.py trajectory
+#              python benchmark.py paths
+#
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+import os
+import sys
+import time
+import json
+import random
+import shutil
+import argparse
+import tempfile
+import platform
+import itertools
+import multiprocessing
+import numpy as np
+import heap_module as hm
+import graph as gm
+import main
+import instrument
+import trajectory
+import assignment
+from demand import Demand, reachable
+from fleet import Fleet
+from traffic_state import TrafficState
+from routing_cache import RoutingCache
+import contraction
+from contraction import ContractionHierarchy
+from dynamic_sssp import DynamicRoutingTable
+from point_to_point import shortest_path
+
+def list_heap_dijkstra(graph, start):
+    '''
+    Dijkstra's algorithm using the list-based heap functions, where
+    changeValue and the membership test are linear scans of the heap.
+    This is the implementation main.dijkstra used before IndexedHeap.
+    '''
+    distances = {start: 0}
+    pred = {start: None}
+    for terminus in graph[start].keys():
+        pred[terminus] = start
+
+    value = {}
+    heap = []
+    for v in graph.keys():
+        value[v] = float('inf')
+        heap.append(v)
+
+    hm.changeValue(heap, start, 0, value)
+
+    while (len(heap) > 0):
+        smallest = hm.extractMin(heap, value)
+        distances[smallest] = value[smallest]
+
+        for terminus in graph[smallest].keys():
+            if terminus in heap:
+                newDist = value[smallest] + graph[smallest][terminus]
+                if newDist < value[terminus]:
+                    hm.changeValue(heap, terminus, newDist, value)
+                    pred[terminus] = smallest
+
+    return distances, pred
+
+def time_call(f, *args):
+    '''
+    Return the best wall time of three calls of f(*args).
+    '''
+    best = float('inf')
+    for _ in range(3):
+        t = time.time()
+        f(*args)
+        best = min(best, time.time() - t)
+    return best
+
+def heap_ops_list(n, ops):
+    value = {}
+    heap = []
+    for i in xrange(n):
+        value[i] = float('inf')
+        heap.append(i)
+    for item, newValue in ops:
+        if newValue < value[item]:
+            hm.changeValue(heap, item, newValue, value)
+    while heap:
+        hm.extractMin(heap, value)
+
+def heap_ops_indexed(n, ops, d):
+    value = dict((i, float('inf')) for i in xrange(n))
+    heap = hm.IndexedHeap(range(n), value, d)
+    for item, newValue in ops:
+        if newValue < heap.value(item):
+            heap.decreaseKey(item, newValue)
+    while heap:
+        heap.extractMin()
+
+def bench_heap(sizes=(100, 400, 1600)):
+    '''
+    Compare the list-based heap functions against IndexedHeap, first on
+    raw decrease-key/extract-min workloads and then inside Dijkstra's
+    algorithm on generated road graphs.
+    '''
+    random.seed(0)
+    print 'Heap operations (n items, 4n decrease-keys, n extract-mins)'
+    print 'n, list, indexed d=2, indexed d=4'
+    for n in sizes:
+        ops = [(random.randrange(n), random.random()) for _ in xrange(4*n)]
+        print '%d, %.4f, %.4f, %.4f' % (n,
+            time_call(heap_ops_list, n, ops),
+            time_call(heap_ops_indexed, n, ops, 2),
+            time_call(heap_ops_indexed, n, ops, 4))
+
+    print ''
+    print "Single-source Dijkstra's on get_grid_graph(n)"
+    print 'n, list, indexed, speedup'
+    for n in sizes:
+        graph, road_cost_map, _ = main.get_grid_graph(n)
+        cost_graph = main.get_zero_traffic_cost_map(graph, road_cost_map).to_dict()
+        start = cost_graph.keys()[0]
+        old = time_call(list_heap_dijkstra, cost_graph, start)
+        new = time_call(main.dijkstra, cost_graph, start)
+        print '%d, %.4f, %.4f, %.1fx' % (n, old, new, old / new)
+
+# The parameters swept by the scaling suite. Each benchmark only sweeps
+# the parameters it depends on.
+SWEEP = {
+    'nodes': [20, 80, 320],
+    'connectivity': [4, 6],
+    'cars': [30, 120],
+    'mode': ['naive', 'fixed', 'dynamic', 'centralized', 'assignment'],
+    'regions': [1, 2, 4],
+}
+QUICK_SWEEP = {
+    'nodes': [12, 40],
+    'connectivity': [6],
+    'cars': [30],
+    'mode': ['naive', 'fixed', 'dynamic', 'centralized', 'assignment'],
+    'regions': [1, 2],
+}
+
+# The test() arguments for each mode
+MODES = {
+    'naive': {'use_naive': True},
+    'fixed': {'fix_route': True},
+    'dynamic': {},
+    'centralized': {'centralized': True},
+    'assignment': {'assign_iterations': assignment.ITERATIONS},
+}
+
+# Number of timesteps timed by the one_timestep benchmark
+TIMESTEPS = 10
+
+def make_graph(params):
+    '''
+    Generate the graph for one benchmark case with main.get_grid_graph,
+    using the case's connectivity.
+    '''
+    old = main.CONNECTIVITY
+    main.CONNECTIVITY = params['connectivity']
+    try:
+        return main.get_grid_graph(params['nodes'])
+    finally:
+        main.CONNECTIVITY = old
+
+def bench_generate_graph(params):
+    n = params['nodes']
+    size = int(n ** 0.5) + 4
+    return lambda: gm.generateGraph(n, size, size, params['connectivity'])
+
+def bench_dijkstra(params):
+    graph, road_cost_map, _ = make_graph(params)
+    cost_graph = main.get_zero_traffic_cost_map(graph, road_cost_map)
+    starts = [random.randrange(graph.num_nodes) for _ in range(10)]
+    def run():
+        for start in starts:
+            main.dijkstra(cost_graph, start)
+    return run
+
+def bench_gen_routing_table(params):
+    graph, road_cost_map, _ = make_graph(params)
+    cost_graph = main.get_zero_traffic_cost_map(graph, road_cost_map)
+    nodes = range(graph.num_nodes)
+    return lambda: main.gen_routing_table(cost_graph, nodes, params['backend'])
+
+def start_state(graph, road_cost_map, params):
+    '''
+    Place params['cars'] cars at random junctions with random reachable
+    destinations, waiting to be routed.
+    '''
+    zero = main.get_zero_traffic_cost_map(graph, road_cost_map)
+    hierarchy = ContractionHierarchy.for_graph(zero)
+    traffic_state = TrafficState(graph, road_cost_map)
+    cars = Fleet()
+    while len(cars) < params['cars']:
+        source = random.randrange(graph.num_nodes)
+        dest = random.randrange(graph.num_nodes)
+        if hierarchy[source][dest] is None:
+            continue
+        route = []
+        if params['mode'] == 'fixed':
+            route = shortest_path(graph, source, dest)[0][1:]
+        cars.add(main.new_car_id(), source, dest, fixed_route=route)
+    return hierarchy, traffic_state, cars
+
+def bench_one_timestep(params):
+    graph, road_cost_map, _ = make_graph(params)
+    mode = MODES[params['mode']]
+    state = random.getstate()
+    def run():
+        # The same starting cars every repeat; building them is not timed
+        random.setstate(state)
+        hierarchy, traffic_state, cars = start_state(graph, road_cost_map, params)
+        routing_cache = RoutingCache(traffic_state)
+        naive = hierarchy if mode.get('use_naive') else None
+        t = time.time()
+        for _ in range(TIMESTEPS):
+            cars, _ = main.one_timestep(graph, road_cost_map, cars,
+                fix_route=mode.get('fix_route', False), centralized=mode.get('centralized', False),
+                naive_routing_table=naive, traffic_state=traffic_state, routing_cache=routing_cache,
+                assign_iterations=mode.get('assign_iterations'))
+        return time.time() - t
+    return run
+
+def bench_test(params):
+    graph, road_cost_map, spawn_probability = make_graph(params)
+    state = random.getstate()
+    def run():
+        # Time a trial on a graph the run has not seen yet
+        random.setstate(state)
+        contraction._hierarchies.clear()
+        main.test(params['cars'], graph, road_cost_map, spawn_probability, **MODES[params['mode']])
+    return run
+
+def far_pair(routing_table, nodes):
+    '''
+    Like main.find_special_pair, but pick the first and last nodes with a
+    route between them, so that the cars cross the map.
+    '''
+    for node in nodes:
+        for terminus in reversed(nodes):
+            if terminus != node and routing_table[node][terminus] is not None:
+                return node, terminus
+    return None, None
+
+def run_regions(graph, road_cost_map, spawn_probability, cars, mode, engine, regions=1, **options):
+    '''
+    Run one main.test with the cars spawned at opposite ends of the map.
+    Returns (average travel time, cars handed between regions). options
+    are passed to main.test along with the mode's arguments.
+    '''
+    hierarchy = ContractionHierarchy.for_graph(main.get_zero_traffic_cost_map(graph, road_cost_map))
+    pair = far_pair(hierarchy, range(graph.num_nodes))
+    with instrument.recording() as recorder:
+        average = main.test(cars, graph, road_cost_map, spawn_probability, engine=engine,
+                            regions=regions, spawn_pair=pair, **dict(MODES[mode], **options))
+    return average, recorder.summary()['totals'].get('handoffs', 0)
+
+def bench_regions(params):
+    graph, road_cost_map, spawn_probability = make_graph(params)
+    state = random.getstate()
+    def run():
+        random.setstate(state)
+        run_regions(graph, road_cost_map, spawn_probability, params['cars'],
+                    params['mode'], 'regions', params['regions'])
+    return run
+
+def bench_region_scaling(nodes=400, cars=200, regions=(1, 2, 4, 8), seed=0):
+    '''
+    Time the region-partitioned simulation against the single-process
+    event-driven loop for each number of regions, and check that it gives
+    the same average travel time.
+    '''
+    random.seed(seed)
+    graph, road_cost_map, spawn_probability = main.get_grid_graph(nodes)
+    state = random.getstate()
+    # Build the naive baseline's hierarchy before anything is timed
+    ContractionHierarchy.for_graph(main.get_zero_traffic_cost_map(graph, road_cost_map))
+    print 'Region-partitioned simulation, %d junctions, %d cars, %d CPUs' % (
+        nodes, cars, multiprocessing.cpu_count())
+    print 'mode, regions, seconds, speedup, handoffs, same arrivals'
+    for mode in ['naive', 'fixed', 'dynamic']:
+        random.setstate(state)
+        t = time.time()
+        expected, _ = run_regions(graph, road_cost_map, spawn_probability, cars, mode, 'event')
+        single = time.time() - t
+        print '%s, event, %.3f, 1.00x, 0, yes' % (mode, single)
+        for n in regions:
+            random.setstate(state)
+            t = time.time()
+            average, handoffs = run_regions(graph, road_cost_map, spawn_probability, cars, mode, 'regions', n)
+            elapsed = time.time() - t
+            print '%s, %d, %.3f, %.2fx, %d, %s' % (mode, n, elapsed, single / elapsed, handoffs,
+                                                 'yes' if average == expected else 'NO')
+
+def bench_assignment(sizes=(40, 160, 400), cars=200, iterations=(0, 1, 3, 10), seed=0):
+    '''
+    Compare the average travel time and run time of the dynamic and
+    centralized algorithms with traffic assignment at each iteration budget,
+    on graphs of each size with the cars crossing the map.
+    '''
+    print 'Traffic assignment, %d cars' % cars
+    print 'junctions, algorithm, iterations, average travel time, seconds'
+    for nodes in sizes:
+        random.seed(seed)
+        graph, road_cost_map, spawn_probability = main.get_grid_graph(nodes)
+        state = random.getstate()
+        ContractionHierarchy.for_graph(main.get_zero_traffic_cost_map(graph, road_cost_map))
+        runs = [('dynamic', '-', {}), ('centralized', '-', {})]
+        runs += [('assignment', n, {'assign_iterations': n}) for n in iterations]
+        for mode, n, options in runs:
+            random.setstate(state)
+            t = time.time()
+            average, _ = run_regions(graph, road_cost_map, spawn_probability, cars, mode, 'event', **options)
+            print '%d, %s, %s, %.2f, %.3f' % (nodes, mode, n, average, time.time() - t)
+
+def bench_demand(sizes=(100, 400, 1600), trips=(1000, 10000, 100000), seed=0):
+    '''
+    Time spawning trips from a demand.Demand built from the graph's spawn
+    probabilities, drawing a timestep's trips and adding them to a Fleet,
+    against main.spawn_cars adding 4 cars at a time.
+    '''
+    print 'Demand generation, best of 3'
+    print 'junctions, trips per timestep, reachability seconds, draw seconds, spawn seconds, trips per second'
+    for nodes in sizes:
+        random.seed(seed)
+        graph, road_cost_map, spawn_probability = main.get_grid_graph(nodes)
+        t = time.time()
+        mask = reachable(graph)
+        mask_seconds = time.time() - t
+        traffic_state = TrafficState(graph, road_cost_map)
+        for n in trips:
+            demand = Demand.from_spawn_probability(spawn_probability, mask, n)
+            rng = np.random.RandomState(seed)
+            draw = time_call(demand.draw, rng)
+            spawn = time_call(lambda: main.spawn_trips(Fleet(), demand, rng, traffic_state))
+            print '%d, %d, %.3f, %.4f, %.4f, %.0f' % (nodes, n, mask_seconds, draw, spawn, n / spawn)
+
+        hierarchy = ContractionHierarchy.for_graph(main.get_zero_traffic_cost_map(graph, road_cost_map))
+        start, dest = main.find_special_pair(hierarchy, range(nodes))
+        def loop():
+            cars = Fleet()
+            for i in xrange(trips[0] // 4):
+                main.spawn_cars(cars, start, dest, range(nodes), hierarchy, traffic_state)
+        spawn = time_call(loop)
+        print '%d, %d, spawn_cars, -, %.4f, %.0f' % (nodes, trips[0], spawn, trips[0] / spawn)
+
+class TimedWriter(trajectory.TrajectoryWriter):
+    """
+    class recording trajectories like TrajectoryWriter while adding up the
+    time spent in its own calls.
+    """
+    def __init__(self, path, positions=False):
+        self.seconds = 0.0
+        trajectory.TrajectoryWriter.__init__(self, path, positions)
+
+    def record(self, *args):
+        t = time.clock()
+        trajectory.TrajectoryWriter.record(self, *args)
+        self.seconds += time.clock() - t
+
+    def flush(self):
+        t = time.clock()
+        trajectory.TrajectoryWriter.flush(self)
+        self.seconds += time.clock() - t
+
+def bench_trajectory(nodes=400, cars=200, demand=10, seed=0, repeat=5):
+    '''
+    Time main.test with and without recording trajectories, in each engine,
+    with the usual 4 cars per timestep and with demand trips per timestep.
+    The runs with and without recording alternate, and the best CPU time of
+    each is kept. Since the whole run varies by more than the recording
+    costs, the time spent in the writer itself is also given.
+    '''
+    random.seed(seed)
+    graph, road_cost_map, spawn_probability = main.get_grid_graph(nodes)
+    state = random.getstate()
+    ContractionHierarchy.for_graph(main.get_zero_traffic_cost_map(graph, road_cost_map))
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'run')
+
+    def run(engine, trips, writer=None):
+        random.setstate(state)
+        t = time.clock()
+        trajectory.active = writer
+        try:
+            main.test(cars, graph, road_cost_map, spawn_probability, engine=engine, demand=trips)
+        finally:
+            trajectory.active = None
+        if writer is not None:
+            writer.close()
+        return time.clock() - t
+
+    print 'Trajectory recording, %d junctions, %d cars, best of %d' % (nodes, cars, repeat)
+    print 'engine, trips per timestep, recorded, seconds, recording seconds, overhead, writer share, records, bytes'
+    try:
+        for engine in ['timestep', 'event']:
+            for trips in [None, demand]:
+                options = ['events']
+                if engine == 'timestep':
+                    options.append('positions')
+                for name in options:
+                    off = on = float('inf')
+                    for _ in range(repeat):
+                        off = min(off, run(engine, trips))
+                        writer = TimedWriter(path, name == 'positions')
+                        on = min(on, run(engine, trips, writer))
+                    records = len(trajectory.Trajectory(path))
+                    size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+                    print '%s, %s, %s, %.3f, %.3f, %+.1f%%, %.1f%%, %d, %d' % (
+                        engine, trips or 4, name, off, on, 100 * (on / off - 1),
+                        100 * writer.seconds / off, records, size)
+    finally:
+        shutil.rmtree(directory)
+
+# name: (setup function, swept parameters). The setup function returns
+# a callable to time; if that returns a number, it is the time measured.
+def check_paths(sizes=(12, 40, 100), graphs=20, edits=15, queries=200, seed=0):
+    '''
+    Check that A* returns the paths of the routing tables' shortest path
+    trees. Each graph gets edits random traffic changes, and the diagonal
+    roads of the grid graphs make many paths tie to within rounding.
+    Returns the number of queries whose path or distance differ.
+    '''
+    rng = random.Random(seed)
+    print 'A* against DynamicRoutingTable, %d graphs per size, %d queries each' % (graphs, queries)
+    print 'junctions, queries, different paths, different distances'
+    failures = 0
+    for nodes in sizes:
+        paths = distances = 0
+        for i in xrange(graphs):
+            random.seed(rng.random())
+            graph, road_cost_map, _ = main.get_grid_graph(nodes)
+            traffic_state = TrafficState(graph, road_cost_map)
+            for k in xrange(edits):
+                e = random.randrange(graph.num_edges)
+                if traffic_state.traffic[e] > 0 and random.random() < 0.3:
+                    traffic_state.leave(e)
+                else:
+                    traffic_state.enter(e)
+            cost_graph = traffic_state.cost_graph
+            trees = DynamicRoutingTable(cost_graph)
+            for q in xrange(queries):
+                start, dest = random.sample(xrange(graph.num_nodes), 2)
+                if start not in trees.pred:
+                    trees.add_start(start)
+                expected = None
+                if trees.pred[start][dest] is not None:
+                    expected = [dest]
+                    while expected[-1] != start:
+                        expected.append(trees.pred[start][expected[-1]])
+                    expected.reverse()
+                path, distance, _ = shortest_path(cost_graph, start, dest)
+                paths += path != expected
+                distances += distance != trees.dist[start][dest]
+        print '%d, %d, %d, %d' % (nodes, graphs * queries, paths, distances)
+        failures += paths + distances
+    return failures
+
+SUITE = {
+    'generate_graph': (bench_generate_graph, ['nodes', 'connectivity']),
+    'dijkstra': (bench_dijkstra, ['nodes', 'connectivity']),
+    'gen_routing_table': (bench_gen_routing_table, ['nodes', 'connectivity']),
+    'one_timestep': (bench_one_timestep, ['nodes', 'connectivity', 'cars', 'mode']),
+    'test': (bench_test, ['nodes', 'connectivity', 'cars', 'mode']),
+    'regions': (bench_regions, ['nodes', 'connectivity', 'cars', 'mode', 'regions']),
+}
+
+def cases(name, sweep):
+    _, swept = SUITE[name]
+    for values in itertools.product(*[sweep[p] for p in swept]):
+        params = dict(zip(swept, values))
+        if name == 'regions' and params['mode'] in ('centralized', 'assignment'):
+            continue
+        if name == 'gen_routing_table':
+            for backend in ['python', 'auto']:
+                params = dict(params, backend=backend)
+                yield params
+        else:
+            yield params
+
+def run_case(name, params, seed, repeat):
+    '''
+    Return the best time of repeat runs of one benchmark case. The random
+    modules are seeded from seed, so every run of the suite (and every
+    revision of the code) times the same graphs and cars.
+    '''
+    random.seed(seed)
+    np.random.seed(seed)
+    f = SUITE[name][0](params)
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.time()
+        measured = f()
+        elapsed = time.time() - t
+        if isinstance(measured, float):
+            elapsed = measured
+        best = min(best, elapsed)
+    return best
+
+def case_key(result):
+    return result['benchmark'], tuple(sorted(result['params'].items()))
+
+def run_suite(names, quick=False, seed=0, repeat=3, out=None):
+    '''
+    Run the named benchmarks over the sweep and write the results as JSON
+    to out (standard output if None).
+    '''
+    sweep = QUICK_SWEEP if quick else SWEEP
+    results = []
+    for name in names:
+        for params in cases(name, sweep):
+            seconds = run_case(name, params, seed, repeat)
+            results.append({'benchmark': name, 'params': params, 'seconds': seconds})
+            print >> sys.stderr, '%s %s %.4f' % (name, json.dumps(params, sort_keys=True), seconds)
+
+    report = {
+        'seed': seed,
+        'repeat': repeat,
+        'quick': quick,
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'results': results,
+    }
+    if out is None:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print ''
+    else:
+        with open(out, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+def compare(old_path, new_path, threshold=0.1, min_seconds=0.001):
+    '''
+    Compare two result files case by case and print the ratio of the new
+    time to the old one. Cases more than threshold slower, and slower by
+    at least min_seconds, are flagged as regressions. Returns the number
+    of regressions.
+    '''
+    with open(old_path) as f:
+        old = dict((case_key(r), r) for r in json.load(f)['results'])
+    with open(new_path) as f:
+        new = [r for r in json.load(f)['results']]
+
+    regressions = 0
+    print 'benchmark, params, old, new, ratio'
+    for r in new:
+        key = case_key(r)
+        if key not in old:
+            continue
+        before = old[key]['seconds']
+        after = r['seconds']
+        ratio = after / before if before > 0 else float('inf')
+        flag = ''
+        if ratio > 1 + threshold and after - before >= min_seconds:
+            flag = '  REGRESSION'
+            regressions += 1
+        print '%s, %s, %.4f, %.4f, %.2fx%s' % (r['benchmark'], json.dumps(r['params'], sort_keys=True),
+                                             before, after, ratio, flag)
+    print regressions, 'regression(s)'
+    return regressions
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Benchmarks for the routing and simulation code.')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('heap', help='compare the heap implementations')
+    regions = commands.add_parser('regions', help='time the region-partitioned simulation by number of regions')
+    regions.add_argument('--nodes', type=int, default=400)
+    regions.add_argument('--cars', type=int, default=200)
+    regions.add_argument('--seed', type=int, default=0)
+    commands.add_parser('demand', help='time drawing trips from a demand model')
+    commands.add_parser('trajectory', help='measure the overhead of recording trajectories')
+    commands.add_parser('paths', help='check A* paths against the routing tables, including near-ties')
+    assign = commands.add_parser('assignment', help='compare traffic assignment with the centralized algorithm')
+    assign.add_argument('--cars', type=int, default=200)
+    assign.add_argument('--seed', type=int, default=0)
+
+    run = commands.add_parser('run', help='run the scaling suite and write JSON results')
+    run.add_argument('benchmarks', nargs='*',
+                     help='benchmarks to run, from %s (default: all)' % ', '.join(sorted(SUITE)))
+    run.add_argument('--out', help='file to write the results to (default: standard output)')
+    run.add_argument('--quick', action='store_true', help='run a smaller sweep')
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--repeat', type=int, default=3, help='runs per case; the best time is kept')
+
+    cmp = commands.add_parser('compare', help='flag regressions between two result files')
+    cmp.add_argument('old')
+    cmp.add_argument('new')
+    cmp.add_argument('--threshold', type=float, default=0.1,
+                     help='slowdown ratio counted as a regression (default: %(default)s)')
+    args = parser.parse_args()
+
+    if args.command == 'heap':
+        bench_heap()
+    elif args.command == 'regions':
+        bench_region_scaling(args.nodes, args.cars, seed=args.seed)
+    elif args.command == 'demand':
+        bench_demand()
+    elif args.command == 'trajectory':
+        bench_trajectory()
+    elif args.command == 'paths':
+        if check_paths():
+            sys.exit(1)
+    elif args.command == 'assignment':
+        bench_assignment(cars=args.cars, seed=args.seed)
+    elif args.command == 'run':
+        for name in args.benchmarks:
+            if name not in SUITE:
+                parser.error('unknown benchmark %r' % name)
+        names = [name for name in sorted(SUITE) if not args.benchmarks or name in args.benchmarks]
+        run_suite(names, args.quick, args.seed, args.repeat, args.out)
+    elif args.command == 'compare':
+        if compare(args.old, args.new, args.threshold):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main_cli()
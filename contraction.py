@@ -0,0 +1,282 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+#
+# Author: Brian Wong and Kevin Mu
+# Class: Computer Science 143
+# Date: December 2, 2014
+# Description: Contraction hierarchies for fast shortest path queries on
+#              a graph whose costs do not change, such as the
+#              zero-traffic graph used by the naive baseline.
+#
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+import hashlib
+import heap_module as hm
+import instrument
+
+# A witness search gives up after settling this many nodes and adds the
+# shortcut anyway; this only costs extra shortcuts, never correctness
+WITNESS_LIMIT = 32
+
+# Hierarchies built by for_graph, keyed by the graph's fingerprint
+_hierarchies = {}
+MAX_CACHED = 8
+
+def fingerprint(graph):
+    '''
+    Return a key identifying the structure and costs of a CSRGraph.
+    '''
+    h = hashlib.sha1()
+    for array in (graph.offsets, graph.targets, graph.cost):
+        h.update(array.tostring())
+    return h.hexdigest()
+
+class ContractionHierarchy:
+    """
+    class holding a contraction hierarchy over a CSRGraph with fixed costs.
+
+    Nodes are contracted one at a time, cheapest first by edge difference
+    (shortcuts added minus edges removed, plus the number of neighbors
+    already contracted). Contracting v adds a shortcut u->w for each pair
+    of its neighbors whose only shortest path runs through v, and
+    middle[(u, w)] remembers v so that shortcuts can be unpacked into roads.
+
+    A query searches upward from the start and, over the reversed edges,
+    upward from the destination; every shortest path has a version that
+    only climbs and then descends in rank, so the two searches meet on it.
+    Both searches only see the few nodes above their root, which makes a
+    query much cheaper than a Dijkstra's search over the whole graph.
+
+    Indexing works like a routing table: hierarchy[start][dest] is the
+    next hop from start toward dest, or None. Next hops are memoized.
+    """
+    def __init__(self, graph):
+        self.num_nodes = graph.num_nodes
+        offsets, targets, cost = graph.lists()
+
+        # The graph that remains as nodes are contracted
+        out = [dict() for i in xrange(self.num_nodes)]
+        into = [dict() for i in xrange(self.num_nodes)]
+        self.middle = {}
+        for u in xrange(self.num_nodes):
+            for e in xrange(offsets[u], offsets[u+1]):
+                w = targets[e]
+                if w != u and cost[e] < out[u].get(w, float('inf')):
+                    out[u][w] = cost[e]
+                    into[w][u] = cost[e]
+                    self.middle[(u, w)] = None
+
+        self.rank = [None] * self.num_nodes
+        self.up = [None] * self.num_nodes
+        self.down = [None] * self.num_nodes
+        contracted_neighbors = [0] * self.num_nodes
+        self.shortcuts = 0
+
+        value = [self.priority(v, out, into, contracted_neighbors) for v in xrange(self.num_nodes)]
+        heap = hm.IndexedHeap(xrange(self.num_nodes), value)
+        order = 0
+        while len(heap) > 0:
+            v, p = heap.extractMin()
+            # Lazy update: contracting other nodes may have made v more
+            # expensive, so recompute and put it back if it is no longer
+            # the cheapest
+            shortcuts = self.needed_shortcuts(v, out, into)
+            p = self.priority(v, out, into, contracted_neighbors, shortcuts)
+            if len(heap) > 0 and p > heap.peekMin()[1]:
+                heap.insert(v, p)
+                continue
+
+            for u, w, c in shortcuts:
+                out[u][w] = c
+                into[w][u] = c
+                self.middle[(u, w)] = v
+                self.shortcuts += 1
+
+            self.rank[v] = order
+            order += 1
+            # The remaining neighbors all rank above v
+            self.up[v] = out[v].items()
+            self.down[v] = into[v].items()
+            for w in out[v]:
+                del into[w][v]
+                contracted_neighbors[w] += 1
+            for u in into[v]:
+                del out[u][v]
+                contracted_neighbors[u] += 1
+            out[v] = into[v] = None
+
+        self.hops = {}
+
+    @staticmethod
+    def for_graph(graph):
+        '''
+        Return the hierarchy of graph, reusing one built earlier for a
+        graph with the same structure and costs, e.g. by another trial.
+        '''
+        key = fingerprint(graph)
+        if key not in _hierarchies:
+            if len(_hierarchies) >= MAX_CACHED:
+                _hierarchies.clear()
+            _hierarchies[key] = ContractionHierarchy(graph)
+        return _hierarchies[key]
+
+    def priority(self, v, out, into, contracted_neighbors, shortcuts=None):
+        if shortcuts is None:
+            shortcuts = self.needed_shortcuts(v, out, into)
+        return len(shortcuts) - len(out[v]) - len(into[v]) + contracted_neighbors[v]
+
+    def needed_shortcuts(self, v, out, into):
+        '''
+        Return the shortcuts (u, w, cost) needed to contract v: those for
+        which a local search from u that avoids v finds no path to w at
+        most as short as u->v->w.
+        '''
+        shortcuts = []
+        for u, cu in into[v].items():
+            targets = dict((w, cu + cw) for w, cw in out[v].items() if w != u)
+            if not targets:
+                continue
+            witness = self.witness_search(u, v, out, max(targets.values()))
+            for w, c in targets.items():
+                if witness.get(w, float('inf')) > c:
+                    shortcuts.append((u, w, c))
+        return shortcuts
+
+    def witness_search(self, u, v, out, limit):
+        '''
+        Dijkstra's search from u in the remaining graph without v, up to
+        distance limit or WITNESS_LIMIT settled nodes.
+        '''
+        dist = {u: 0}
+        heap = hm.IndexedHeap()
+        heap.insert(u, 0)
+        settled = 0
+        while len(heap) > 0 and settled < WITNESS_LIMIT:
+            node, d = heap.extractMin()
+            if d > limit:
+                break
+            settled += 1
+            for w, c in out[node].iteritems():
+                if w == v:
+                    continue
+                newDist = d + c
+                if w not in dist:
+                    dist[w] = newDist
+                    heap.insert(w, newDist)
+                elif newDist < dist[w] and w in heap:
+                    dist[w] = newDist
+                    heap.decreaseKey(w, newDist)
+        return dist
+
+    def search(self, start, dest):
+        '''
+        Run the two upward searches. Returns (distance, meeting, fwd, bwd),
+        where fwd and bwd map the nodes reached to their predecessor on
+        the way up from start and from dest.
+        '''
+        sides = (self.up, self.down)
+        dist = ({start: 0}, {dest: 0})
+        pred = ({start: None}, {dest: None})
+        heaps = (hm.IndexedHeap(), hm.IndexedHeap())
+        heaps[0].insert(start, 0)
+        heaps[1].insert(dest, 0)
+        best = float('inf')
+        meeting = None
+        if instrument.active is not None:
+            instrument.active.count('ch_queries')
+
+        while len(heaps[0]) > 0 or len(heaps[1]) > 0:
+            # Advance the side with the smaller key, until neither can improve best
+            keys = [heaps[i].peekMin()[1] if len(heaps[i]) > 0 else float('inf') for i in (0, 1)]
+            side = 0 if keys[0] <= keys[1] else 1
+            if keys[side] >= best:
+                break
+            node, d = heaps[side].extractMin()
+            other = dist[1 - side]
+            if node in other and (d + other[node], node) < (best, meeting):
+                best = d + other[node]
+                meeting = node
+            for w, c in sides[side][node]:
+                newDist = d + c
+                if w not in dist[side]:
+                    dist[side][w] = newDist
+                    pred[side][w] = node
+                    heaps[side].insert(w, newDist)
+                elif newDist < dist[side][w] and w in heaps[side]:
+                    dist[side][w] = newDist
+                    pred[side][w] = node
+                    heaps[side].decreaseKey(w, newDist)
+
+        return best, meeting, pred[0], pred[1]
+
+    def unpack(self, u, w):
+        '''
+        Return the roads of the hierarchy edge u->w as a list of nodes
+        from u to w.
+        '''
+        v = self.middle[(u, w)]
+        if v is None:
+            return [u, w]
+        return self.unpack(u, v)[:-1] + self.unpack(v, w)
+
+    def distance(self, start, dest):
+        return self.search(start, dest)[0]
+
+    def path(self, start, dest):
+        '''
+        Return the shortest path from start to dest as a list of nodes, or
+        None if dest cannot be reached.
+        '''
+        if start == dest:
+            return [start]
+        _, meeting, fwd, bwd = self.search(start, dest)
+        if meeting is None:
+            return None
+        upward = [meeting]
+        while fwd[upward[-1]] is not None:
+            upward.append(fwd[upward[-1]])
+        upward.reverse()
+        while bwd[upward[-1]] is not None:
+            upward.append(bwd[upward[-1]])
+
+        path = [start]
+        for u, w in zip(upward, upward[1:]):
+            path += self.unpack(u, w)[1:]
+        return path
+
+    def next_hop(self, start, dest):
+        '''
+        Return the node after start on the shortest path to dest, or None
+        if there is none. Only the first shortcut is unpacked.
+        '''
+        key = (start, dest)
+        if key in self.hops:
+            return self.hops[key]
+        hop = None
+        if start != dest:
+            _, meeting, fwd, bwd = self.search(start, dest)
+            if meeting == start:
+                hop = bwd[start]
+            elif meeting is not None:
+                hop = meeting
+                while fwd[hop] != start:
+                    hop = fwd[hop]
+            if hop is not None:
+                while self.middle[(start, hop)] is not None:
+                    hop = self.middle[(start, hop)]
+        self.hops[key] = hop
+        return hop
+
+    def __getitem__(self, start):
+        return HierarchyRow(self, start)
+
+class HierarchyRow:
+    """
+    The next hops from one start, so that hierarchy[start][dest] can be
+    used in place of a routing table lookup.
+    """
+    def __init__(self, hierarchy, start):
+        self.hierarchy = hierarchy
+        self.start = start
+
+    def __getitem__(self, dest):
+        return self.hierarchy.next_hop(self.start, dest)
@@ -0,0 +1,94 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+#
+# Author: Brian Wong and Kevin Mu
+# Class: Computer Science 143
+# Date: December 2, 2014
+# Description: Road cost models, which give the cost of every road as
+#              a function of the number of cars on it. The parameters
+#              are stored per edge in arrays, so the cost of the whole
+#              network is computed in one NumPy call.
+#
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+import numpy as np
+
+class CostModel:
+    """
+    Base class for cost models over the edges of a CSRGraph.
+
+    costs(traffic) returns the cost of every edge given an array of
+    per-edge car counts. cost(e, n) returns the cost of the single edge e
+    with n cars on it, using plain Python floats so that updating one
+    edge at a time stays cheap. Unlike the per-edge lambdas these
+    replace, cost models can be pickled.
+    """
+    def costs(self, traffic):
+        raise NotImplementedError
+
+    def cost(self, e, n):
+        raise NotImplementedError
+
+    def zero_costs(self):
+        '''
+        Return the cost of every edge with no traffic.
+        '''
+        return self.costs(np.zeros(self.num_edges, dtype=np.int64))
+
+class LinearCostModel(CostModel):
+    """
+    cost = base + slope * n, e.g. the road's length plus a fixed delay
+    for each car on it.
+    """
+    def __init__(self, base, slope):
+        self.base = np.array(base, dtype=np.float64)
+        self.num_edges = len(self.base)
+        self.slope = np.array(np.broadcast_to(slope, self.base.shape), dtype=np.float64)
+        self.base_list = self.base.tolist()
+        self.slope_list = self.slope.tolist()
+
+    def costs(self, traffic):
+        return self.slope * np.asarray(traffic) + self.base
+
+    def cost(self, e, n):
+        return self.slope_list[e] * n + self.base_list[e]
+
+class BPRCostModel(CostModel):
+    """
+    The Bureau of Public Roads volume-delay curve,
+    cost = t0 * (1 + alpha * (n / capacity) ** beta),
+    where t0 is the free-flow travel time of the road.
+    """
+    def __init__(self, t0, capacity, alpha=0.15, beta=4.0):
+        self.t0 = np.array(t0, dtype=np.float64)
+        self.num_edges = len(self.t0)
+        shape = self.t0.shape
+        self.capacity = np.array(np.broadcast_to(capacity, shape), dtype=np.float64)
+        self.alpha = np.array(np.broadcast_to(alpha, shape), dtype=np.float64)
+        self.beta = np.array(np.broadcast_to(beta, shape), dtype=np.float64)
+        self.params = zip(self.t0.tolist(), self.capacity.tolist(),
+                          self.alpha.tolist(), self.beta.tolist())
+
+    def costs(self, traffic):
+        ratio = np.asarray(traffic, dtype=np.float64) / self.capacity
+        return self.t0 * (1 + self.alpha * ratio ** self.beta)
+
+    def cost(self, e, n):
+        t0, capacity, alpha, beta = self.params[e]
+        return t0 * (1 + alpha * (float(n) / capacity) ** beta)
+
+class FunctionCostModel(CostModel):
+    """
+    Wraps a list of per-edge cost functions, such as a dict-form
+    road_cost_map flattened with CSRGraph.edge_values. This evaluates
+    the functions one edge at a time and is only used to support the
+    dict form.
+    """
+    def __init__(self, functions):
+        self.functions = functions
+        self.num_edges = len(functions)
+
+    def costs(self, traffic):
+        return np.array([f(n) for f, n in zip(self.functions, traffic)], dtype=np.float64)
+
+    def cost(self, e, n):
+        return self.functions[e](n)
@@ -0,0 +1,138 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+#
+# Author: Brian Wong and Kevin Mu
+# Class: Computer Science 143
+# Date: December 2, 2014
+# Description: A compact graph representation that numbers the nodes
+#              with dense integer IDs and stores the roads in
+#              compressed sparse row (CSR) arrays.
+#
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+import copy
+import numpy as np
+
+class CSRGraph:
+    """
+    class representing a directed road graph in CSR form.
+
+    Node i has coordinates coords[i], and its outgoing roads are the
+    edge IDs offsets[i] through offsets[i+1]-1. Edge e goes from
+    sources[e] to targets[e] and currently costs cost[e]. The roads
+    coming into node i are in_edges[in_offsets[i]:in_offsets[i+1]].
+
+    Nodes are numbered in sorted coordinate order, so a node's ID
+    orders it the same way as its (x, y) tuple does in the dict form.
+    The arrays are kept in NumPy; lists() returns cached Python list
+    copies for the pure-Python loops in Dijkstra's algorithm.
+    """
+    def __init__(self, coords, offsets, targets, cost):
+        self.coords = coords
+        self.node_id = dict((coord, i) for i, coord in enumerate(coords))
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.targets = np.asarray(targets, dtype=np.int64)
+        self.cost = np.array(cost, dtype=np.float64)
+        self.sources = np.repeat(np.arange(len(coords), dtype=np.int64),
+                                 np.diff(self.offsets))
+        self.num_nodes = len(coords)
+        self.num_edges = len(self.targets)
+        self.structure = (self.offsets.tolist(), self.targets.tolist())
+
+        self.in_edges = np.argsort(self.targets, kind='mergesort')
+        self.in_offsets = np.searchsorted(self.targets[self.in_edges],
+                                          np.arange(self.num_nodes + 1))
+        self.in_structure = (self.in_offsets.tolist(), self.in_edges.tolist(),
+                             self.sources.tolist())
+        self.cost_list = None
+
+    @staticmethod
+    def from_dict(version):
+        '''
+        Build a CSRGraph from the dict form used by the rest of the code,
+        version[node][terminus] = cost.
+        '''
+        coords = sorted(version.keys())
+        node_id = dict((coord, i) for i, coord in enumerate(coords))
+        offsets = [0]
+        targets = []
+        cost = []
+        for node in coords:
+            for terminus in sorted(version[node], key=node_id.get):
+                targets.append(node_id[terminus])
+                cost.append(version[node][terminus])
+            offsets.append(len(targets))
+        return CSRGraph(coords, offsets, targets, cost)
+
+    @staticmethod
+    def from_nodes(nodes):
+        '''
+        Build a CSRGraph from a list of graph.Node objects, with the
+        Euclidean road lengths as costs.
+        '''
+        import graph as gm
+        return CSRGraph.from_dict(gm.get_graph_representation(nodes))
+
+    def to_dict(self, cost=None):
+        '''
+        Convert back to the dict form, graph[node][terminus] = cost[e].
+        '''
+        if cost is None:
+            cost = self.cost
+        offsets, targets = self.structure
+        cost = np.asarray(cost, dtype=np.float64).tolist()
+        version = {}
+        for u, node in enumerate(self.coords):
+            version[node] = {}
+            for e in xrange(offsets[u], offsets[u+1]):
+                version[node][self.coords[targets[e]]] = cost[e]
+        return version
+
+    def edge_values(self, nested):
+        '''
+        Flatten a dict-of-dicts keyed like the dict form, such as a
+        road_cost_map, into a list indexed by edge ID.
+        '''
+        offsets, targets = self.structure
+        values = []
+        for u, node in enumerate(self.coords):
+            for e in xrange(offsets[u], offsets[u+1]):
+                values.append(nested[node][self.coords[targets[e]]])
+        return values
+
+    def with_cost(self, cost):
+        '''
+        Return a graph sharing this graph's structure but with a
+        different per-edge cost array.
+        '''
+        g = copy.copy(self)
+        g.cost = np.array(cost, dtype=np.float64)
+        g.cost_list = None
+        return g
+
+    def lists(self):
+        '''
+        Return (offsets, targets, cost) as Python lists. Indexing these
+        is much faster than indexing NumPy arrays one element at a time.
+        '''
+        if self.cost_list is None:
+            self.cost_list = self.cost.tolist()
+        return self.structure[0], self.structure[1], self.cost_list
+
+    def set_cost(self, e, value):
+        self.cost[e] = value
+        if self.cost_list is not None:
+            self.cost_list[e] = value
+
+    def edge(self, u, v):
+        '''
+        Return the ID of the edge from u to v, or None if there is none.
+        '''
+        offsets, targets = self.structure
+        for e in xrange(offsets[u], offsets[u+1]):
+            if targets[e] == v:
+                return e
+        return None
+
+    def neighbors(self, u):
+        offsets, targets = self.structure
+        return targets[offsets[u]:offsets[u+1]]
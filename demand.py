@@ -0,0 +1,131 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+#
+# Author: Brian Wong and Kevin Mu
+# Class: Computer Science 143
+# Date: December 2, 2014
+# Description: Travel demand for the simulation: the trips that start in
+#              each timestep, drawn for the whole map at once from an
+#              origin-destination matrix or per-node rates.
+#
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+import numpy as np
+
+try:
+    import scipy.sparse
+    import scipy.sparse.csgraph
+except ImportError:
+    scipy = None
+
+def reachable(graph):
+    '''
+    Return a boolean matrix whose entry [i, j] says whether there is a
+    route from node i to node j of a CSRGraph, with False on the diagonal.
+
+    With SciPy this is a breadth-first search from every node in one call;
+    otherwise the searches run in Python.
+    '''
+    n = graph.num_nodes
+    if scipy is not None:
+        matrix = scipy.sparse.csr_matrix((np.ones(graph.num_edges), graph.targets, graph.offsets),
+                                         shape=(n, n))
+        mask = np.isfinite(scipy.sparse.csgraph.shortest_path(matrix, directed=True, unweighted=True))
+    else:
+        offsets, targets, _ = graph.lists()
+        mask = np.zeros((n, n), dtype=bool)
+        for start in xrange(n):
+            seen = [False] * n
+            seen[start] = True
+            frontier = [start]
+            while frontier:
+                u = frontier.pop()
+                for i in xrange(offsets[u], offsets[u+1]):
+                    v = targets[i]
+                    if not seen[v]:
+                        seen[v] = True
+                        frontier.append(v)
+            mask[start] = seen
+    np.fill_diagonal(mask, False)
+    return mask
+
+class Demand:
+    """
+    class drawing the trips that start in each timestep. od[i, j] is the
+    expected number of trips from node i to node j per timestep, and
+    reachable is a mask such as reachable(graph) returns. Pairs without a
+    route, and trips from a node to itself, are dropped when the Demand is
+    built, so every trip drawn can be routed.
+
+    A draw is a few NumPy calls however many trips it makes: the number of
+    trips leaving each node is Poisson (or a multinomial split of a fixed
+    total), and the destinations of all of them are found with a single
+    searchsorted over the rows' cumulative distributions, each shifted by
+    its row number so that row i lies in (i, i + 1].
+    """
+    def __init__(self, od, reachable):
+        od = np.where(reachable, np.asarray(od, dtype=np.float64), 0.0)
+        if (od < 0).any():
+            raise ValueError('origin-destination rates cannot be negative')
+        n = len(od)
+        self.num_nodes = n
+        self.rates = od.sum(axis=1)
+        self.total = self.rates.sum()
+
+        cumulative = np.cumsum(od, axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cumulative = np.where(self.rates[:, None] > 0, cumulative / self.rates[:, None], 1.0)
+        self.cumulative = (cumulative + np.arange(n)[:, None]).ravel()
+        # The flat index of the last destination of each row, in case a
+        # draw rounds up past the end of its row
+        last = n - 1 - np.argmax(od[:, ::-1] > 0, axis=1)
+        self.last = np.arange(n) * n + last
+
+    @staticmethod
+    def from_rates(rates, reachable, attraction=None):
+        '''
+        Build a Demand in which rates[i] trips per timestep leave node i,
+        each to a node reachable from i chosen in proportion to attraction
+        (uniformly if None). No trips leave nodes that reach nowhere.
+        '''
+        rates = np.asarray(rates, dtype=np.float64)
+        if attraction is None:
+            attraction = np.ones(len(rates))
+        od = reachable * np.asarray(attraction, dtype=np.float64)[None, :]
+        totals = od.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            od = np.where(totals[:, None] > 0, od / totals[:, None], 0.0)
+        return Demand(od * rates[:, None], reachable)
+
+    @staticmethod
+    def from_spawn_probability(spawn_probability, reachable, trips):
+        '''
+        Build a Demand from the spawn_probability of convert_graph: trips
+        trips per timestep on average, leaving each node in proportion to
+        its spawn probability and going to a node also chosen in
+        proportion to its spawn probability.
+        '''
+        weights = np.asarray(spawn_probability, dtype=np.float64)
+        # Only nodes that reach somewhere count toward the total
+        weights = np.where(reachable.any(axis=1), weights, 0.0)
+        if weights.sum() <= 0:
+            raise ValueError('no node with a spawn probability reaches another node')
+        return Demand.from_rates(trips * weights / weights.sum(), reachable, spawn_probability)
+
+    def draw(self, rng=np.random, total=None):
+        '''
+        Draw the trips starting in one timestep with the NumPy RandomState
+        rng, and return (origins, dests), two arrays sorted by origin. If
+        total is given, exactly that many trips are split between the
+        origins instead of each origin's count being Poisson.
+        '''
+        n = self.num_nodes
+        if total is None:
+            counts = rng.poisson(self.rates)
+        elif self.total > 0:
+            counts = rng.multinomial(total, self.rates / self.total)
+        else:
+            counts = np.zeros(n, dtype=np.int64)
+        origins = np.repeat(np.arange(n), counts)
+        index = np.searchsorted(self.cumulative, origins + rng.random_sample(len(origins)), side='right')
+        index = np.minimum(index, self.last[origins])
+        return origins, index - origins * n
@@ -0,0 +1,260 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+#
+# Author: Brian Wong and Kevin Mu
+# Class: Computer Science 143
+# Date: December 2, 2014
+# Description: Dynamic single-source shortest paths. Keeps shortest path
+#              trees and next-hop tables for a set of start nodes and
+#              repairs them when the cost of one road changes, instead
+#              of rerunning Dijkstra's algorithm from every start.
+#
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+import heap_module as hm
+import instrument
+
+class DynamicRoutingTable:
+    """
+    class holding a shortest path tree for each start node of a CSRGraph,
+    in the style of Ramalingam and Reps.
+
+    table[start][dest] is the next hop from start toward dest, the same as
+    the row built by main.gen_routing_table. When the cost of edge e has
+    changed in the graph's cost array, edge_changed(e, old_cost) repairs
+    only the nodes whose distance or next hop can have changed:
+
+      - If the cost went up and e is not in a start's tree, nothing
+        changes. Otherwise only the subtree below e is settled again, with
+        a Dijkstra's search seeded from the nodes outside it.
+      - If the cost went down, the decrease is propagated from the end of
+        e, as in Dijkstra's algorithm, to the nodes it makes closer.
+
+    The trees follow the same tie-breaking rule as main.dijkstra, whose
+    heap extracts equal distances in node order: pred[v] is the in-neighbor
+    u with the smallest (dist[u], u) among those with dist[u] + cost = dist[v].
+    This rule depends only on the costs, so the repaired table is always
+    identical to one rebuilt from scratch.
+    """
+    def __init__(self, graph, starts=()):
+        self.graph = graph
+        self.dist = {}
+        self.pred = {}
+        self.table = {}
+        for start in starts:
+            self.add_start(start)
+
+    def add_start(self, start):
+        '''
+        Run Dijkstra's algorithm from start and store its tree.
+        '''
+        if start in self.table:
+            return
+        offsets, targets, cost = self.graph.lists()
+        inf = float('inf')
+        num_nodes = self.graph.num_nodes
+
+        value = [inf] * num_nodes
+        value[start] = 0
+        dist = [inf] * num_nodes
+        pred = [None] * num_nodes
+        order = []
+
+        heap = hm.IndexedHeap(xrange(num_nodes), value)
+        relaxations = decreases = 0
+        while len(heap) > 0:
+            smallest, d = heap.extractMin()
+            if d == inf:
+                break
+            dist[smallest] = d
+            order.append(smallest)
+            relaxations += offsets[smallest+1] - offsets[smallest]
+            for e in xrange(offsets[smallest], offsets[smallest+1]):
+                terminus = targets[e]
+                if terminus in heap:
+                    newDist = d + cost[e]
+                    if newDist < value[terminus]:
+                        value[terminus] = newDist
+                        heap.decreaseKey(terminus, newDist)
+                        pred[terminus] = smallest
+                        decreases += 1
+
+        if instrument.active is not None:
+            instrument.active.search(len(order), relaxations, decreases)
+
+        self.dist[start] = dist
+        self.pred[start] = pred
+        self.table[start] = [None] * num_nodes
+        self.update_hops(start, order)
+
+    def remove_start(self, start):
+        del self.dist[start]
+        del self.pred[start]
+        del self.table[start]
+
+    def update_hops(self, start, order):
+        '''
+        Recompute the next hop of each node in order, which must list
+        every node after its predecessor.
+        '''
+        pred = self.pred[start]
+        hop = self.table[start]
+        for v in order:
+            p = pred[v]
+            if p is None:
+                hop[v] = None
+            elif p == start:
+                hop[v] = v
+            else:
+                hop[v] = hop[p]
+
+    def best_pred(self, start, v):
+        '''
+        Apply the tie-breaking rule to find pred[v] from the distances.
+        '''
+        dist = self.dist[start]
+        if v == start or dist[v] == float('inf'):
+            return None
+        in_offsets, in_edges, sources = self.graph.in_structure
+        _, _, cost = self.graph.lists()
+        best = None
+        bestKey = None
+        for i in xrange(in_offsets[v], in_offsets[v+1]):
+            e = in_edges[i]
+            u = sources[e]
+            if u != v and dist[u] + cost[e] == dist[v]:
+                key = (dist[u], u)
+                if best is None or key < bestKey:
+                    best = u
+                    bestKey = key
+        return best
+
+    def subtree(self, start, roots):
+        '''
+        Return the nodes in the subtrees below roots, in (dist, node) order.
+        '''
+        offsets, targets, _ = self.graph.lists()
+        pred = self.pred[start]
+        found = set(roots)
+        stack = list(roots)
+        while stack:
+            u = stack.pop()
+            for e in xrange(offsets[u], offsets[u+1]):
+                t = targets[e]
+                if pred[t] == u and t not in found:
+                    found.add(t)
+                    stack.append(t)
+        dist = self.dist[start]
+        return sorted(found, key=lambda v: (dist[v], v))
+
+    def edge_changed(self, e, old_cost):
+        '''
+        Repair every start's tree after the cost of edge e changed from
+        old_cost to its current value in the graph.
+        '''
+        _, _, cost = self.graph.lists()
+        if cost[e] > old_cost:
+            for start in self.table:
+                self.increase(start, e)
+        elif cost[e] < old_cost:
+            for start in self.table:
+                self.decrease(start, e)
+
+    def increase(self, start, e):
+        a = self.graph.in_structure[2][e]
+        b = self.graph.structure[1][e]
+        if self.pred[start][b] != a:
+            return
+
+        offsets, targets, cost = self.graph.lists()
+        in_offsets, in_edges, sources = self.graph.in_structure
+        dist = self.dist[start]
+        inf = float('inf')
+
+        affected = self.subtree(start, [b])
+        inAffected = set(affected)
+
+        # Seed each affected node with its best route from outside the subtree
+        value = {}
+        for v in affected:
+            best = inf
+            for i in xrange(in_offsets[v], in_offsets[v+1]):
+                f = in_edges[i]
+                if sources[f] not in inAffected:
+                    d = dist[sources[f]] + cost[f]
+                    if d < best:
+                        best = d
+            value[v] = best
+
+        order = []
+        heap = hm.IndexedHeap(affected, value)
+        while len(heap) > 0:
+            v, d = heap.extractMin()
+            dist[v] = d
+            order.append(v)
+            for f in xrange(offsets[v], offsets[v+1]):
+                t = targets[f]
+                if t in heap:
+                    newDist = d + cost[f]
+                    if newDist < heap.value(t):
+                        heap.decreaseKey(t, newDist)
+
+        pred = self.pred[start]
+        for v in order:
+            pred[v] = self.best_pred(start, v)
+        self.update_hops(start, order)
+        if instrument.active is not None:
+            instrument.active.count('sssp_repairs')
+            instrument.active.count('sssp_repaired_nodes', len(order))
+
+    def decrease(self, start, e):
+        sources = self.graph.in_structure[2]
+        a = sources[e]
+        b = self.graph.structure[1][e]
+        offsets, targets, cost = self.graph.lists()
+        dist = self.dist[start]
+        pred = self.pred[start]
+
+        newDist = dist[a] + cost[e]
+        if b == start or newDist > dist[b]:
+            return
+
+        # Propagate the shorter distances outward from b
+        changed = []
+        if newDist < dist[b]:
+            dist[b] = newDist
+            heap = hm.IndexedHeap()
+            heap.insert(b, newDist)
+            while len(heap) > 0:
+                v, d = heap.extractMin()
+                changed.append(v)
+                for f in xrange(offsets[v], offsets[v+1]):
+                    t = targets[f]
+                    d2 = d + cost[f]
+                    if d2 < dist[t]:
+                        dist[t] = d2
+                        if t in heap:
+                            heap.decreaseKey(t, d2)
+                        else:
+                            heap.insert(t, d2)
+
+        # Nodes whose predecessor can have changed: the nodes that got
+        # closer, b itself (which may now tie through a), and the
+        # successors of the nodes that got closer
+        candidates = set(changed)
+        candidates.add(b)
+        for v in changed:
+            for f in xrange(offsets[v], offsets[v+1]):
+                candidates.add(targets[f])
+
+        roots = set(changed)
+        for v in candidates:
+            p = self.best_pred(start, v)
+            if p != pred[v]:
+                pred[v] = p
+                roots.add(v)
+
+        if roots:
+            self.update_hops(start, self.subtree(start, roots))
+        if instrument.active is not None:
+            instrument.active.count('sssp_repairs')
+            instrument.active.count('sssp_repaired_nodes', len(changed))
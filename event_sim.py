@@ -0,0 +1,138 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+#
+# Author: Brian Wong and Kevin Mu
+# Class: Computer Science 143
+# Date: December 2, 2014
+# Description: An event-driven version of the simulation loop, which
+#              only does work for cars when they reach a junction
+#              instead of advancing every car every timestep.
+#
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+import math
+import numpy as np
+import heap_module as hm
+import instrument
+import trajectory
+
+def travel_steps(road_cost):
+    '''
+    Return the number of timesteps a car takes to cover a road of the given
+    cost. In the timestep loop its progress goes up by one per timestep,
+    starting the timestep after it is routed, and it reaches the junction
+    in the first timestep where progress >= road_cost.
+    '''
+    return max(1, int(math.ceil(road_cost)))
+
+class ArrivalQueue:
+    """
+    class holding the junction-arrival events of the cars on the road, as
+    a heap of Fleet rows keyed by arrival time.
+
+    Rows are never reused, and a Fleet keeps its rows in the order the cars
+    were added, so cars arriving at the same time come out in the order
+    one_timestep processes them.
+    """
+    def __init__(self):
+        self.heap = hm.IndexedHeap()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule(self, row, time):
+        self.heap.insert(row, time)
+
+    def next_time(self):
+        return self.heap.peekMin()[1]
+
+    def pop_due(self, time):
+        '''
+        Remove and return the rows arriving at the given time, in row order.
+        '''
+        rows = []
+        while len(self.heap) > 0 and self.heap.peekMin()[1] <= time:
+            rows.append(self.heap.extractMin()[0])
+        return rows
+
+def run(fleet, traffic_state, num_total_cars, spawn, route, metrics):
+    '''
+    Simulate until num_total_cars cars have arrived, adding each one to
+    metrics (a metrics.TripMetrics) as it arrives.
+
+    Each timestep, spawn() adds the new cars to fleet and returns their
+    rows. The cars whose junction-arrival event is due leave their roads,
+    those at their destination are done, and route(rows) routes the others
+    along with the new cars, setting their road_cost, which schedules their
+    next event. Cars partway along a road are not touched at all.
+
+    This gives the same travel times as the timestep loop in main.test. The
+    fleet's rows are never removed, but an arrived car's route is dropped,
+    and its progress and time_elapsed columns are only brought up to date
+    at a car's events.
+    '''
+    recorder = instrument.active
+    queue = ArrivalQueue()
+    spawned_at = {}
+    arrived = 0
+    now = 0
+
+    while arrived < num_total_cars:
+        if recorder is not None:
+            t = recorder.clock()
+        traffic_state.begin_step()
+        new_rows = spawn()
+        for row in new_rows:
+            spawned_at[row] = now
+        if recorder is not None:
+            t = recorder.phase('spawn', t)
+
+        due = queue.pop_due(now)
+        for row in due:
+            traffic_state.leave(int(fleet.edge[row]))
+
+        waiting = []
+        arrived_now = 0
+        if due:
+            rows = np.array(due)
+            fleet.current_node[rows] = fleet.next_node[rows]
+            fleet.next_node[rows] = -1
+            fleet.edge[rows] = -1
+            fleet.road_cost[rows] = np.nan
+            done = (fleet.current_node[rows] == fleet.dest[rows]).tolist()
+            for row, is_done in zip(due, done):
+                if is_done:
+                    # Like one_timestep, don't count the timestep of arrival.
+                    # As in the timestep loop, cars arriving in the same
+                    # timestep are in row order, and extra arrivals in the
+                    # last timestep are dropped
+                    time_elapsed = now - spawned_at.pop(row)
+                    fleet.time_elapsed[row] = time_elapsed
+                    fleet.fixed_route[row] = []
+                    if arrived < num_total_cars:
+                        metrics.add(int(fleet.source[row]), int(fleet.dest[row]), time_elapsed)
+                    arrived += 1
+                    arrived_now += 1
+                else:
+                    waiting.append(row)
+            if trajectory.active is not None:
+                done_rows = rows[np.array(done, dtype=bool)]
+                trajectory.active.record(trajectory.ARRIVE, fleet.id[done_rows], fleet.dest[done_rows])
+        waiting += new_rows
+        if recorder is not None:
+            t = recorder.phase('events', t)
+            recorder.gauge('events', len(due))
+            recorder.gauge('arrived', arrived_now)
+            recorder.gauge('active', len(fleet) - arrived)
+
+        if waiting:
+            rows = np.array(waiting)
+            route(rows)
+            fleet.time_elapsed[rows] = [now - spawned_at[row] + 1 for row in waiting]
+            for row, road_cost in zip(waiting, fleet.road_cost[rows].tolist()):
+                queue.schedule(row, now + travel_steps(road_cost))
+
+        if recorder is not None:
+            recorder.end_step()
+        if trajectory.active is not None:
+            trajectory.active.end_step()
+        now += 1
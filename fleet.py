@@ -0,0 +1,244 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+#
+# Author: Brian Wong and Kevin Mu
+# Class: Computer Science 143
+# Date: December 2, 2014
+# Description: Struct-of-arrays storage for the cars in the simulation,
+#              so that advancing every car by one timestep is done with
+#              a few NumPy operations instead of a Python loop.
+#
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+import numpy as np
+
+# The columns of a Fleet, with their dtype and the value meaning "unset".
+# Nodes and edges are CSRGraph IDs, and -1 (or NaN for road_cost) stands
+# for the None of the corresponding Car attribute.
+COLUMNS = [
+    ('id', np.int64, 0),
+    ('source', np.int64, -1),
+    ('dest', np.int64, -1),
+    ('current_node', np.int64, -1),
+    ('next_node', np.int64, -1),
+    ('edge', np.int64, -1),
+    ('progress', np.int64, 0),
+    ('road_cost', np.float64, np.nan),
+    ('time_elapsed', np.int64, 0),
+]
+
+class Fleet:
+    """
+    class storing the cars as NumPy columns, one row per car.
+
+    The rows are kept in the order the cars were added, which is the order
+    the list-of-Car simulation processes them in. Iterating over a Fleet
+    yields CarView objects, which look like Car objects to code such as
+    print_cars and evaluate.
+    """
+    def __init__(self, capacity=64):
+        self.size = 0
+        for name, dtype, unset in COLUMNS:
+            setattr(self, name, np.full(capacity, unset, dtype=dtype))
+        self.fixed_route = []
+        self.slots = None
+
+    @staticmethod
+    def from_cars(cars, graph):
+        '''
+        Build a Fleet from a list of Car objects whose nodes are IDs in
+        the CSRGraph graph.
+        '''
+        fleet = Fleet(max(len(cars), 1))
+        for car in cars:
+            edge = None
+            if car.next_node is not None:
+                edge = graph.edge(car.current_node, car.next_node)
+            fleet.add(car.id, car.source, car.dest, car.current_node,
+                      car.next_node, car.progress, car.road_cost,
+                      car.time_elapsed, car.fixed_route, edge)
+        return fleet
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for car_id in self.id[:self.size].tolist():
+            yield CarView(self, car_id)
+
+    def add(self, car_id, source, dest, current_node=None, next_node=None,
+            progress=0, road_cost=None, time_elapsed=0, fixed_route=(), edge=None):
+        if self.size == len(self.id):
+            self.grow()
+        i = self.size
+        self.id[i] = car_id
+        self.source[i] = source
+        self.dest[i] = dest
+        self.current_node[i] = source if current_node is None else current_node
+        self.next_node[i] = -1 if next_node is None else next_node
+        self.edge[i] = -1 if edge is None else edge
+        self.progress[i] = progress
+        self.road_cost[i] = np.nan if road_cost is None else road_cost
+        self.time_elapsed[i] = time_elapsed
+        self.fixed_route.append(list(fixed_route))
+        self.size += 1
+        if self.slots is not None:
+            self.slots[car_id] = i
+        return i
+
+    def add_batch(self, car_ids, sources, dests):
+        '''
+        Add one car waiting at its source for each entry of the arrays
+        car_ids, sources and dests, and return their rows.
+        '''
+        count = len(car_ids)
+        while self.size + count > len(self.id):
+            self.grow()
+        rows = np.arange(self.size, self.size + count)
+        self.id[rows] = car_ids
+        self.source[rows] = sources
+        self.dest[rows] = dests
+        self.current_node[rows] = sources
+        for name, dtype, unset in COLUMNS[4:]:
+            getattr(self, name)[rows] = unset
+        self.fixed_route.extend([] for i in xrange(count))
+        self.size += count
+        if self.slots is not None:
+            self.slots.update(zip(np.asarray(car_ids).tolist(), rows.tolist()))
+        return rows
+
+    def grow(self):
+        capacity = 2 * max(len(self.id), 1)
+        for name, dtype, unset in COLUMNS:
+            column = np.full(capacity, unset, dtype=dtype)
+            column[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, column)
+
+    def slot(self, car_id):
+        '''
+        Return the row currently holding the car with the given id.
+        '''
+        if self.slots is None:
+            self.slots = dict((c, i) for i, c in enumerate(self.id[:self.size].tolist()))
+        return self.slots[car_id]
+
+    def traffic(self, num_edges):
+        '''
+        Return the number of cars on each edge.
+        '''
+        edge = self.edge[:self.size]
+        return np.bincount(edge[edge >= 0], minlength=num_edges)
+
+    def advance(self):
+        '''
+        STEP 1 of one_timestep for every car at once: add one unit of time
+        and progress, and move the cars that reach the end of their road to
+        its junction.
+
+        Returns (left, arrived, waiting): the edges that cars left, in row
+        order, a mask of the rows that reached their destination, and a
+        mask of the rows now waiting at a junction for routing.
+        '''
+        n = self.size
+        next_node = self.next_node[:n]
+        progress = self.progress[:n]
+        current_node = self.current_node[:n]
+
+        self.time_elapsed[:n] += 1
+        moving = next_node >= 0
+        progress += moving
+
+        # road_cost is NaN for cars that are not moving, so they never compare >=
+        with np.errstate(invalid='ignore'):
+            reached = moving & (progress >= self.road_cost[:n])
+        left = self.edge[:n][reached]
+
+        current_node[reached] = next_node[reached]
+        arrived = reached & (current_node == self.dest[:n])
+        # To correct one-off error
+        self.time_elapsed[:n][arrived] -= 1
+        waiting = (reached & ~arrived) | ~moving
+
+        next_node[reached] = -1
+        self.edge[:n][reached] = -1
+        self.road_cost[:n][reached] = np.nan
+        return left, arrived, waiting
+
+    def take(self, mask):
+        '''
+        Remove the rows selected by mask and return them as a new Fleet,
+        keeping the order of the remaining rows.
+        '''
+        n = self.size
+        keep = ~mask
+        taken = Fleet(max(int(mask.sum()), 1))
+        taken.size = int(mask.sum())
+        for name, dtype, unset in COLUMNS:
+            column = getattr(self, name)
+            getattr(taken, name)[:taken.size] = column[:n][mask]
+            remaining = column[:n][keep]
+            column[:len(remaining)] = remaining
+            column[len(remaining):n] = unset
+        routes = self.fixed_route
+        taken.fixed_route = [routes[i] for i in np.nonzero(mask)[0]]
+        self.fixed_route = [routes[i] for i in np.nonzero(keep)[0]]
+        self.size = n - taken.size
+        self.slots = None
+        return taken
+
+class CarView(object):
+    """
+    A read-only, Car-like view of one row of a Fleet.
+    """
+    def __init__(self, fleet, car_id):
+        self.fleet = fleet
+        self.id = car_id
+
+    def get(self, name):
+        return getattr(self.fleet, name)[self.fleet.slot(self.id)]
+
+    def node(self, name):
+        node = int(self.get(name))
+        return None if node < 0 else node
+
+    source = property(lambda self: self.node('source'))
+    dest = property(lambda self: self.node('dest'))
+    current_node = property(lambda self: self.node('current_node'))
+    next_node = property(lambda self: self.node('next_node'))
+    progress = property(lambda self: int(self.get('progress')))
+    time_elapsed = property(lambda self: int(self.get('time_elapsed')))
+    fixed_route = property(lambda self: self.fleet.fixed_route[self.fleet.slot(self.id)])
+
+    @property
+    def road_cost(self):
+        road_cost = float(self.get('road_cost'))
+        return None if np.isnan(road_cost) else road_cost
+
+    def copy_to(self, car):
+        '''
+        Copy this row's state onto a Car object.
+        '''
+        car.current_node = self.current_node
+        car.next_node = self.next_node
+        car.progress = self.progress
+        car.road_cost = self.road_cost
+        car.time_elapsed = self.time_elapsed
+        car.fixed_route = self.fixed_route
+
+    def describe(self, name):
+        return describe_car(self, name)
+
+    def __str__(self):
+        return self.describe(str)
+
+def describe_car(car, name):
+    '''
+    Format a Car or CarView, using name(node) to print each node.
+    '''
+    s = 'CAR ' + str(car.id) + '| Start: ' + name(car.source)
+    s += ',  ' + 'Dest: ' + name(car.dest)
+    s += ',  ' + name(car.current_node)
+    s += '->' + name(car.next_node)
+    s += ',  ' + str(car.progress) + '/'
+    s += str(car.road_cost)
+    s += '. Time Elapsed: ' + str(car.time_elapsed)
+    return s
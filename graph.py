@@ -43,23 +43,125 @@ def getClosestNeighbors(nodes, node, k):
         neighbors.append(distances[x][0])
     return neighbors
     
+def getKNearestNeighbors(xs, ys, k, batchSize=4096):
+    """
+    Return an (n, k) array whose row i holds the indices of the k nodes
+    closest to node i, for nodes at coordinates (xs[i], ys[i]). The rows
+    match getClosestNeighbors: neighbors are ordered by distance, and ties
+    are broken by index. Coordinates must be distinct.
+
+    Instead of comparing every pair of nodes, the nodes are bucketed into a
+    uniform grid with about k+1 nodes per cell, and each node only looks at
+    the block of cells within r cells of its own. A node is done once its
+    k-th nearest candidate is strictly closer than any node outside the
+    block could be; the remaining nodes retry with r+1. Nodes are processed
+    in batches with NumPy, so the running time grows close to linearly in n
+    rather than as O(n^2 log n).
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    n = len(xs)
+    if k >= n:
+        raise ValueError('need more than k=%d nodes, got %d' % (k, n))
+
+    minX = xs.min()
+    minY = ys.min()
+    cellSize = math.sqrt((xs.max() - minX + 1) * (ys.max() - minY + 1) * (k + 1) / float(n))
+    cx = np.floor((xs - minX) / cellSize).astype(np.int64)
+    cy = np.floor((ys - minY) / cellSize).astype(np.int64)
+    nx = cx.max() + 1
+    ny = cy.max() + 1
+
+    # The nodes of cell c are order[cellStart[c]:cellStart[c+1]], in index order
+    cell = cx * ny + cy
+    order = np.argsort(cell, kind='mergesort')
+    cellStart = np.searchsorted(cell[order], np.arange(nx * ny + 1))
+
+    neighbors = np.empty((n, k), dtype=np.int64)
+    pending = np.arange(n)
+    r = 1
+    while len(pending) > 0:
+        unresolved = []
+        for b in xrange(0, len(pending), batchSize):
+            batch = pending[b:b+batchSize]
+
+            # Collect the (owner, start, length) ranges of every cell in the block
+            owners = []
+            starts = []
+            lengths = []
+            for dx in xrange(-r, r+1):
+                for dy in xrange(-r, r+1):
+                    ncx = cx[batch] + dx
+                    ncy = cy[batch] + dy
+                    valid = (ncx >= 0) & (ncx < nx) & (ncy >= 0) & (ncy < ny)
+                    c = ncx[valid] * ny + ncy[valid]
+                    owners.append(np.nonzero(valid)[0])
+                    starts.append(cellStart[c])
+                    lengths.append(cellStart[c+1] - cellStart[c])
+            owners = np.concatenate(owners)
+            starts = np.concatenate(starts)
+            lengths = np.concatenate(lengths)
+
+            # Expand the ranges into one (owner, candidate) pair per node in them
+            ends = np.cumsum(lengths)
+            owner = np.repeat(owners, lengths)
+            candidate = order[np.repeat(starts - ends + lengths, lengths) + np.arange(ends[-1])]
+            node = batch[owner]
+            keep = candidate != node
+            owner = owner[keep]
+            node = node[keep]
+            candidate = candidate[keep]
+
+            dist = np.sqrt((xs[node] - xs[candidate])**2 + (ys[node] - ys[candidate])**2)
+            sort = np.lexsort((candidate, dist, owner))
+            owner = owner[sort]
+            dist = dist[sort]
+            candidate = candidate[sort]
+
+            # Rank each candidate within its owner's group and keep the first k
+            counts = np.bincount(owner, minlength=len(batch))
+            groupStart = np.cumsum(counts) - counts
+            rank = np.arange(len(owner)) - groupStart[owner]
+            first = rank < k
+
+            # A node outside the block is at least (r * cellSize) away
+            kth = np.full(len(batch), np.inf)
+            kth[owner[rank == k-1]] = dist[rank == k-1]
+            resolved = kth < (r - 1e-6) * cellSize
+            if r >= max(nx, ny):
+                resolved[:] = True
+
+            neighbors[batch[resolved]] = candidate[first & resolved[owner]].reshape(-1, k)
+            unresolved.append(batch[~resolved])
+        pending = np.concatenate(unresolved)
+        r += 1
+
+    return neighbors
+
 def generateGraph(n, height, width, k):
-    nodes = set()
-    nodes.add(Node(0,0))
-    nodes.add(Node(height-1, width-1))
-    nodes.add(Node(height-2, width-2))
-    for i in xrange(n-3):
-        node = None
-        while node is None or node in nodes:
+    nodes = []
+    coords = set()
+    for (x, y) in [(0, 0), (height-1, width-1), (height-2, width-2)]:
+        if (x, y) not in coords:
+            coords.add((x, y))
+            nodes.append(Node(x, y))
+    if n > height * width:
+        raise ValueError('cannot place %d nodes on a %dx%d grid' % (n, height, width))
+    while len(nodes) < n:
+        # Redraw until we find a coordinate that is not already used
+        x = randrange(0, width)
+        y = randrange(0, height)
+        while (x, y) in coords:
             x = randrange(0, width)
             y = randrange(0, height)
-            node = Node(x, y)
-        nodes.add(Node(x, y))
-    nodes = list(nodes)
-    
-    for node in nodes:
-        neighbors = getClosestNeighbors(nodes, node, k)
-        node.setNeighbors(neighbors)
+        coords.add((x, y))
+        nodes.append(Node(x, y))
+
+    xs = [node.x for node in nodes]
+    ys = [node.y for node in nodes]
+    neighbors = getKNearestNeighbors(xs, ys, k)
+    for i, node in enumerate(nodes):
+        node.setNeighbors([nodes[j] for j in neighbors[i]])
     return nodes
 
 def get_graph_representation(nodes):
@@ -0,0 +1,175 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+#
+# Author: Brian Wong and Kevin Mu
+# Class: Computer Science 143
+# Date: December 2, 2014
+# Description: Saving a road graph, its cost model and optionally its
+#              zero-traffic routing table as raw NumPy arrays, which are
+#              memory-mapped when loaded so that processes share them.
+#
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+import os
+import json
+import time
+import random
+import shutil
+import argparse
+import numpy as np
+from csr_graph import CSRGraph
+from cost_model import LinearCostModel, BPRCostModel
+from all_pairs import RoutingMatrix
+
+# Format 1 stores always hold a routing table row for every node; format 2
+# records in meta.json whether the table has a row per node or per start
+FORMAT = 2
+
+# The arrays holding the parameters of each kind of cost model
+COST_MODELS = {
+    'linear': (LinearCostModel, ('base', 'slope')),
+    'bpr': (BPRCostModel, ('t0', 'capacity', 'alpha', 'beta')),
+}
+
+# Stores loaded by shared(), keyed by path
+_stores = {}
+
+def save(path, graph, road_cost_map, spawn_probability=None, routing_table=None):
+    '''
+    Save a CSRGraph and its cost model to the directory path, one .npy file
+    per array plus meta.json describing them. road_cost_map must be a
+    LinearCostModel or BPRCostModel. routing_table, if given, is a
+    RoutingMatrix for the zero-traffic graph, e.g. from
+    RoutingMatrix.build(main.get_zero_traffic_cost_map(graph, road_cost_map)).
+
+    The files are written to a temporary directory which then replaces
+    path, so a reader never sees a half-written store.
+    '''
+    for kind, (model, params) in COST_MODELS.items():
+        if isinstance(road_cost_map, model):
+            break
+    else:
+        raise ValueError('cannot save a %s' % road_cost_map.__class__.__name__)
+
+    arrays = {
+        'coords': np.array(graph.coords),
+        'offsets': graph.offsets,
+        'targets': graph.targets,
+        'cost': graph.cost,
+    }
+    for name in params:
+        arrays[name] = getattr(road_cost_map, name)
+    if spawn_probability is not None:
+        arrays['spawn_probability'] = np.asarray(spawn_probability, dtype=np.float64)
+    if routing_table is not None:
+        arrays['starts'] = np.array(sorted(routing_table.starts), dtype=np.int64)
+        arrays['next_hop'] = routing_table.next_hop
+        if routing_table.dist is not None:
+            arrays['dist'] = routing_table.dist
+
+    meta = {
+        'format': FORMAT,
+        'num_nodes': graph.num_nodes,
+        'num_edges': graph.num_edges,
+        'cost_model': kind,
+        'arrays': sorted(arrays),
+    }
+    if routing_table is not None:
+        meta['routing_rows'] = 'full' if routing_table.full else 'starts'
+    tmp = path.rstrip('/') + '.tmp'
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp, name + '.npy'), np.ascontiguousarray(array))
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2, sort_keys=True)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(tmp, path)
+
+def load(path, mmap=True):
+    '''
+    Load a store written by save(). Returns (graph, road_cost_map,
+    spawn_probability, routing_table), where spawn_probability and
+    routing_table are None if they were not saved.
+
+    With mmap, the arrays are memory-mapped read-only rather than read, so
+    a large routing table costs nothing until it is used and is shared
+    through the page cache by every process that loads it.
+    '''
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta['format'] not in (1, FORMAT):
+        raise ValueError('unsupported graph store format %r' % (meta['format'],))
+    if meta['cost_model'] not in COST_MODELS:
+        raise ValueError('unknown cost model %r' % (meta['cost_model'],))
+
+    mode = 'r' if mmap else None
+    arrays = dict((name, np.load(os.path.join(path, name + '.npy'), mmap_mode=mode))
+                  for name in meta['arrays'])
+
+    coords = [tuple(xy) for xy in arrays['coords'].tolist()]
+    graph = CSRGraph(coords, arrays['offsets'], arrays['targets'], arrays['cost'])
+    model, params = COST_MODELS[meta['cost_model']]
+    road_cost_map = model(*[arrays[name] for name in params])
+
+    routing_table = None
+    if 'next_hop' in arrays:
+        full = meta.get('routing_rows', 'full') == 'full'
+        routing_table = RoutingMatrix(arrays['starts'], arrays['next_hop'], arrays.get('dist'), full)
+    return graph, road_cost_map, arrays.get('spawn_probability'), routing_table
+
+def shared(path):
+    '''
+    Return load(path), loading it only once per process. The graph and
+    tables are never modified by a simulation, so trials can share them.
+    '''
+    if path not in _stores:
+        _stores[path] = load(path)
+    return _stores[path]
+
+def main():
+    parser = argparse.ArgumentParser(description='Save and inspect graph stores.')
+    commands = parser.add_subparsers(dest='command')
+
+    command = commands.add_parser('save', help='generate a grid graph and save it')
+    command.add_argument('path')
+    command.add_argument('--nodes', type=int, default=12,
+                         help='number of junctions (default: %(default)s)')
+    command.add_argument('--seed', type=int, default=None)
+    command.add_argument('--table', action='store_true',
+                         help='also save the zero-traffic routing table')
+
+    command = commands.add_parser('info', help='load a store and describe it')
+    command.add_argument('path')
+
+    args = parser.parse_args()
+    import main as simulator
+
+    if args.command == 'save':
+        random.seed(args.seed)
+        graph, road_cost_map, spawn_probability = simulator.get_grid_graph(args.nodes)
+        routing_table = None
+        if args.table:
+            zero_map = simulator.get_zero_traffic_cost_map(graph, road_cost_map)
+            routing_table = RoutingMatrix.build(zero_map, backend=simulator.ROUTING_BACKEND)
+        save(args.path, graph, road_cost_map, spawn_probability, routing_table)
+        print 'Saved %d junctions and %d roads to %s' % (graph.num_nodes, graph.num_edges, args.path)
+        return
+
+    if not os.path.exists(os.path.join(args.path, 'meta.json')):
+        parser.error('not a graph store: %s' % args.path)
+    start = time.time()
+    graph, road_cost_map, spawn_probability, routing_table = load(args.path)
+    seconds = time.time() - start
+    size = sum(os.path.getsize(os.path.join(args.path, name)) for name in os.listdir(args.path))
+    print 'Junctions, %d' % graph.num_nodes
+    print 'Roads, %d' % graph.num_edges
+    print 'Cost model, %s' % road_cost_map.__class__.__name__
+    print 'Spawn probabilities, %s' % ('yes' if spawn_probability is not None else 'no')
+    print 'Routing table rows, %d' % (len(routing_table) if routing_table is not None else 0)
+    print 'Bytes on disk, %d' % size
+    print 'Load seconds, %.4f' % seconds
+
+if __name__ == '__main__':
+    main()
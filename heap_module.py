@@ -63,3 +63,142 @@ def changeValue(heap, item, newValue, value):
         heapifyUp(heap, i, value)
     else:
         heapifyDown(heap, i, value)
+
+class IndexedHeap:
+    """ 
+    A d-ary min-heap that keeps a position map from each item to its 
+    slot in the heap, so that membership tests take O(1) time and 
+    decreaseKey takes O(log V) time instead of the O(V) list search 
+    done by changeValue above.
+
+    Entries are stored as (value, item) pairs, so items with equal values
+    are extracted in item order. This makes the extraction order, and with
+    it the shortest path trees built by Dijkstra's algorithm, depend only
+    on the edge costs and not on the history of heap operations.
+
+    Removal is lazy: remove() only marks the item, and the entry is 
+    discarded when it reaches the top of the heap.
+    """
+    def __init__(self, items=(), value=None, d=2):
+        self.d = d
+        self.heap = []
+        self.position = {}
+        self.deleted = set()
+        for item in items:
+            self.position[item] = len(self.heap)
+            self.heap.append((value[item], item))
+
+        # Bottom-up heap construction, O(V)
+        for i in xrange((len(self.heap) - 2) // d, -1, -1):
+            self.heapifyDown(i)
+
+    def __len__(self):
+        return len(self.heap) - len(self.deleted)
+
+    def __contains__(self, item):
+        return item in self.position and item not in self.deleted
+
+    def value(self, item):
+        return self.heap[self.position[item]][0]
+
+    def heapifyUp(self, i):
+        heap = self.heap
+        position = self.position
+        d = self.d
+        entry = heap[i]
+        while i > 0:
+            parentIndex = (i-1) // d
+            parent = heap[parentIndex]
+            if not entry < parent:
+                break
+            heap[i] = parent
+            position[parent[1]] = i
+            i = parentIndex
+        heap[i] = entry
+        position[entry[1]] = i
+
+    def heapifyDown(self, i):
+        heap = self.heap
+        position = self.position
+        d = self.d
+        size = len(heap)
+        entry = heap[i]
+        while True:
+            firstChild = d*i + 1
+            if firstChild >= size:
+                break
+
+            # Find the smallest of the (up to d) children
+            smallerChildIndex = firstChild
+            smallerChild = heap[firstChild]
+            for c in xrange(firstChild + 1, min(firstChild + d, size)):
+                if heap[c] < smallerChild:
+                    smallerChildIndex = c
+                    smallerChild = heap[c]
+
+            if not smallerChild < entry:
+                break
+            heap[i] = smallerChild
+            position[smallerChild[1]] = i
+            i = smallerChildIndex
+        heap[i] = entry
+        position[entry[1]] = i
+
+    def insert(self, item, value):
+        if item in self.position:
+            # Reinserting a lazily removed item revives its old entry
+            if item not in self.deleted:
+                raise KeyError(item)
+            self.deleted.remove(item)
+            self.changeValue(item, value)
+            return
+        self.heap.append((value, item))
+        self.heapifyUp(len(self.heap) - 1)
+
+    def peekMin(self):
+        while self.heap[0][1] in self.deleted:
+            self.popRoot()
+        return self.heap[0][1], self.heap[0][0]
+
+    def popRoot(self):
+        heap = self.heap
+        value, item = heap[0]
+        last = heap.pop()
+        del self.position[item]
+        if item in self.deleted:
+            self.deleted.remove(item)
+        if len(heap) > 0:
+            heap[0] = last
+            self.heapifyDown(0)
+        return item, value
+
+    def extractMin(self):
+        '''
+        Remove and return the (item, value) pair with the smallest value.
+        '''
+        while self.heap[0][1] in self.deleted:
+            self.popRoot()
+        return self.popRoot()
+
+    def decreaseKey(self, item, newValue):
+        i = self.position[item]
+        if item in self.deleted:
+            raise KeyError(item)
+        if newValue > self.heap[i][0]:
+            raise ValueError('new value is greater than the current value')
+        self.heap[i] = (newValue, item)
+        self.heapifyUp(i)
+
+    def changeValue(self, item, newValue):
+        i = self.position[item]
+        oldEntry = self.heap[i]
+        self.heap[i] = (newValue, item)
+        if self.heap[i] < oldEntry:
+            self.heapifyUp(i)
+        else:
+            self.heapifyDown(i)
+
+    def remove(self, item):
+        if item not in self:
+            raise KeyError(item)
+        self.deleted.add(item)
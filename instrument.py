@@ -0,0 +1,169 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+#
+# Author: Brian Wong and Kevin Mu
+# Class: Computer Science 143
+# Date: December 2, 2014
+# Description: Instrumentation for the simulator: time spent in each
+#              phase of a timestep, shortest path search counters, and
+#              per-timestep car counts, recorded only when enabled.
+#
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+import time
+import json
+import contextlib
+from collections import defaultdict
+
+# The Recorder in use, or None when instrumentation is off. Instrumented
+# code checks this once per call, so leaving it off costs next to nothing.
+active = None
+
+class Recorder:
+    """
+    class collecting the measurements of one or more simulation runs.
+
+    times[phase] is the wall time spent in each phase, and counts holds
+    event counters such as the number of Dijkstra's searches, heap
+    operations and edge relaxations. Gauges such as the number of active
+    and waiting cars are set during a timestep by gauge(); end_step()
+    closes the timestep, keeping the gauges' peaks and, if trace is set,
+    appending them to the per-timestep trace.
+    """
+    def __init__(self, trace=False):
+        self.times = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.peaks = {}
+        self.totals = defaultdict(int)
+        self.timesteps = 0
+        self.step = {}
+        self.trace = [] if trace else None
+
+    def clock(self):
+        return time.time()
+
+    def phase(self, name, start):
+        '''
+        Charge the time since start to phase name, and return the current
+        time so that the next phase can start from it.
+        '''
+        now = time.time()
+        self.times[name] += now - start
+        return now
+
+    def count(self, name, n=1):
+        self.counts[name] += n
+
+    def search(self, settled, relaxations, updates, kind='dijkstra'):
+        '''
+        Record one shortest path search: the nodes it settled (one
+        extract-min each), the edges it relaxed, and the heap updates
+        (inserts and decrease-keys) made for the nodes it reached.
+        '''
+        counts = self.counts
+        counts[kind] += 1
+        counts['heap_extracts'] += settled
+        counts['heap_updates'] += updates
+        counts['relaxations'] += relaxations
+
+    def gauge(self, name, value):
+        self.step[name] = value
+
+    def end_step(self):
+        for name, value in self.step.items():
+            self.totals[name] += value
+            if value > self.peaks.get(name, value - 1):
+                self.peaks[name] = value
+        if self.trace is not None:
+            row = dict(self.step)
+            row['timestep'] = self.timesteps
+            self.trace.append(row)
+        self.timesteps += 1
+        self.step = {}
+
+    def summary(self):
+        '''
+        Return the measurements as a dict that can be saved as JSON or
+        combined with others by merge().
+        '''
+        summary = {
+            'timesteps': self.timesteps,
+            'times': dict(self.times),
+            'counts': dict(self.counts),
+            'peaks': dict(self.peaks),
+            'totals': dict(self.totals),
+        }
+        if self.trace is not None:
+            summary['trace'] = list(self.trace)
+        return summary
+
+def merge(summaries):
+    '''
+    Combine the summaries of several runs, e.g. the trials of
+    main.evaluate_algo. Each run's trace rows are tagged with its index.
+    '''
+    merged = Recorder()
+    trace = None
+    for i, summary in enumerate(summaries):
+        merged.timesteps += summary['timesteps']
+        for name, value in summary['times'].items():
+            merged.times[name] += value
+        for name, value in summary['counts'].items():
+            merged.counts[name] += value
+        for name, value in summary['totals'].items():
+            merged.totals[name] += value
+        for name, value in summary['peaks'].items():
+            merged.peaks[name] = max(value, merged.peaks.get(name, value))
+        if 'trace' in summary:
+            trace = trace or []
+            trace += [dict(row, run=i) for row in summary['trace']]
+    merged = merged.summary()
+    if trace is not None:
+        merged['trace'] = trace
+    return merged
+
+def report(summary):
+    '''
+    Format a summary as text: phases by time, counters, and the mean and
+    peak of each gauge per timestep.
+    '''
+    lines = []
+    total = sum(summary['times'].values())
+    lines.append('Phase, seconds, share')
+    for name, seconds in sorted(summary['times'].items(), key=lambda item: -item[1]):
+        lines.append('%s, %.4f, %.1f%%' % (name, seconds, 100 * seconds / total if total else 0))
+    lines.append('')
+    lines.append('Counter, total')
+    for name, value in sorted(summary['counts'].items()):
+        lines.append('%s, %d' % (name, value))
+    lines.append('')
+    steps = max(summary['timesteps'], 1)
+    lines.append('Per timestep (%d timesteps), mean, peak' % summary['timesteps'])
+    for name in sorted(summary['totals']):
+        lines.append('%s, %.1f, %d' % (name, float(summary['totals'][name]) / steps, summary['peaks'][name]))
+    return '\n'.join(lines)
+
+def write_trace(summary, path):
+    '''
+    Write the per-timestep trace of a summary to path, one JSON object
+    per line.
+    '''
+    with open(path, 'w') as f:
+        for row in summary.get('trace', []):
+            f.write(json.dumps(row, sort_keys=True) + '\n')
+
+@contextlib.contextmanager
+def recording(trace=False):
+    '''
+    Turn instrumentation on for the duration of a with block:
+
+        with instrument.recording() as recorder:
+            main.test(...)
+        print instrument.report(recorder.summary())
+    '''
+    global active
+    previous = active
+    active = Recorder(trace)
+    try:
+        yield active
+    finally:
+        active = previous
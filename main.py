@@ -8,22 +8,82 @@
 #
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
 
+import sys
 import time
 import random
-import copy
+import itertools
+import argparse
+import multiprocessing
 import heap_module as hm
+import instrument
+import trajectory
 import graph as gm
 import math
+import numpy as np
+from csr_graph import CSRGraph
+from cost_model import LinearCostModel, FunctionCostModel
+from traffic_state import TrafficState
+from dynamic_sssp import DynamicRoutingTable
+from all_pairs import RoutingMatrix, pick_backend, BACKENDS
+from point_to_point import shortest_path
+from contraction import ContractionHierarchy
+from routing_cache import RoutingCache
+from fleet import Fleet, describe_car
+import event_sim
+import region_sim
+import graph_store
+from metrics import TripMetrics, RunningStats
+import assignment
+from demand import Demand, reachable
+from results_log import ResultLog
 
 car_id = 1
 
 CONNECTIVITY = 6
 TRAFFIC_MULTIPLIER = 8
 
-class Car:
+# Backend used by gen_routing_table on a CSRGraph; see all_pairs.BACKENDS
+ROUTING_BACKEND = 'auto'
+
+# Simulation loop used by evaluate_algo's trials: 'timestep' or 'event'
+SIMULATION_ENGINE = 'timestep'
+
+# Number of regions, and processes, each trial is split into by the 'regions' engine
+REGIONS = 2
+
+# Graph store (see graph_store.py) shared by evaluate_algo's trials, or None
+# to generate a new grid graph of TRIAL_NODES junctions for each trial
+GRAPH_STORE = None
+TRIAL_NODES = 12
+
+# Average number of trips per timestep drawn from the spawn probabilities
+# by evaluate_algo's trials, or None for test's usual 4 cars per timestep
+DEMAND = None
+
+# Adaptive runs stop once the 95% confidence interval of the mean is narrow
+# enough, but never before MIN_TRIALS trials
+CONFIDENCE_Z = 1.96
+MIN_TRIALS = 10
+
+def new_car_id():
+    global car_id
+    car_id += 1
+    return car_id - 1
+
+def new_car_ids(count):
+    '''
+    Return an array of count new car IDs, the same as count calls of new_car_id.
+    '''
+    global car_id
+    car_id += count
+    return np.arange(car_id - count, car_id)
+
+class Car(object):
+    __slots__ = ('id', 'source', 'dest', 'current_node', 'next_node',
+                 'progress', 'road_cost', 'time_elapsed', 'fixed_route')
+
     def __init__(self, source=None, dest=None):
-        global car_id
-        self.id = car_id
+        self.id = new_car_id()
 
         # Where the car is instantiated
         self.source = source
@@ -51,23 +111,24 @@ class Car:
 
         self.fixed_route = []
 
-        car_id += 1
-
     def __str__(self):
-        s = 'CAR ' + str(self.id) + '| Start: ' + str(self.source)
-        s += ',  ' + 'Dest: ' + str(self.dest)
-        s += ',  ' + str(self.current_node)
-        s += '->' + str(self.next_node)
-        s += ',  ' + str(self.progress) + '/'
-        s += str(self.road_cost)
-        s += '. Time Elapsed: ' + str(self.time_elapsed)
-        return s
+        return self.describe(str)
+
+    def describe(self, name):
+        '''
+        Format the car, using name(node) to print each node.
+        '''
+        return describe_car(self, name)
 
 def get_zero_traffic_cost_map(graph, road_cost_map):
     '''
     Construct a weighted graph using the road_cost_map by evaluating
-    each of the lambda functions at 0, corresponding to no traffic
+    each of the lambda functions at 0, corresponding to no traffic.
+    For a CSRGraph, road_cost_map is a cost model.
     '''
+    if isinstance(graph, CSRGraph):
+        return graph.with_cost(road_cost_map.zero_costs())
+
     zero_traffic_cost_map = {}
     for node in graph:
         zero_traffic_cost_map[node] = {}
@@ -85,21 +146,17 @@ def get_grid_graph(n):
 
 def convert_graph(version):
     '''
-    Convert graph made using graph.py into a road_cost_map
+    Convert graph made using graph.py into a CSRGraph and a road_cost_map,
+    which is a LinearCostModel charging TRAFFIC_MULTIPLIER per car on top
+    of each road's length.
     '''
-    graph = {}
-    road_cost_map = {}
-
-    nodes = version.keys()
-    for node in nodes:
-        graph[node] = {}
-        road_cost_map[node] = {}
-        for terminus in version[node]:
-            graph[node][terminus] = 0
-            cost = version[node][terminus]
-            road_cost_map[node][terminus] = lambda n, cost=cost: TRAFFIC_MULTIPLIER*n + cost
+    graph = CSRGraph.from_dict(version)
+    road_cost_map = LinearCostModel(graph.cost, TRAFFIC_MULTIPLIER)
 
-    spawn_probability = {x: random.random() for x in nodes}
+    # spawn_probability[i] is the spawn probability of node ID i
+    spawn_probability = np.zeros(graph.num_nodes)
+    for x in version.keys():
+        spawn_probability[graph.node_id[x]] = random.random()
 
     return graph, road_cost_map, spawn_probability
 
@@ -112,7 +169,14 @@ def dijkstra(graph, start):
     This function uses the priority queue from our heap_module
     in order to reduce complexity from O(V^2) to O(Elog(V)), which is
     beneficial for sparse graphs. 
+
+    graph may also be a CSRGraph, in which case the search runs on its
+    cost array and the results are lists indexed by node ID.
     '''
+    if isinstance(graph, CSRGraph):
+        distances, pred, _ = dijkstra_csr(graph, start)
+        return distances, pred
+
     distances = {start: 0}
 
     # After this algorithm, pred[node] = x will mean that if you
@@ -124,28 +188,136 @@ def dijkstra(graph, start):
         pred[terminus] = start
 
     value = {}
-    heap = []
-
     for v in graph.keys():
         value[v] = float('inf')
-        heap.append(v)
+    value[start] = 0
 
-    hm.changeValue(heap, start, 0, value)
+    heap = hm.IndexedHeap(graph.keys(), value)
 
     while (len(heap) > 0):
         # Using the heap, min extraction takes log(V) time
-        smallest = hm.extractMin(heap, value)
-        distances[smallest] = value[smallest]
+        smallest, dist = heap.extractMin()
+        distances[smallest] = dist
 
         for terminus in graph[smallest].keys():
+            # The heap's position map makes this membership test O(1)
             if terminus in heap:
-                newDist = value[smallest] + graph[smallest][terminus]
+                newDist = dist + graph[smallest][terminus]
                 if newDist < value[terminus]:
-                    hm.changeValue(heap, terminus, newDist, value)
+                    value[terminus] = newDist
+                    heap.decreaseKey(terminus, newDist)
                     pred[terminus] = smallest
 
+    if instrument.active is not None:
+        instrument.active.search(len(graph), sum(len(graph[node]) for node in graph), 0)
+
     return distances, pred
 
+def dijkstra_csr(graph, start):
+    '''
+    Dijkstra's algorithm on a CSRGraph. Same algorithm as dijkstra, but
+    nodes are integer IDs and distances and pred are lists, with
+    pred[node] = None for the start and for unreachable nodes.
+
+    Also returns hop, where hop[node] is the first hop on the path from
+    start to node. It is carried along during relaxation: a node reached
+    from the start is its own first hop, and any other node inherits the
+    first hop of its predecessor, which is already settled.
+    '''
+    offsets, targets, cost = graph.lists()
+    inf = float('inf')
+
+    distances = [inf] * graph.num_nodes
+    pred = [None] * graph.num_nodes
+    hop = [None] * graph.num_nodes
+    for e in xrange(offsets[start], offsets[start+1]):
+        # Seed the pred map
+        pred[targets[e]] = start
+
+    value = [inf] * graph.num_nodes
+    value[start] = 0
+
+    heap = hm.IndexedHeap(xrange(graph.num_nodes), value)
+    decreases = 0
+
+    while (len(heap) > 0):
+        smallest, dist = heap.extractMin()
+        distances[smallest] = dist
+
+        for e in xrange(offsets[smallest], offsets[smallest+1]):
+            terminus = targets[e]
+            if terminus in heap:
+                newDist = dist + cost[e]
+                if newDist < value[terminus]:
+                    value[terminus] = newDist
+                    heap.decreaseKey(terminus, newDist)
+                    pred[terminus] = smallest
+                    hop[terminus] = terminus if smallest == start else hop[smallest]
+                    decreases += 1
+
+    if instrument.active is not None:
+        instrument.active.search(graph.num_nodes, graph.num_edges, decreases)
+
+    return distances, pred, hop
+
+def reverse_dijkstra(graph, dest):
+    '''
+    Dijkstra's algorithm run backwards from dest over the incoming roads
+    of a CSRGraph. Returns the distances from each node to dest and
+    toward, where toward[node] is the next hop from node on a shortest
+    path to dest (None for dest itself and for nodes that cannot reach it).
+
+    One search gives the next hop toward dest from every junction, so this
+    is cheaper than per-start searches when there are fewer destinations
+    than starts. When several paths are equally short, the one chosen may
+    differ from the one dijkstra chooses from the start.
+    '''
+    in_offsets, in_edges, sources = graph.in_structure
+    _, _, cost = graph.lists()
+    inf = float('inf')
+
+    distances = [inf] * graph.num_nodes
+    toward = [None] * graph.num_nodes
+    value = [inf] * graph.num_nodes
+    value[dest] = 0
+
+    heap = hm.IndexedHeap(xrange(graph.num_nodes), value)
+    settled = relaxations = decreases = 0
+
+    while (len(heap) > 0):
+        smallest, dist = heap.extractMin()
+        if dist == inf:
+            break
+        distances[smallest] = dist
+        settled += 1
+        relaxations += in_offsets[smallest+1] - in_offsets[smallest]
+
+        for i in xrange(in_offsets[smallest], in_offsets[smallest+1]):
+            e = in_edges[i]
+            origin = sources[e]
+            if origin in heap:
+                newDist = dist + cost[e]
+                if newDist < value[origin]:
+                    value[origin] = newDist
+                    heap.decreaseKey(origin, newDist)
+                    toward[origin] = smallest
+                    decreases += 1
+
+    if instrument.active is not None:
+        instrument.active.search(settled, relaxations, decreases, 'reverse_dijkstra')
+
+    return distances, toward
+
+def gen_destination_table(graph, dests_set):
+    '''
+    Generate a destination-rooted routing table for a CSRGraph:
+    table[dest][node] is the next hop for a car at node headed to dest.
+    '''
+    table = {}
+    for dest in dests_set:
+        _, table[dest] = reverse_dijkstra(graph, dest)
+    return table
+
 def avg(li):
     return sum(li) / float(len(li))
 
@@ -156,6 +328,12 @@ def dijkstra_add_routes(graph, start, routing_table):
     the next hop for a car currently at start with destination dest.
     '''
 
+    # On a CSRGraph, routing_table[start] is a list indexed by node ID,
+    # and dijkstra_csr finds the first hops during the search
+    if isinstance(graph, CSRGraph):
+        _, _, routing_table[start] = dijkstra_csr(graph, start)
+        return
+
     # We use the predecessor map from Dijkstra's to retrieve shortest paths
     _, pred = dijkstra(graph, start)
 
@@ -174,14 +352,26 @@ def dijkstra_add_routes(graph, start, routing_table):
 
         routing_table[start][node] = curr_node
 
-def gen_routing_table(graph, starts_set):
+def gen_routing_table(graph, starts_set, backend=None):
     '''
     Generate a routing table for a given starts_set.
 
     starts_set contains a list of nodes in the graph that need to be 
     routed from; e.g. x is in starts_set if a car is at the junction x
     and needs to know where its next hop is.
+
+    On a CSRGraph, backend (ROUTING_BACKEND if None) chooses how the
+    table is built: 'python' runs dijkstra from each start, while
+    'scipy' and 'numpy' find all the routes in one batched call and
+    return a RoutingMatrix.
     '''
+    if isinstance(graph, CSRGraph):
+        backend = pick_backend(graph, backend or ROUTING_BACKEND)
+        if backend != 'python':
+            if instrument.active is not None:
+                instrument.active.count('batched_sources', len(starts_set))
+            return RoutingMatrix.build(graph, starts_set, backend)
+
     routing_table = {}
     for node in starts_set:
         dijkstra_add_routes(graph, node, routing_table)
@@ -195,7 +385,7 @@ def gen_route(routing_table, start, dest):
     '''
     route = []
     curr_node = start
-    while dest in routing_table[curr_node] and routing_table[curr_node][dest] != None:
+    while curr_node != dest and routing_table[curr_node][dest] != None:
         route.append(curr_node)
         curr_node = routing_table[curr_node][dest]
 
@@ -204,10 +394,18 @@ def gen_route(routing_table, start, dest):
 
     return route
 
-def print_cars(cars):
+def print_cars(cars, graph=None):
+    '''
+    Print each car. If graph is a CSRGraph, node IDs are printed as
+    their coordinates.
+    '''
+    name = str
+    if isinstance(graph, CSRGraph):
+        name = lambda node: str(None if node is None else graph.coords[node])
+
     print '################## CARS ##################'
     for car in cars:
-        print car
+        print car.describe(name)
     print '##########################################'
     print ''
 
@@ -222,238 +420,793 @@ def evaluate(arrived_cars):
 
     return sum_elapsed / float(len(arrived_cars))
 
-def one_timestep(graph, road_cost_map, cars, fix_route=False, centralized=False, naive_routing_table=None):
+def convert_car_nodes(car, mapping):
+    '''
+    Replace each node stored on the car by mapping[node], e.g. to switch
+    between coordinates and CSRGraph node IDs.
+    '''
+    convert = lambda node: None if node is None else mapping[node]
+    car.source = convert(car.source)
+    car.dest = convert(car.dest)
+    car.current_node = convert(car.current_node)
+    car.next_node = convert(car.next_node)
+    car.fixed_route = [mapping[node] for node in car.fixed_route]
+
+def one_timestep(graph, road_cost_map, cars, fix_route=False, centralized=False, naive_routing_table=None, traffic_state=None, routing_cache=None, assign_iterations=None):
     '''
     Simulate the passage of one unit of time. This involves increment the position
     of each car, labeling the cars that have arrived at their destinations, and
     routing all cars that have arrived at junctions (nodes in the graph).
-    '''
-    # A list of all junctions where cars are currently waiting
-    # for routing information
-    starts_set = set([])
 
-    # A list of all cars at junctions that are waiting to be routed
-    waiting_cars = []
+    graph is a CSRGraph, road_cost_map is a cost model (see cost_model.py),
+    and cars is a Fleet whose nodes are node IDs. Returns the Fleet of cars still
+    traveling and a list of CarViews of the cars that arrived. A list of Car
+    objects is also accepted, in which case lists of Car objects are returned,
+    and the dict forms are converted for the duration of the step by one_timestep_dict.
 
-    # A list of all cars that have arrived at their destination
-    arrived_cars = []
+    traffic_state is the TrafficState for cars, which this function updates
+    as cars leave and enter roads. If it is not given, it is built from cars.
+    If routing_cache is a RoutingCache on traffic_state, the dynamic route
+    algorithm reads its rows from the cache instead of running Dijkstra's.
 
-    # Will hold all cars that are still traveling after this iteration
-    new_car_list = []
+    While instrumentation is on (see instrument.py), the time spent in each
+    step is recorded along with the number of waiting cars and table rows.
+    '''
+    if not isinstance(graph, CSRGraph):
+        return one_timestep_dict(graph, road_cost_map, cars, fix_route, centralized, naive_routing_table)
+
+    if not isinstance(cars, Fleet):
+        by_id = dict((car.id, car) for car in cars)
+        fleet, arrived = one_timestep(graph, road_cost_map, Fleet.from_cars(cars, graph), fix_route=fix_route, centralized=centralized, naive_routing_table=naive_routing_table, traffic_state=traffic_state, routing_cache=routing_cache, assign_iterations=assign_iterations)
+        for view in list(fleet) + arrived:
+            view.copy_to(by_id[view.id])
+        return [by_id[view.id] for view in fleet], [by_id[view.id] for view in arrived]
+
+    fleet = cars
+    recorder = instrument.active
+    if recorder is not None:
+        t = recorder.clock()
+    if traffic_state is None:
+        traffic_state = TrafficState(graph, road_cost_map, traffic=fleet.traffic(graph.num_edges))
+    traffic_state.begin_step()
 
     # STEP 1:
     # Increment each car's progress on the road it is on, simulating
-    # the passage of a unit of time
-    for car in cars:
-        # Will update flag if we find out it has arrived
-        is_traveling = True
-        car.time_elapsed += 1
-        if car.next_node:
-            # Move car forward one unit along current road
-            car.progress += 1
-
-        # If car has reached the end of its current road
-        if car.progress >= car.road_cost and car.road_cost != None:
-            car.current_node = car.next_node
-
-            # Check whether it has arrived at destination
-            if car.current_node == car.dest:
-                # To correct one-off error
-                car.time_elapsed -= 1
-                arrived_cars.append(car)
-                is_traveling = False
-            else:
-                # If the new junction is not the destination,
-                # routing from this junction is required
-                starts_set.add(car.current_node)
-                waiting_cars.append(car)
-
-            car.next_node = None
-            car.road_cost = None
-
-        # Handle the special case where the car does not have next_node set,
-        # this may occur at the start of the algorithm depending on how you
-        # instantiate cars.
-        elif not car.next_node:
-            waiting_cars.append(car)
-            starts_set.add(car.current_node)
-
-        if is_traveling:
-            new_car_list.append(car)
-
-    # STEP 2:
-    # Figure out how much traffic is on each road
-    traffic_graph = copy.deepcopy(graph)
-    for car in cars:
-        if car.next_node:
-            traffic_graph[car.current_node][car.next_node] += 1
-
-    # STEP 3:
-    # Use traffic graph to compute new cost of each path
-    cost_graph = copy.deepcopy(graph)
-    for current_node in cost_graph:
-        for next_node in cost_graph[current_node]:
-            traffic = traffic_graph[current_node][next_node]
-            cost = road_cost_map[current_node][next_node](traffic)
-            cost_graph[current_node][next_node] = cost
+    # the passage of a unit of time. This is done for all cars at once
+    # by Fleet.advance; cars at the end of their road leave it, and cars
+    # that reached their destination are removed from the fleet.
+    left, arrived, waiting = fleet.advance()
+    if recorder is not None:
+        t = recorder.phase('step1_advance', t)
+    for e in left.tolist():
+        traffic_state.leave(e)
+    if recorder is not None:
+        t = recorder.phase('step23_costs', t)
+    taken = fleet.take(arrived)
+    if trajectory.active is not None:
+        writer = trajectory.active
+        writer.record(trajectory.ARRIVE, taken.id[:taken.size], taken.dest[:taken.size])
+        if writer.positions:
+            moving = np.nonzero(fleet.next_node[:len(fleet)] >= 0)[0]
+            writer.record(trajectory.MOVE, fleet.id[moving], fleet.current_node[moving],
+                          fleet.next_node[moving], fleet.edge[moving], fleet.progress[moving])
+    arrived_cars = list(taken)
+
+    # The rows of all cars at junctions that are waiting to be routed
+    waiting = np.nonzero(waiting[~arrived])[0]
+
+    # STEP 2 and 3:
+    # The traffic on each road, and with it the cost of each road,
+    # was updated as cars left their roads above
+    if recorder is not None:
+        recorder.phase('step1_bookkeeping', t)
+        recorder.gauge('active', len(fleet))
+        recorder.gauge('arrived', len(arrived_cars))
 
     # STEP 4
     # Use cost graph to route cars
-    if fix_route:
-        for car in waiting_cars:
-            car.next_node = car.fixed_route[0]
-            car.fixed_route.pop(0)
-            car.progress = 0
-            car.road_cost = cost_graph[car.current_node][car.next_node]
-
-            # Update traffic info for later cars
-            traffic_graph[car.current_node][car.next_node] += 1
-            new_traffic = traffic_graph[car.current_node][car.next_node]
-            new_cost = road_cost_map[car.current_node][car.next_node](new_traffic)
-            cost_graph[car.current_node][car.next_node] = new_cost
+    route_waiting(graph, fleet, waiting, fix_route, centralized, naive_routing_table, traffic_state, routing_cache, assign_iterations=assign_iterations)
 
-    else:
-        routing_table = None
+    return fleet, arrived_cars
+
+def routing_demand(fleet, waiting, routing_cache=None):
+    '''
+    Return (dests_set, uncached) for the cars in the given rows of fleet: the
+    set of their destinations, and the junctions they wait at whose rows are
+    not in routing_cache. The dynamic route algorithm compares the two to
+    choose between destination tables and routing table rows.
+    '''
+    dests_set = set(fleet.dest[waiting].tolist())
+    starts_set = set(fleet.current_node[waiting].tolist())
+    uncached = [start for start in starts_set if routing_cache is None or start not in routing_cache]
+    return dests_set, uncached
+
+def route_waiting(graph, fleet, waiting, fix_route=False, centralized=False, naive_routing_table=None, traffic_state=None, routing_cache=None, use_destinations=None, assign_iterations=None):
+    '''
+    STEP 4 of one_timestep: route the cars in the given rows of fleet, which
+    are waiting at junctions, in row order. Each car enters the road to its
+    next hop, and the road's cost at that moment becomes its road_cost.
+
+    use_destinations overrides the dynamic route algorithm's choice of
+    destination tables over routing table rows, e.g. with the choice made
+    for the cars of every region by region_sim.
+
+    If assign_iterations is a number, the cars are given their next hops
+    all at once by assignment.assign with that many iterations, instead of
+    one at a time as by the centralized algorithm.
+    '''
+    recorder = instrument.active
+    if recorder is not None:
+        t = recorder.clock()
+
+    current_nodes = fleet.current_node[waiting].tolist()
+    dests = fleet.dest[waiting].tolist()
+
+    # A list of all junctions where cars are currently waiting
+    # for routing information
+    starts_set = set(current_nodes)
 
-        if naive_routing_table:
+    cost_graph = traffic_state.cost_graph
+    cost = traffic_state.cost
+
+    routing_table = None
+    dynamic_table = None
+    assigned = None
+    if not fix_route:
+        if naive_routing_table is not None:
             routing_table = naive_routing_table
 
+        elif assign_iterations is not None:
+            assigned = assignment.assign(traffic_state, current_nodes, dests, assign_iterations, ROUTING_BACKEND)
+
+        elif centralized:
+            dynamic_table = DynamicRoutingTable(cost_graph, starts_set)
+            routing_table = dynamic_table.table
+
         else:
-            routing_table = gen_routing_table(cost_graph, starts_set)
-
-        for car in waiting_cars:
-            car.next_node = routing_table[car.current_node][car.dest]
-            car.progress = 0
-            car.road_cost = cost_graph[car.current_node][car.next_node]
-
-            # Update traffic info for later cars
-            traffic_graph[car.current_node][car.next_node] += 1
-            new_traffic = traffic_graph[car.current_node][car.next_node]
-            new_cost = road_cost_map[car.current_node][car.next_node](new_traffic)
-            cost_graph[car.current_node][car.next_node] = new_cost
-
-            # If centralized parameter is set to true, we simulate that the 
-            # the coordinated driverless cars will know in advance the turns
-            # of nearby cars, and will thus have access to up-to-date routing 
-            # information based on the near-future behavior of other cars 
-            # on the road.
-            if centralized:
+            # Route from the waiting cars' destinations instead of from their
+            # junctions when that needs fewer searches. Rows already in the
+            # routing cache need no search at all.
+            dests_set, uncached = routing_demand(fleet, waiting, routing_cache)
+            if use_destinations is None:
+                use_destinations = len(dests_set) < len(uncached)
+            if use_destinations:
+                toward = gen_destination_table(cost_graph, dests_set)
+                routing_table = {}
+                for current_node, dest in zip(current_nodes, dests):
+                    routing_table.setdefault(current_node, {})[dest] = toward[dest][current_node]
+
+            elif routing_cache is not None:
+                # Take the rows now; later cars in this step must not see the
+                # cost changes made by earlier ones
+                routing_table = dict((start, routing_cache[start]) for start in starts_set)
+
+            else:
                 routing_table = gen_routing_table(cost_graph, starts_set)
 
-    return new_car_list, arrived_cars
+    if recorder is not None:
+        t = recorder.phase('step4_tables', t)
+        recorder.gauge('waiting', len(waiting))
+        if isinstance(routing_table, (dict, RoutingMatrix)):
+            recorder.gauge('table_rows', len(routing_table))
+        if routing_cache is not None:
+            recorder.gauge('cached_rows', len(routing_cache.starts))
+
+    next_nodes = []
+    edges = []
+    road_costs = []
+    for i, row in enumerate(waiting.tolist()):
+        current_node = current_nodes[i]
+        if fix_route:
+            next_node = fleet.fixed_route[row].pop(0)
+        elif assigned is not None:
+            next_node = assigned[i]
+        else:
+            next_node = routing_table[current_node][dests[i]]
+        e = graph.edge(current_node, next_node)
+        road_cost = cost[e]
+        next_nodes.append(next_node)
+        edges.append(e)
+        road_costs.append(road_cost)
+
+        # Update traffic info for later cars
+        traffic_state.enter(e)
+
+        # If centralized parameter is set to true, we simulate that the 
+        # the coordinated driverless cars will know in advance the turns
+        # of nearby cars, and will thus have access to up-to-date routing 
+        # information based on the near-future behavior of other cars 
+        # on the road. Only one road's cost has changed, so instead of
+        # rerunning Dijkstra's from every start, the shortest path trees
+        # are repaired where they use that road.
+        if centralized and not fix_route:
+            if dynamic_table is None:
+                dynamic_table = DynamicRoutingTable(cost_graph, starts_set)
+            else:
+                dynamic_table.edge_changed(e, road_cost)
+            routing_table = dynamic_table.table
+
+    fleet.next_node[waiting] = next_nodes
+    fleet.edge[waiting] = edges
+    fleet.road_cost[waiting] = road_costs
+    fleet.progress[waiting] = 0
+    if trajectory.active is not None:
+        trajectory.active.record(trajectory.ENTER, fleet.id[waiting], current_nodes, next_nodes, edges)
+    if recorder is not None:
+        recorder.phase('step4_routing', t)
+
+def one_timestep_dict(graph, road_cost_map, cars, fix_route, centralized, naive_routing_table):
+    '''
+    Run one_timestep on the dict forms of the graph, road_cost_map, cars and
+    naive_routing_table by converting them to CSRGraph node and edge IDs and
+    converting the cars back afterwards.
+    '''
+    csr = CSRGraph.from_dict(graph)
+    for car in cars:
+        convert_car_nodes(car, csr.node_id)
+
+    if naive_routing_table:
+        table = {}
+        for start in naive_routing_table:
+            row = [None] * csr.num_nodes
+            for dest, hop in naive_routing_table[start].items():
+                if hop != None:
+                    row[csr.node_id[dest]] = csr.node_id[hop]
+            table[csr.node_id[start]] = row
+        naive_routing_table = table
+
+    road_cost_map = FunctionCostModel(csr.edge_values(road_cost_map))
+    cars, arrived_cars = one_timestep(csr, road_cost_map, cars, fix_route=fix_route, centralized=centralized, naive_routing_table=naive_routing_table)
+    for car in cars + arrived_cars:
+        convert_car_nodes(car, csr.coords)
+
+    return cars, arrived_cars
+
+def find_special_pair(routing_table, nodes):
+    '''
+    Return the last (start, dest) pair in nodes order such that the
+    routing_table has a route from start to dest, or (None, None).
+    '''
+    for node in reversed(nodes):
+        for terminus in reversed(nodes):
+            if terminus != node and routing_table[node][terminus] != None:
+                return node, terminus
+    return None, None
+
+def spawn_cars(cars, node, dest, nodes, naive_routing_table, traffic_state, fix_route=False, counts=None):
+    '''
+    Add the 4 cars that test starts at node, headed to dest, in a timestep,
+    and return their rows in cars. If dest cannot be reached from node, a
+    few random destinations are tried instead.
+
+    With fix_route, each car's route is planned when it spawns, and the
+    number of queries and nodes explored are added to counts.
+    '''
+    rows = []
+    if node is None:
+        return rows
+    special_dest = dest
+    for z in range(4):
+        dest = special_dest
+        counter = 0
+        ongoing = True
+        while dest == node or (naive_routing_table[node][dest]==None):
+            # It is possible that the chosen start node will not be able to reach
+            # any other node. To skip over these bad start nodes we keep a counter
+            # to keep track of the number of destination nodes we have tried.
+            # When the counter gets too high we abandon this start node choice.
+            if counter > 5:
+                ongoing = False
+                break
+            dest = random.choice(nodes)
+            counter += 1
+
+        if not ongoing:
+            break
+
+        fixed_route = []
+        if fix_route:
+            # Only one path is needed, so search toward dest with A*
+            # instead of building node's whole routing table row
+            path, _, n_explored = shortest_path(traffic_state.cost_graph, node, dest)
+            fixed_route = path[1:]
+            if counts is not None:
+                counts['queries'] += 1
+                counts['explored'] += n_explored
+
+        rows.append(cars.add(new_car_id(), node, dest, fixed_route=fixed_route))
+    return rows
+
+def spawn_trips(cars, demand, rng, traffic_state, fix_route=False, counts=None, keep=None):
+    '''
+    Add the trips that demand (a demand.Demand) draws for a timestep with the
+    NumPy RandomState rng, and return their rows in cars. If keep is given,
+    only trips from the nodes where keep is True are added, though every
+    trip drawn gets a car ID.
 
-def test(num_total_cars, graph, road_cost_map, spawn_probability, fix_route=False, centralized=False, use_naive=False, printable=False):
+    With fix_route, each car's route is planned as in spawn_cars.
+    '''
+    sources, dests = demand.draw(rng)
+    car_ids = new_car_ids(len(sources))
+    if keep is not None:
+        mask = keep[sources]
+        car_ids, sources, dests = car_ids[mask], sources[mask], dests[mask]
+    rows = cars.add_batch(car_ids, sources, dests).tolist()
+    if fix_route:
+        for row, source, dest in zip(rows, sources.tolist(), dests.tolist()):
+            path, _, n_explored = shortest_path(traffic_state.cost_graph, source, dest)
+            cars.fixed_route[row] = path[1:]
+            if counts is not None:
+                counts['queries'] += 1
+                counts['explored'] += n_explored
+    return rows
+
+def test(num_total_cars, graph, road_cost_map, spawn_probability, fix_route=False, centralized=False, use_naive=False, printable=False, stats=None, engine='timestep', naive_routing_table=None, regions=2, metrics=None, assign_iterations=None, demand=None, spawn_pair=None):
     '''
     This function tests the performance of an algorithm (specified by the parameters centralized and use_naive).
     If centralized=False and use_naive=True, this runs Alg0.
     If centralized=False and use_naive=False, this runs Alg1.
     If centralized=True and use_naive=False, this runs Alg2.
+    If assign_iterations is a number, the cars waiting each timestep are instead routed
+    together by traffic assignment with that many iterations (see assignment.py).
 
     The algorithm runs until num_total_cars have arrived at their destinations.
 
+    graph and road_cost_map are normally a CSRGraph and a cost model, as returned by
+    convert_graph. The dict forms are converted before the simulation starts.
+
     Set printable=True if you want to see the location and direction of each car at each time step.
+    If stats is a dict, the routing cache's hit, miss and invalidation counts are added to it,
+    along with the number of point-to-point queries made for fixed routes and the nodes they explored.
+    To measure where the time goes, run test inside instrument.recording(), and to
+    keep a log of every car's moves for later analysis, inside trajectory.recording().
+
+    engine='event' runs the event-driven loop in event_sim.py, which gives the same
+    travel times but only does work for a car when it reaches a junction. It does
+    not print the cars each timestep.
+
+    engine='regions' splits the map into the given number of regions and runs the
+    event-driven loop for each in its own process (see region_sim.py), giving the
+    same travel times again. It cannot run the centralized algorithm or traffic
+    assignment, whose every route depends on the cars routed before it anywhere
+    on the map, and stats are not collected from the regions' processes.
+
+    naive_routing_table can be a precomputed routing table for the zero-traffic graph,
+    such as one loaded by graph_store, to use instead of a contraction hierarchy.
+
+    The arrived cars are added to a TripMetrics (see metrics.py) as they arrive and
+    then dropped. If metrics is a TripMetrics, this run's are merged into it.
+
+    Each timestep normally spawns 4 cars from a fixed start to a fixed destination:
+    spawn_pair, a (start, dest) pair of CSRGraph node IDs, or else the last pair in
+    node order with a route between them.
+    If demand is a demand.Demand, the timestep's trips are drawn from it instead, and
+    if it is a number, from a Demand of that many trips per timestep on average
+    weighted by spawn_probability (see Demand.from_spawn_probability).
     '''
-    nodes = graph.keys()
-    zero_traffic_cost_map = get_zero_traffic_cost_map(graph, road_cost_map)
-    naive_routing_table = gen_routing_table(zero_traffic_cost_map, nodes)
+    recorder = instrument.active
+    if recorder is not None:
+        t = recorder.clock()
 
-    cars = []
+    if isinstance(graph, CSRGraph):
+        nodes = range(graph.num_nodes)
+    else:
+        csr = CSRGraph.from_dict(graph)
+        nodes = [csr.node_id[node] for node in graph.keys()]
+        road_cost_map = FunctionCostModel(csr.edge_values(road_cost_map))
+        graph = csr
+
+    # The zero-traffic costs never change, so the naive routes are answered
+    # by a contraction hierarchy, shared with other trials on the same graph
+    if naive_routing_table is None:
+        zero_traffic_cost_map = get_zero_traffic_cost_map(graph, road_cost_map)
+        naive_routing_table = ContractionHierarchy.for_graph(zero_traffic_cost_map)
+    if recorder is not None:
+        t = recorder.phase('preprocess', t)
+
+    cars = Fleet()
     i = 0
+    trips = TripMetrics()
+    # Only kept for printing
     arrived = []
 
     # When the start state and destination state of each node is fixed,
     # they will be equal to special_start and special_dest. They are chosen
     # to make sure that there is a route from special_start to special_dest.
-    special_start = None
-    special_dest = None
-    for node in nodes:
-        for terminus in naive_routing_table[node].keys():
-            if naive_routing_table[node][terminus] != None:
-                special_start = node
-                special_dest = terminus
-
-    while len(arrived) < num_total_cars:
-        # First generate routing table based on current conditions
-        # to use if fix_route=False
-        traffic_graph = copy.deepcopy(graph)
-        for car in cars:
-            if car.next_node:
-                traffic_graph[car.current_node][car.next_node] += 1
-
-        cost_graph = copy.deepcopy(graph)
-        for current_node in cost_graph:
-            for next_node in cost_graph[current_node]:
-                traffic = traffic_graph[current_node][next_node]
-                cost = road_cost_map[current_node][next_node](traffic)
-                cost_graph[current_node][next_node] = cost
-
-        routing_table = gen_routing_table(cost_graph, nodes)
-
-
-        for node in nodes:
-            # Instantiate 4 cars with source=special_start, dest=special_dest
-            n = 4 if node==special_start else 0
-            for z in range(n):
-                dest = special_dest
-                counter = 0
-                ongoing = True
-                while dest == node or (naive_routing_table[node][dest]==None):
-                    # It is possible that the chosen start node will not be able to reach
-                    # any other node. To skip over these bad start nodes we keep a counter
-                    # to keep track of the number of destination nodes we have tried.
-                    # When the counter gets too high we abandon this start node choice.
-                    if counter > 5:
-                        ongoing = False
-                        break
-                    dest = random.choice(nodes)
-                    counter += 1
-
-                if not ongoing:
-                    break
-
-                new_car = Car(source=node, dest=dest)
-                if fix_route:
-                    new_car.fixed_route = gen_route(routing_table, node, dest)
-
-                cars.append(new_car)
-
-        temp_naive = copy.deepcopy(naive_routing_table)
-        if not use_naive:
-            temp_naive = None
-                    
+    if spawn_pair is not None:
+        special_start, special_dest = spawn_pair
+    else:
+        special_start, special_dest = find_special_pair(naive_routing_table, nodes)
+
+    # Kept up to date by one_timestep as cars move between roads
+    traffic_state = TrafficState(graph, road_cost_map)
+
+    # Routing table rows for the current traffic, built only when needed
+    routing_cache = RoutingCache(traffic_state)
+    counts = {'queries': 0, 'explored': 0}
+    naive = naive_routing_table if use_naive else None
+
+    if demand is not None and not isinstance(demand, Demand):
+        demand = Demand.from_spawn_probability(spawn_probability, reachable(graph), demand)
+    # Seeded from the random module, so a trial's seed also fixes its trips
+    rng = np.random.RandomState(random.randrange(2**32)) if demand is not None else None
+
+    # Instantiate 4 cars with source=special_start, dest=special_dest each timestep
+    def spawn():
+        if demand is not None:
+            rows = spawn_trips(cars, demand, rng, traffic_state, fix_route, counts)
+        else:
+            rows = spawn_cars(cars, special_start, special_dest, nodes, naive_routing_table, traffic_state, fix_route, counts)
+        if trajectory.active is not None:
+            trajectory.active.record(trajectory.SPAWN, cars.id[rows], cars.source[rows], cars.dest[rows])
+        return rows
+
+    if engine == 'event':
+        def route(rows):
+            route_waiting(graph, cars, rows, fix_route, centralized, naive, traffic_state, routing_cache,
+                          assign_iterations=assign_iterations)
+        event_sim.run(cars, traffic_state, num_total_cars, spawn, route, trips)
+
+    elif engine == 'regions':
+        if centralized:
+            raise ValueError('the centralized algorithm cannot be split into regions')
+        if assign_iterations is not None:
+            raise ValueError('traffic assignment cannot be split into regions')
+
+        # Run in each region's process, on its own cars and copy of the traffic
+        def setup(index, spawner):
+            fleet = Fleet()
+            state = TrafficState(graph, road_cost_map)
+            cache = RoutingCache(state)
+            def spawn():
+                if demand is not None:
+                    # Every region draws the same trips and keeps its own
+                    return spawn_trips(fleet, demand, rng, state, fix_route, counts, region_of == index)
+                if not spawner:
+                    return []
+                return spawn_cars(fleet, special_start, special_dest, nodes, naive_routing_table, state, fix_route, counts)
+            def waiting_demand(rows):
+                return routing_demand(fleet, rows, cache)
+            def route(rows, use_destinations):
+                route_waiting(graph, fleet, rows, fix_route, False, naive, state, cache, use_destinations)
+            return fleet, state, spawn, waiting_demand, route
+
+        region_of = region_sim.partition(graph, regions)
+        spawner = region_of[special_start] if special_start is not None else 0
+        dynamic = not fix_route and naive is None
+        region_sim.run(region_of, num_total_cars, setup, spawner, trips, coordinate=dynamic)
+
+    while trips.count < num_total_cars:
+        if recorder is not None:
+            t = recorder.clock()
+
+        spawn()
+
+        if recorder is not None:
+            recorder.phase('spawn', t)
+
         if printable:
-            print_cars(cars)
-        cars, arrived_cars = one_timestep(graph, road_cost_map, cars, fix_route=fix_route, centralized=centralized, naive_routing_table=temp_naive)
+            print_cars(cars, graph)
+        cars, arrived_cars = one_timestep(graph, road_cost_map, cars, fix_route=fix_route, centralized=centralized, naive_routing_table=naive, traffic_state=traffic_state, routing_cache=routing_cache, assign_iterations=assign_iterations)
 
-        arrived += arrived_cars 
+        # Just in case more than the required number of cars arrived in the last time step,
+        # only the first ones are counted
+        arrived_cars = arrived_cars[:num_total_cars - trips.count]
+        trips.add_cars(arrived_cars)
+        if printable:
+            arrived += arrived_cars
         i += 1
-
-    # Just in case more than the required number of cars arrived in the last time step, we truncate the arrived list
-    # to the required number.
-    arrived = arrived[:num_total_cars]
+        if recorder is not None:
+            recorder.end_step()
+        if trajectory.active is not None:
+            trajectory.active.end_step()
 
     if printable:
         print 'ARRIVED CARS:'
-        print_cars(arrived)
+        print_cars(arrived, graph)
+
+    if printable:
+        print 'Routing cache:', routing_cache.stats()
+        if fix_route:
+            print 'Fixed route queries:', counts['queries'], 'nodes explored:', counts['explored']
+    if stats is not None:
+        stats.update(routing_cache.stats())
+        stats.update(counts)
 
-    avg_elapsed = evaluate(arrived)
+    if metrics is not None:
+        metrics.merge(trips)
+    avg_elapsed = trips.mean()
 
     # Return the average travel time of all the cars that have arrived
     return avg_elapsed
 
-def evaluate_algo(z, fix_route, centralized, use_naive):
+def trial_seeds(seed, z):
+    '''
+    Derive the seeds of z trials from a master seed. Trial i always gets
+    the same seed, however the trials are split between processes.
+    '''
+    rng = random.Random(seed)
+    return [rng.randrange(2**32) for i in range(z)]
+
+def trial_graph():
+    '''
+    Return (graph, road_cost_map, spawn_probability, naive_routing_table) for
+    a trial: a new TRIAL_NODES-junction grid graph, or the graph in GRAPH_STORE, which
+    each process loads once. naive_routing_table is None unless the store has
+    one, and if the store has no spawn probabilities, each trial draws its own.
+    '''
+    if GRAPH_STORE is None:
+        return get_grid_graph(TRIAL_NODES) + (None,)
+    graph, road_cost_map, spawn_probability, table = graph_store.shared(GRAPH_STORE)
+    if spawn_probability is None:
+        spawn_probability = np.array([random.random() for i in range(graph.num_nodes)])
+    return graph, road_cost_map, spawn_probability, table
+
+def trial_config(assign_iterations=None, paired=False):
+    '''
+    Return the settings a trial's result depends on besides its algorithm
+    and seed, as logged with it, so that --resume only reuses trials run
+    the same way.
+    '''
+    return {'graph': GRAPH_STORE or 'grid %d' % TRIAL_NODES, 'demand': DEMAND,
+            'assign_iterations': assign_iterations, 'paired': paired}
+
+def run_trial(args):
+    '''
+    Run a single trial of evaluate_algo on a freshly generated graph. The
+    arguments are passed as one tuple so that this can be mapped over a
+    multiprocessing pool.
+    '''
+    trial, seed, fix_route, centralized, use_naive, profile, assign_iterations = args
+    random.seed(seed)
+    start = time.time()
+    engine = SIMULATION_ENGINE
+    if engine == 'regions' and (centralized or assign_iterations is not None):
+        # These algorithms cannot be split; the event loop gives the same results
+        engine = 'event'
+    metrics = TripMetrics()
+    if not profile:
+        graph, road_cost_map, spawn_probability, table = trial_graph()
+        avg_delta = test(30, graph, road_cost_map, spawn_probability, fix_route=fix_route, centralized=centralized, use_naive=use_naive, printable=False, engine=engine, naive_routing_table=table, regions=REGIONS, metrics=metrics, assign_iterations=assign_iterations, demand=DEMAND)
+        return trial, avg_delta, None, time.time() - start, metrics
+
+    with instrument.recording(trace=profile == 'trace') as recorder:
+        t = recorder.clock()
+        graph, road_cost_map, spawn_probability, table = trial_graph()
+        recorder.phase('generate_graph', t)
+        avg_delta = test(30, graph, road_cost_map, spawn_probability, fix_route=fix_route, centralized=centralized, use_naive=use_naive, printable=False, engine=engine, naive_routing_table=table, regions=REGIONS, metrics=metrics, assign_iterations=assign_iterations, demand=DEMAND)
+    return trial, avg_delta, recorder.summary(), time.time() - start, metrics
+
+def evaluate_algo(z, fix_route, centralized, use_naive, workers=1, seed=None, profile=None,
+                  log=None, name=None, resume=False, metrics=None, assign_iterations=None,
+                  precision=None):
     '''
     Run z simulations with the given algorithm parameters and return performance result.
+
+    Each trial seeds the random module with its own seed derived from seed (a random
+    master seed if None), so the result only depends on seed and not on workers.
+    With workers > 1 the trials run in a pool of that many processes, and the running
+    average is printed as each trial finishes.
+
+    If profile is 'summary' or 'trace', each trial is instrumented and the return
+    value is (result, summary), where summary combines the trials' instrument
+    summaries and, for 'trace', their per-timestep traces.
+
+    If log is a results_log.ResultLog, each trial's result is appended to it
+    under the algorithm's name as soon as the trial finishes. With resume,
+    trials already logged for name and seed are not run again; their logged
+    results are used instead, and only the new trials are profiled.
+
+    If metrics is a TripMetrics, the travel times of every car in the trials run
+    are merged into it. assign_iterations is passed to test.
+
+    If precision is given, z is only the most trials to run: the run stops as soon
+    as the first trials (at least MIN_TRIALS) give a 95% confidence interval for the
+    mean that is within +/- precision, and prints how many trials that saved. The
+    trials are counted in trial order, so where a run stops depends on seed but not
+    on workers.
     '''
+    if seed is None:
+        seed = random.randrange(2**32)
+    seeds = trial_seeds(seed, z)
     li = []
+    by_trial = {}
+    summaries = {}
+    trips_by_trial = {}
+    if log is not None and resume:
+        for trial, record in log.completed(name, seed, trial_config(assign_iterations)).items():
+            if trial < z:
+                by_trial[trial] = record['average']
+                li.append(record['average'])
+        if by_trial:
+            print 'Resuming after', len(by_trial), 'logged trials'
+    # The results of trials 0, 1, ... up to the first one still running
+    stats = RunningStats()
+    add_finished(stats, by_trial, precision)
+    jobs = [(i, s, fix_route, centralized, use_naive, profile, assign_iterations) for i, s in enumerate(seeds) if i not in by_trial]
+    if converged(stats, precision):
+        jobs = []
+
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap_unordered(run_trial, jobs)
+    else:
+        results = itertools.imap(run_trial, jobs)
+
     print "This trial's result,", "Average of all trials"
-    for i in range(z):
-        graph, road_cost_map, spawn_probability = get_grid_graph(12)
-        avg_delta = test(30, graph, road_cost_map, spawn_probability, fix_route=fix_route, centralized=centralized, use_naive=use_naive, printable=False)
-        li.append(avg_delta)
-        print str("%.1f" % avg_delta) + ',', "%.1f" % avg(li)
+    try:
+        for trial, avg_delta, summary, seconds, trips in results:
+            by_trial[trial] = avg_delta
+            summaries[trial] = summary
+            trips_by_trial[trial] = trips
+            if log is not None:
+                log.append({'algorithm': name, 'seed': seed, 'trial': trial, 'trial_seed': seeds[trial],
+                            'config': trial_config(assign_iterations), 'average': avg_delta, 'seconds': seconds,
+                            'engine': SIMULATION_ENGINE, 'backend': ROUTING_BACKEND})
+            li.append(avg_delta)
+            print str("%.1f" % avg_delta) + ',', "%.1f" % avg(li)
+            sys.stdout.flush()
+            add_finished(stats, by_trial, precision)
+            if converged(stats, precision):
+                break
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    # Average in trial order so the result does not depend on finishing order;
+    # trials finished after an adaptive run's stopping point are left out
+    n = stats.count
+    if precision is not None:
+        print 'Stopped after %d of %d trials (%d saved): %.1f +/- %.1f' % (
+            n, z, z - n, stats.mean, stats.half_width(CONFIDENCE_Z))
+    if metrics is not None:
+        for i in range(n):
+            if i in trips_by_trial:
+                metrics.merge(trips_by_trial[i])
+    result = avg([by_trial[i] for i in range(n)])
+    if profile:
+        return result, instrument.merge([summaries[i] for i in range(n) if summaries.get(i)])
+    return result
+
+def add_finished(stats, by_trial, precision=None):
+    '''
+    Add the results in by_trial, {trial: result}, to the RunningStats stats in
+    trial order, stopping at the first trial that has not finished or as soon
+    as a run with the given precision can stop.
+    '''
+    while stats.count in by_trial and not converged(stats, precision):
+        stats.add(by_trial[stats.count])
+
+def converged(stats, precision):
+    '''
+    Return whether an adaptive run whose trial results are in the
+    RunningStats stats can stop, given its target precision. A run
+    without a precision never stops early.
+    '''
+    if precision is None or stats.count < MIN_TRIALS:
+        return False
+    return stats.half_width(CONFIDENCE_Z) < precision
 
-    return avg(li)
+def run_paired_trial(args):
+    '''
+    Run one trial of each algorithm with the same seed, so that all of them
+    see the same graph and start from the same random state. The arguments
+    are (trial, seed, algorithms), where algorithms lists (name, fix_route,
+    centralized, use_naive, assign_iterations). Returns (trial, {name:
+    (average, seconds, trip metrics)}).
+    '''
+    trial, seed, algorithms = args
+    results = {}
+    for name, fix_route, centralized, use_naive, assign_iterations in algorithms:
+        _, avg_delta, _, seconds, trips = run_trial((trial, seed, fix_route, centralized, use_naive, None, assign_iterations))
+        results[name] = (avg_delta, seconds, trips)
+    return trial, results
+
+def evaluate_paired(algorithms, z, workers=1, seed=None, precision=None, log=None, resume=False,
+                    metrics=None):
+    '''
+    Run up to z trials in which every algorithm runs on the same graph and seed
+    (common random numbers), and return {name: average travel time}. algorithms
+    lists (name, fix_route, centralized, use_naive, assign_iterations).
+
+    Because the algorithms face the same graphs, the differences between them vary
+    much less from trial to trial than their averages do. Each algorithm is compared
+    with the next one in the list, and with precision, the run stops as soon as every
+    difference is known within +/- precision (95% confidence), counting trials in
+    trial order as evaluate_algo does. The differences are printed along with how
+    many trials independent runs of the two algorithms would need for the same
+    precision.
+
+    log, resume and metrics ({name: TripMetrics}) are used as by evaluate_algo;
+    a trial is resumed only if every algorithm's result for it was logged.
+    '''
+    if seed is None:
+        seed = random.randrange(2**32)
+    seeds = trial_seeds(seed, z)
+    names = [a[0] for a in algorithms]
+    pairs = zip(names, names[1:])
+    by_trial = {}
+    trips_by_trial = {}
+    if log is not None and resume:
+        logged = [log.completed(a[0], seed, trial_config(a[4], paired=True)) for a in algorithms]
+        for trial in set.intersection(*[set(records) for records in logged]):
+            if trial < z:
+                by_trial[trial] = dict((name, records[trial]['average']) for name, records in zip(names, logged))
+        if by_trial:
+            print 'Resuming after', len(by_trial), 'logged trials'
+
+    stats = dict((name, RunningStats()) for name in names)
+    differences = dict((pair, RunningStats()) for pair in pairs)
+
+    def add_finished():
+        n = stats[names[0]].count
+        while n in by_trial and not done():
+            for name in names:
+                stats[name].add(by_trial[n][name])
+            for a, b in pairs:
+                differences[(a, b)].add(by_trial[n][a] - by_trial[n][b])
+            n += 1
+
+    def done():
+        return len(pairs) > 0 and all(converged(differences[pair], precision) for pair in pairs)
+
+    add_finished()
+    jobs = [(i, s, algorithms) for i, s in enumerate(seeds) if i not in by_trial]
+    if done():
+        jobs = []
+
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap_unordered(run_paired_trial, jobs)
+    else:
+        results = itertools.imap(run_paired_trial, jobs)
+
+    print 'Trial, ' + ', '.join(names)
+    try:
+        for trial, trial_results in results:
+            by_trial[trial] = dict((name, r[0]) for name, r in trial_results.items())
+            trips_by_trial[trial] = dict((name, r[2]) for name, r in trial_results.items())
+            if log is not None:
+                for name, _, _, _, assign_iterations in algorithms:
+                    avg_delta, seconds, _ = trial_results[name]
+                    log.append({'algorithm': name, 'seed': seed, 'trial': trial, 'trial_seed': seeds[trial],
+                                'config': trial_config(assign_iterations, paired=True), 'average': avg_delta,
+                                'seconds': seconds, 'engine': SIMULATION_ENGINE,
+                                'backend': ROUTING_BACKEND})
+            print '%d, %s' % (trial, ', '.join('%.1f' % by_trial[trial][name] for name in names))
+            sys.stdout.flush()
+            add_finished()
+            if done():
+                break
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    n = stats[names[0]].count
+    if metrics is not None:
+        for i in range(n):
+            for name, trips in trips_by_trial.get(i, {}).items():
+                metrics[name].merge(trips)
+
+    print ''
+    print 'Algorithm, trials, mean, 95% half-width'
+    for name in names:
+        print '%s, %d, %.1f, %.1f' % (name, n, stats[name].mean, stats[name].half_width(CONFIDENCE_Z))
+    print 'Difference, mean, 95% half-width, independent trials for the same precision'
+    for a, b in pairs:
+        d = differences[(a, b)]
+        half_width = d.half_width(CONFIDENCE_Z)
+        # Unpaired, the variance of the difference of two means of n trials is
+        # (var(a) + var(b)) / n
+        independent = n * (stats[a].variance() + stats[b].variance()) / d.variance() if d.variance() > 0 else float('inf')
+        print '%s - %s, %.1f, %.1f, %.0f' % (a, b, d.mean, half_width, independent)
+    if precision is not None:
+        print 'Stopped after %d of %d paired trials (%d trials of each algorithm saved)' % (n, z, z - n)
+    return dict((name, stats[name].mean) for name in names)
 
 def print_divider():
     print ''
@@ -461,23 +1214,126 @@ def print_divider():
     print ''
 
 def main():
+    global ROUTING_BACKEND, SIMULATION_ENGINE, GRAPH_STORE, REGIONS, DEMAND
+    parser = argparse.ArgumentParser(description='Evaluate the four routing algorithms.')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='number of processes to run trials in (default: one per CPU)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='master seed, to make the results reproducible')
+    parser.add_argument('--backend', choices=BACKENDS, default=ROUTING_BACKEND,
+                        help='how batched routing searches, as in --assignment, are run (default: %(default)s)')
+    parser.add_argument('--engine', choices=['timestep', 'event', 'regions'], default=SIMULATION_ENGINE,
+                        help='simulation loop; all give the same results (default: %(default)s)')
+    parser.add_argument('--regions', type=int, default=REGIONS,
+                        help='with --engine regions, the number of regions and processes each '
+                             'trial is split into; trials then run one at a time (default: %(default)s)')
+    parser.add_argument('--profile', action='store_true',
+                        help='print where the time goes in each algorithm')
+    parser.add_argument('--trace', metavar='PREFIX',
+                        help='with --profile, write per-timestep traces to PREFIX-<algorithm>.jsonl')
+    parser.add_argument('--graph', metavar='PATH',
+                        help='run every trial on the graph saved at PATH by graph_store.py '
+                             'instead of generating a new graph per trial')
+    parser.add_argument('--log', metavar='PATH',
+                        help='append each trial\'s result to the JSONL log PATH as it finishes')
+    parser.add_argument('--resume', action='store_true',
+                        help='with --log, skip the trials already logged for the same seed '
+                             '(default seed: that of the last logged trial)')
+    parser.add_argument('--assignment', type=int, metavar='ITERATIONS',
+                        help='also evaluate routing each timestep\'s waiting cars together by '
+                             'traffic assignment with this many iterations (see assignment.py)')
+    parser.add_argument('--demand', type=float, metavar='TRIPS',
+                        help='spawn this many trips per timestep on average between random junctions, '
+                             'weighted by their spawn probabilities, instead of 4 cars on one route')
+    parser.add_argument('--precision', type=float, metavar='H',
+                        help='stop each algorithm once the 95%% confidence interval of its average is '
+                             'within +/- H, running at most the usual number of trials')
+    parser.add_argument('--paired', action='store_true',
+                        help='run every algorithm on the same graph and seed in each trial and compare '
+                             'them in pairs; with --precision, stop once each difference is within +/- H')
+    args = parser.parse_args()
+    if args.resume and not args.log:
+        parser.error('--resume needs --log')
+    if args.paired and args.profile:
+        parser.error('--paired cannot be used with --profile')
+    ROUTING_BACKEND = args.backend
+    SIMULATION_ENGINE = args.engine
+    REGIONS = args.regions
+    GRAPH_STORE = args.graph
+    DEMAND = args.demand
+    if GRAPH_STORE is not None:
+        # Load in this process so that forked workers inherit the mappings
+        graph_store.shared(GRAPH_STORE)
+    log = ResultLog(args.log) if args.log else None
+    if args.seed is None and args.resume:
+        args.seed = log.last_seed(trial_config(paired=args.paired))
+    if args.seed is None:
+        args.seed = random.randrange(2**32)
+    print 'Master seed', args.seed
+    workers = args.workers
+    if SIMULATION_ENGINE == 'regions':
+        # Each trial starts its own processes, which pool processes cannot do
+        workers = 1
+    seed = args.seed
+    profile = None
+    if args.profile:
+        profile = 'trace' if args.trace else 'summary'
+
+    def print_metrics(metrics):
+        if metrics.count:
+            summary = metrics.summary()
+            print 'Travel time over %d cars: mean %.1f, std %.1f, p50 %.1f, p95 %.1f, p99 %.1f' % (
+                summary['count'], summary['mean'], summary['std'], summary['p50'], summary['p95'], summary['p99'])
+
+    if args.paired:
+        algorithms = [('naive', False, False, True, None), ('fixed', True, False, False, None),
+                      ('dynamic', False, False, False, None), ('centralized', False, True, False, None)]
+        if args.assignment is not None:
+            algorithms.append(('assignment', False, False, False, args.assignment))
+        metrics = dict((a[0], TripMetrics()) for a in algorithms)
+        print 'Evaluating the algorithms on the same graphs'
+        results = evaluate_paired(algorithms, 400, workers, seed, args.precision, log, args.resume, metrics)
+        for name, _, _, _, _ in algorithms:
+            print ''
+            print name
+            print_metrics(metrics[name])
+        print_divider()
+        for name, _, _, _, _ in algorithms:
+            print name, results[name]
+        return
+
+    def run(name, z, fix_route, centralized, use_naive, assign_iterations=None):
+        metrics = TripMetrics()
+        result = evaluate_algo(z, fix_route, centralized, use_naive, workers, seed, profile,
+                               log, name, args.resume, metrics, assign_iterations, args.precision)
+        print_metrics(metrics)
+        if profile:
+            result, summary = result
+            print ''
+            print instrument.report(summary)
+            if args.trace:
+                instrument.write_trace(summary, '%s-%s.jsonl' % (args.trace, name))
+        print_divider()
+        return result
+
     print 'Evaluating naive baseline'
-    naive = evaluate_algo(100, False, False, True)
-    print_divider()
+    naive = run('naive', 100, False, False, True)
     print 'Evaluating fixed baseline'
-    fixed = evaluate_algo(400, True, False, False)
-    print_divider()
+    fixed = run('fixed', 400, True, False, False)
     print 'Evaluating dynamic algorithm'
-    dynamic = evaluate_algo(400, False, False, False)
-    print_divider()
+    dynamic = run('dynamic', 400, False, False, False)
     print 'Evaluating centralized dynamic algorithm'
-    centralized = evaluate_algo(400, False, True, False)
-    print_divider()
+    centralized = run('centralized', 400, False, True, False)
+    if args.assignment is not None:
+        print 'Evaluating traffic assignment with %d iterations' % args.assignment
+        assigned = run('assignment', 400, False, False, False, args.assignment)
 
     print 'naive', naive
     print 'fixed', fixed
     print 'dynamic', dynamic
     print 'centralized', centralized
+    if args.assignment is not None:
+        print 'assignment', assigned
 
 if __name__ == '__main__':
     main()
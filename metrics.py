@@ -0,0 +1,181 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+#
+# Author: Brian Wong and Kevin Mu
+# Class: Computer Science 143
+# Date: December 2, 2014
+# Description: Travel time statistics that are updated as each car
+#              arrives, in memory that does not grow with the number of
+#              cars, and that can be merged across trials.
+#
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+import math
+
+class RunningStats:
+    """
+    class keeping the count, mean, variance, minimum and maximum of a
+    stream of numbers with Welford's online algorithm, which avoids the
+    cancellation of summing squares.
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    def merge(self, other):
+        '''
+        Add the numbers counted by other, using the pairwise update of Chan
+        et al.
+        '''
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def variance(self):
+        '''
+        Return the sample variance, or 0 for fewer than two numbers.
+        '''
+        if self.count < 2:
+            return 0.0
+        return self.m2 / (self.count - 1)
+
+    def std(self):
+        return math.sqrt(self.variance())
+
+    def half_width(self, z=1.96):
+        '''
+        Return the half-width of the normal confidence interval of the mean
+        for quantile z (1.96 for 95%), or infinity for fewer than two numbers.
+        '''
+        if self.count < 2:
+            return float('inf')
+        return z * self.std() / math.sqrt(self.count)
+
+class QuantileSketch:
+    """
+    class estimating quantiles of a stream of non-negative numbers with a
+    log-bucketed histogram (the DDSketch of Masson et al.).
+
+    x > 0 is counted in bucket ceil(log(x) / log(gamma)), where
+    gamma = (1 + accuracy) / (1 - accuracy), so every estimate is within
+    accuracy of the true quantile in relative terms. The number of buckets
+    only grows with the log of the range of the numbers, and sketches with
+    the same accuracy merge by adding their bucket counts.
+    """
+    def __init__(self, accuracy=0.01):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, x):
+        self.count += 1
+        if x <= 0:
+            self.zeros += 1
+            return
+        i = int(math.ceil(math.log(x) / self.log_gamma))
+        self.buckets[i] = self.buckets.get(i, 0) + 1
+
+    def merge(self, other):
+        if other.accuracy != self.accuracy:
+            raise ValueError('cannot merge sketches of accuracy %r and %r' % (self.accuracy, other.accuracy))
+        for i, n in other.buckets.items():
+            self.buckets[i] = self.buckets.get(i, 0) + n
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def quantile(self, q):
+        '''
+        Return an estimate of the q-quantile, 0 <= q <= 1, or None if
+        nothing has been added.
+        '''
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if seen > rank:
+            return 0.0
+        for i in sorted(self.buckets):
+            seen += self.buckets[i]
+            if seen > rank:
+                return 2 * self.gamma ** i / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+class TripMetrics:
+    """
+    class collecting the travel times of arrived cars: RunningStats and a
+    QuantileSketch over all of them, and RunningStats for each
+    (source, dest) pair in od. Cars can be dropped as soon as they are
+    added, and metrics from separate trials can be merged.
+    """
+    def __init__(self, accuracy=0.01):
+        self.times = RunningStats()
+        self.sketch = QuantileSketch(accuracy)
+        self.od = {}
+
+    @property
+    def count(self):
+        return self.times.count
+
+    def add(self, source, dest, time_elapsed):
+        self.times.add(time_elapsed)
+        self.sketch.add(time_elapsed)
+        key = (source, dest)
+        if key not in self.od:
+            self.od[key] = RunningStats()
+        self.od[key].add(time_elapsed)
+
+    def add_cars(self, cars):
+        '''
+        Add arrived Car objects or CarViews.
+        '''
+        for car in cars:
+            self.add(car.source, car.dest, car.time_elapsed)
+
+    def merge(self, other):
+        self.times.merge(other.times)
+        self.sketch.merge(other.sketch)
+        for key, stats in other.od.items():
+            if key not in self.od:
+                self.od[key] = RunningStats()
+            self.od[key].merge(stats)
+
+    def mean(self):
+        return self.times.mean
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+    def summary(self):
+        '''
+        Return the overall statistics as a dict.
+        '''
+        return {
+            'count': self.count,
+            'mean': self.times.mean,
+            'std': self.times.std(),
+            'min': self.times.min,
+            'max': self.times.max,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'od_pairs': len(self.od),
+        }
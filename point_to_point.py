@@ -0,0 +1,212 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+#
+# Author: Brian Wong and Kevin Mu
+# Class: Computer Science 143
+# Date: December 2, 2014
+# Description: Point-to-point shortest path queries on a CSRGraph, with
+#              A* and bidirectional search guided by the straight-line
+#              distance between junctions.
+#
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+import math
+import heap_module as hm
+import instrument
+
+# Relative difference within which astar treats a key as tied with the
+# destination's, to allow for rounding in the straight-line heuristic
+TIE_TOLERANCE = 1e-9
+
+def euclidean(graph, dest):
+    '''
+    Return h, where h(node) is the straight-line distance from node to
+    dest. Roads cost at least their length, so this never overestimates
+    the remaining cost and can be used as an A* heuristic.
+    '''
+    coords = graph.coords
+    x, y = coords[dest]
+    def h(node):
+        u, v = coords[node]
+        return math.sqrt((u - x)**2 + (v - y)**2)
+    return h
+
+def walk_back(pred, start, dest):
+    path = [dest]
+    while path[-1] != start:
+        path.append(pred[path[-1]])
+    path.reverse()
+    return path
+
+def tree_path(graph, g, start, dest):
+    '''
+    Walk back from dest to start choosing the predecessor Dijkstra's
+    algorithm would: of the nodes u with g[u] + cost == g[v] for the road
+    from u to v, the one with the smallest (g[u], u), which dijkstra_csr's
+    heap settles first. g must hold the exact distance of every node on a
+    shortest path from start to dest.
+    '''
+    in_offsets, in_edges, sources = graph.in_structure
+    _, _, cost = graph.lists()
+    path = [dest]
+    v = dest
+    while v != start:
+        best = None
+        for i in xrange(in_offsets[v], in_offsets[v+1]):
+            e = in_edges[i]
+            u = sources[e]
+            if u in g and g[u] + cost[e] == g[v] and (g[u], u) < (g[v], v):
+                if best is None or (g[u], u) < best:
+                    best = (g[u], u)
+        v = best[1]
+        path.append(v)
+    path.reverse()
+    return path
+
+def astar(graph, start, dest, heuristic=None):
+    '''
+    Find a shortest path from start to dest with A* search. heuristic
+    defaults to euclidean(graph, dest).
+
+    Of several shortest paths, the one returned is the one dijkstra_csr's
+    tree from start holds, so routes match the routing tables. To find
+    it, once dest is settled the search goes on to settle the nodes whose
+    key ties with dest's, which include every node on a shortest path.
+    The heuristic is rounded, so keys count as tied within TIE_TOLERANCE,
+    and a settled node reached by a shorter path is opened again.
+
+    Returns (path, distance, explored): the list of nodes from start to
+    dest (None if dest is unreachable), its cost, and the number of nodes
+    settled by the search.
+    '''
+    if heuristic is None:
+        heuristic = euclidean(graph, dest)
+    offsets, targets, cost = graph.lists()
+
+    g = {start: 0}
+    settled = set()
+    heap = hm.IndexedHeap()
+    heap.insert(start, heuristic(start))
+
+    relaxations = 0
+    while len(heap) > 0:
+        if dest in settled and heap.peekMin()[1] > g[dest] * (1 + TIE_TOLERANCE):
+            break
+        node, _ = heap.extractMin()
+        settled.add(node)
+        relaxations += offsets[node+1] - offsets[node]
+
+        for e in xrange(offsets[node], offsets[node+1]):
+            terminus = targets[e]
+            newDist = g[node] + cost[e]
+            if terminus not in g:
+                g[terminus] = newDist
+                heap.insert(terminus, newDist + heuristic(terminus))
+            elif newDist < g[terminus]:
+                g[terminus] = newDist
+                if terminus in settled:
+                    settled.remove(terminus)
+                    heap.insert(terminus, newDist + heuristic(terminus))
+                else:
+                    heap.decreaseKey(terminus, newDist + heuristic(terminus))
+
+    if instrument.active is not None:
+        instrument.active.search(len(settled), relaxations, len(g) - 1, 'astar')
+    if dest not in settled:
+        return None, float('inf'), len(settled)
+    return tree_path(graph, g, start, dest), g[dest], len(settled)
+
+def bidirectional(graph, start, dest):
+    '''
+    Find a shortest path from start to dest by searching forward from
+    start and backward from dest at the same time, always advancing the
+    side with the smaller key. Returns (path, distance, explored) like
+    astar, where explored counts the nodes settled on both sides.
+
+    Both searches are guided by the average of the two straight-line
+    potentials, p(v) = (h_dest(v) - h_start(v)) / 2, which keeps the
+    reduced costs non-negative in both directions. The search stops when
+    the two smallest keys together reach the best path found so far.
+    '''
+    offsets, targets, cost = graph.lists()
+    in_offsets, in_edges, sources = graph.in_structure
+    toDest = euclidean(graph, dest)
+    toStart = euclidean(graph, start)
+    def potential(node):
+        return (toDest(node) - toStart(node)) / 2
+
+    # Side 0 searches forward along out-edges, side 1 backward along in-edges
+    g = ({start: 0}, {dest: 0})
+    pred = ({}, {})
+    settled = (set(), set())
+    heaps = (hm.IndexedHeap(), hm.IndexedHeap())
+    heaps[0].insert(start, potential(start))
+    heaps[1].insert(dest, -potential(dest))
+    sign = (1, -1)
+
+    best = float('inf')
+    meeting = None
+    if start == dest:
+        best, meeting = 0, start
+    relaxations = 0
+
+    while len(heaps[0]) > 0 and len(heaps[1]) > 0:
+        top0 = heaps[0].peekMin()[1]
+        top1 = heaps[1].peekMin()[1]
+        if top0 + top1 >= best:
+            break
+        side = 0 if top0 <= top1 else 1
+        other = 1 - side
+        node, _ = heaps[side].extractMin()
+        settled[side].add(node)
+
+        if side == 0:
+            edges = xrange(offsets[node], offsets[node+1])
+            ends = targets
+            relaxations += offsets[node+1] - offsets[node]
+        else:
+            edges = (in_edges[i] for i in xrange(in_offsets[node], in_offsets[node+1]))
+            ends = sources
+            relaxations += in_offsets[node+1] - in_offsets[node]
+        for e in edges:
+            terminus = ends[e]
+            if terminus in settled[side]:
+                continue
+            newDist = g[side][node] + cost[e]
+            if terminus not in g[side]:
+                g[side][terminus] = newDist
+                pred[side][terminus] = node
+                heaps[side].insert(terminus, newDist + sign[side] * potential(terminus))
+            elif newDist < g[side][terminus]:
+                g[side][terminus] = newDist
+                pred[side][terminus] = node
+                heaps[side].decreaseKey(terminus, newDist + sign[side] * potential(terminus))
+            else:
+                continue
+            if terminus in g[other] and newDist + g[other][terminus] < best:
+                best = newDist + g[other][terminus]
+                meeting = terminus
+
+    explored = len(settled[0]) + len(settled[1])
+    if instrument.active is not None:
+        instrument.active.search(explored, relaxations, len(g[0]) + len(g[1]) - 2, 'bidirectional')
+    if meeting is None:
+        return None, float('inf'), explored
+
+    path = walk_back(pred[0], start, meeting)
+    node = meeting
+    while node != dest:
+        node = pred[1][node]
+        path.append(node)
+    return path, best, explored
+
+METHODS = {
+    'astar': astar,
+    'bidirectional': bidirectional,
+}
+
+def shortest_path(graph, start, dest, method='astar'):
+    '''
+    Answer one point-to-point query with the given method, returning
+    (path, distance, explored).
+    '''
+    return METHODS[method](graph, start, dest)
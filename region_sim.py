@@ -0,0 +1,253 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+#
+# Author: Brian Wong and Kevin Mu
+# Class: Computer Science 143
+# Date: December 2, 2014
+# Description: A parallel version of the event-driven simulation loop,
+#              which splits the map into regions by their coordinates
+#              and simulates each region in its own process.
+#
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+import multiprocessing
+import numpy as np
+import instrument
+import trajectory
+from event_sim import ArrivalQueue, travel_steps
+
+def partition(graph, regions):
+    '''
+    Split the junctions of a CSRGraph into the given number of regions by
+    recursive coordinate bisection: cut across the longer side of the
+    junctions' bounding box so that each side gets its share of the
+    junctions, and repeat on both sides. Returns an array giving the region
+    of every node.
+    '''
+    if not 1 <= regions <= graph.num_nodes:
+        raise ValueError('cannot split %d junctions into %d regions' % (graph.num_nodes, regions))
+    coords = np.array(graph.coords, dtype=np.float64)
+    region_of = np.zeros(graph.num_nodes, dtype=np.int64)
+
+    def split(nodes, first, count):
+        if count == 1:
+            region_of[nodes] = first
+            return
+        extent = coords[nodes].max(axis=0) - coords[nodes].min(axis=0)
+        axis = 0 if extent[0] >= extent[1] else 1
+        # Sort by the cut coordinate, then by node ID, so the cut is deterministic
+        nodes = nodes[np.lexsort((nodes, coords[nodes, axis]))]
+        left = count // 2
+        cut = len(nodes) * left // count
+        split(nodes[:cut], first, left)
+        split(nodes[cut:], first + left, count - left)
+
+    split(np.arange(graph.num_nodes), 0, regions)
+    return region_of
+
+class Region:
+    """
+    class simulating the cars in one region. A car belongs to the region
+    of the junction it is waiting at or driving toward.
+
+    Every region keeps the traffic of the whole map in its own
+    TrafficState, so its routes see the same costs as a single process
+    would. A road's traffic only changes when a car enters it, which only
+    the region of the road's start can do, and when that car reaches the
+    road's end, which is known as soon as it enters. So once per timestep
+    the regions exchange the roads their cars entered, with the time each
+    car will leave, and every region applies the others' entries and later
+    their departures.
+
+    A car driving toward a junction in another region is handed to that
+    region along with the entries, and is routed there when it arrives.
+    """
+    def __init__(self, index, region_of, fleet, traffic_state, spawn, demand, route):
+        self.index = index
+        self.region_of = region_of.tolist()
+        self.fleet = fleet
+        self.traffic_state = traffic_state
+        self.spawn = spawn
+        self.demand = demand
+        self.route = route
+        self.queue = ArrivalQueue()
+        self.spawned_at = {}
+        self.leaving = {}
+
+    def step(self, now, entries, incoming, decide=None):
+        '''
+        Simulate timestep now, after applying the other regions' entries
+        from the previous timestep and adding the cars handed to this one.
+
+        If decide is given, it is called with the local routing_demand of
+        the waiting cars, as (dests_set, number uncached), and returns the
+        dynamic route algorithm's choice for all regions.
+
+        Returns (entries, outgoing, arrivals): the (edge, leave time) of every
+        car routed, the cars handed to other regions keyed by region, and
+        the (id, source, dest, time elapsed) of the cars that arrived.
+        '''
+        fleet = self.fleet
+        traffic_state = self.traffic_state
+        for e, leave_time in entries:
+            traffic_state.enter(e)
+            self.leaving.setdefault(leave_time, []).append(e)
+        for car_id, source, dest, current_node, next_node, e, road_cost, fixed_route, spawned, arrival in incoming:
+            row = fleet.add(car_id, source, dest, current_node, next_node, 0, road_cost, 0, fixed_route, e)
+            self.spawned_at[row] = spawned
+            self.queue.schedule(row, arrival)
+
+        traffic_state.begin_step()
+        new_rows = self.spawn()
+        for row in new_rows:
+            self.spawned_at[row] = now
+        for e in self.leaving.pop(now, []):
+            traffic_state.leave(e)
+
+        due = self.queue.pop_due(now)
+        waiting = []
+        arrivals = []
+        if due:
+            rows = np.array(due)
+            fleet.current_node[rows] = fleet.next_node[rows]
+            fleet.next_node[rows] = -1
+            fleet.edge[rows] = -1
+            fleet.road_cost[rows] = np.nan
+            done = (fleet.current_node[rows] == fleet.dest[rows]).tolist()
+            for row, is_done in zip(due, done):
+                if is_done:
+                    arrivals.append((int(fleet.id[row]), int(fleet.source[row]),
+                                     int(fleet.dest[row]), now - self.spawned_at.pop(row)))
+                    fleet.fixed_route[row] = []
+                else:
+                    waiting.append(row)
+        # Handed over cars were added out of order, so route in car ID
+        # order, which is the row order of a single Fleet
+        waiting += new_rows
+        waiting.sort(key=fleet.id.__getitem__)
+
+        use_destinations = None
+        if decide is not None:
+            dests_set, uncached = self.demand(np.array(waiting, dtype=np.int64))
+            use_destinations = decide(dests_set, len(uncached))
+
+        entries = []
+        outgoing = {}
+        if waiting:
+            rows = np.array(waiting)
+            self.route(rows, use_destinations)
+            routed = zip(waiting, fleet.edge[rows].tolist(), fleet.next_node[rows].tolist(),
+                         fleet.road_cost[rows].tolist())
+            for row, e, next_node, road_cost in routed:
+                leave_time = now + travel_steps(road_cost)
+                self.leaving.setdefault(leave_time, []).append(e)
+                entries.append((e, leave_time))
+                region = self.region_of[next_node]
+                if region == self.index:
+                    self.queue.schedule(row, leave_time)
+                else:
+                    outgoing.setdefault(region, []).append((
+                        int(fleet.id[row]), int(fleet.source[row]), int(fleet.dest[row]),
+                        int(fleet.current_node[row]), next_node, e, road_cost,
+                        fleet.fixed_route[row], self.spawned_at.pop(row), leave_time))
+                    fleet.fixed_route[row] = []
+        return entries, outgoing, arrivals
+
+def serve(index, region_of, setup, spawner, coordinate, conn):
+    '''
+    The loop of a region's process: build the region with
+    setup(index, spawner) and run the timesteps the coordinator asks for
+    until told to stop.
+    '''
+    instrument.active = None
+    trajectory.active = None
+    region = Region(index, region_of, *setup(index, spawner))
+
+    def decide(dests_set, uncached):
+        conn.send((dests_set, uncached))
+        return conn.recv()
+
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        now, entries, incoming = message
+        conn.send(region.step(now, entries, incoming, decide if coordinate else None))
+    conn.close()
+
+def run(region_of, num_total_cars, setup, spawner, metrics, coordinate=False):
+    '''
+    Simulate until num_total_cars cars have arrived, with one process per
+    region, adding each one to metrics (a metrics.TripMetrics) as it arrives.
+
+    region_of gives the region of every node, e.g. from partition(). In
+    each process, setup(index, is_spawner) returns (fleet, traffic_state,
+    spawn, demand, route) for region index: an empty Fleet, a TrafficState
+    for the whole map, spawn() adding the region's new cars of a timestep
+    (is_spawner says whether index is the region given by spawner, which
+    adds the cars that are not tied to a region), demand(rows) returning
+    the main.routing_demand of waiting cars, and route(rows,
+    use_destinations) routing them. With coordinate, the regions agree each timestep on
+    whether the dynamic route algorithm uses destination tables, as a
+    single process would for all the waiting cars.
+
+    The processes are forked after the caller's setup, so the graph,
+    routing tables and random state are inherited rather than copied. This
+    gives the same arrivals as event_sim.run in a single process.
+    '''
+    recorder = instrument.active
+    regions = int(region_of.max()) + 1
+    workers = []
+    for index in range(regions):
+        conn, child = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=serve, args=(index, region_of, setup, index == spawner, coordinate, child))
+        process.daemon = True
+        process.start()
+        child.close()
+        workers.append((process, conn))
+
+    arrived = 0
+    entries = [[] for r in range(regions)]
+    incoming = [[] for r in range(regions)]
+    now = 0
+    try:
+        while arrived < num_total_cars:
+            if recorder is not None:
+                t = recorder.clock()
+            for index, (_, conn) in enumerate(workers):
+                others = [entry for r in range(regions) if r != index for entry in entries[r]]
+                conn.send((now, others, incoming[index]))
+            if coordinate:
+                demands = [conn.recv() for _, conn in workers]
+                dests_set = set().union(*[d for d, _ in demands])
+                uncached = sum(u for _, u in demands)
+                for _, conn in workers:
+                    conn.send(len(dests_set) < uncached)
+
+            incoming = [[] for r in range(regions)]
+            arrivals = []
+            for index, (_, conn) in enumerate(workers):
+                entries[index], outgoing, region_arrivals = conn.recv()
+                for region, cars in outgoing.items():
+                    incoming[region] += cars
+                arrivals += region_arrivals
+            # Cars arriving in the same timestep are in car ID order, as
+            # they would be in the rows of a single Fleet, and as in the
+            # timestep loop, extra arrivals in the last timestep are dropped
+            for _, source, dest, time_elapsed in sorted(arrivals)[:num_total_cars - arrived]:
+                metrics.add(source, dest, time_elapsed)
+            arrived += len(arrivals)
+            if recorder is not None:
+                recorder.phase('regions', t)
+                recorder.gauge('arrived', len(arrivals))
+                recorder.gauge('handoffs', sum(len(cars) for cars in incoming))
+                recorder.end_step()
+            now += 1
+
+        for _, conn in workers:
+            conn.send(None)
+        for process, _ in workers:
+            process.join()
+    finally:
+        for process, _ in workers:
+            if process.is_alive():
+                process.terminate()
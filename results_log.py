@@ -0,0 +1,127 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+#
+# Author: Brian Wong and Kevin Mu
+# Class: Computer Science 143
+# Date: December 2, 2014
+# Description: An on-disk log of trial results, written as each trial
+#              finishes, so that an interrupted run of main.py can be
+#              resumed and its averages rebuilt without rerunning it.
+#
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+import os
+import json
+import argparse
+
+class ResultLog:
+    """
+    class appending trial results to a file, one JSON object per line:
+
+        {"algorithm": "fixed", "seed": 12345, "trial": 7, "trial_seed": ...,
+         "config": {"graph": "grid 12", "demand": 3.0, ...},
+         "average": 34.1, "seconds": 1.2, "engine": "timestep", ...}
+
+    seed is the master seed of the run the trial belongs to, and config the
+    other settings its result depends on, such as the graph and demand, so
+    a trial is identified by (algorithm, seed, config, trial). Each line is
+    flushed to disk as soon as it is written, so at most the trial being
+    written is lost if the run is killed.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.records = read(path) if os.path.exists(path) else []
+        self.file = open(path, 'a')
+        # Start on a fresh line if the last one was cut short by a crash
+        if self.file.tell() > 0:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != '\n':
+                    self.file.write('\n')
+
+    def append(self, record):
+        self.file.write(json.dumps(record, sort_keys=True) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.records.append(record)
+
+    def completed(self, algorithm, seed, config=None):
+        '''
+        Return {trial: record} for the trials of algorithm already logged
+        under master seed seed with the same config. Records written
+        without a config only match config None.
+        '''
+        return dict((r['trial'], r) for r in self.records
+                    if r['algorithm'] == algorithm and r['seed'] == seed
+                    and r.get('config') == config)
+
+    def last_seed(self, config=None):
+        '''
+        Return the master seed of the last trial logged with config, or None.
+        '''
+        for r in reversed(self.records):
+            if r.get('config') == config:
+                return r['seed']
+        return None
+
+    def close(self):
+        self.file.close()
+
+def read(path):
+    '''
+    Return the records in the log at path. A last line cut short by a
+    crash is skipped.
+    '''
+    records = []
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+def config_key(config):
+    '''
+    Return a hashable, printable form of a record's config.
+    '''
+    if config is None:
+        return '-'
+    return ' '.join('%s=%s' % (name, config[name]) for name in sorted(config))
+
+def summarize(records):
+    '''
+    Return the average travel time of each (algorithm, seed, config) in
+    records as a list of (algorithm, seed, config_key(config), trials,
+    average, seconds) in the order the runs were first logged. A trial
+    logged more than once counts once.
+    '''
+    runs = {}
+    order = []
+    for r in records:
+        key = (r['algorithm'], r['seed'], config_key(r.get('config')))
+        if key not in runs:
+            runs[key] = {}
+            order.append(key)
+        runs[key][r['trial']] = r
+
+    rows = []
+    for key in order:
+        trials = runs[key].values()
+        average = sum(r['average'] for r in trials) / len(trials)
+        seconds = sum(r.get('seconds', 0) for r in trials)
+        rows.append(key + (len(trials), average, seconds))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize a log of trial results written by main.py --log.')
+    parser.add_argument('log', help='the JSONL result log')
+    args = parser.parse_args()
+    if not os.path.exists(args.log):
+        parser.error('no such log: %s' % args.log)
+
+    print 'Algorithm, seed, configuration, trials, average travel time, trial seconds'
+    for algorithm, seed, config, trials, average, seconds in summarize(read(args.log)):
+        print '%s, %s, %s, %d, %.1f, %.1f' % (algorithm, seed, config, trials, average, seconds)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+#
+# Author: Brian Wong and Kevin Mu
+# Class: Computer Science 143
+# Date: December 2, 2014
+# Description: A cache of routing table rows that are built lazily and
+#              dropped only when a road they use changes cost.
+#
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+from dynamic_sssp import DynamicRoutingTable
+
+class RoutingCache:
+    """
+    class acting as a lazily built routing table over the cost graph of a
+    TrafficState: cache[start][dest] is the next hop from start toward
+    dest, the same as gen_routing_table(cost_graph, [start])[start][dest].
+
+    A start's shortest path tree is only computed the first time its row
+    is looked up, and starts holds the starts whose trees are cached.
+    Rather than dropping every tree whenever the traffic changes, the
+    cache listens for edge changes and drops only the trees that the
+    change can affect: those that use the edge, if its cost went up, and
+    those that the edge now gives a route at least as short, if it went
+    down. A dropped row is rebuilt as a new list, so rows that a caller
+    already holds keep their old contents.
+
+    hits, misses and invalidations count the lookups served from the
+    cache, the Dijkstra's runs needed, and the trees dropped.
+    """
+    def __init__(self, traffic_state):
+        self.traffic_state = traffic_state
+        self.trees = DynamicRoutingTable(traffic_state.cost_graph)
+        self.starts = set()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        traffic_state.listeners.append(self)
+
+    def __getitem__(self, start):
+        if start in self.starts:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.trees.add_start(start)
+            self.starts.add(start)
+        return self.trees.table[start]
+
+    def __contains__(self, start):
+        return start in self.starts
+
+    def edge_changed(self, e, old_cost):
+        graph = self.trees.graph
+        a = graph.in_structure[2][e]
+        b = graph.structure[1][e]
+        _, _, cost = graph.lists()
+        new_cost = cost[e]
+
+        stale = []
+        for start in self.starts:
+            if new_cost > old_cost:
+                if self.trees.pred[start][b] == a:
+                    stale.append(start)
+            elif new_cost < old_cost:
+                dist = self.trees.dist[start]
+                if dist[a] + new_cost <= dist[b] and dist[a] < float('inf') and b != start:
+                    stale.append(start)
+
+        for start in stale:
+            self.trees.remove_start(start)
+            self.starts.remove(start)
+        self.invalidations += len(stale)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'invalidations': self.invalidations}
@@ -0,0 +1,451 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+#
+# Author: Brian Wong and Kevin Mu
+# Class: Computer Science 143
+# Date: December 2, 2014
+# Description: A long-running routing service for a central coordinator.
+#              Cars ask for their next hop over a socket, one JSON object
+#              per line; queries arriving close together are answered
+#              by one routing computation. Run with
+#                  python routing_service.py serve --nodes 400
+#                  python routing_service.py load --clients 8
+#
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncore
+import asynchat
+import argparse
+import numpy as np
+import main
+from traffic_state import TrafficState
+from routing_cache import RoutingCache
+from point_to_point import shortest_path
+from metrics import QuantileSketch
+
+def percentiles(samples, qs=(50, 90, 99)):
+    '''
+    Return a dict of the given percentiles of samples, and the maximum.
+    '''
+    if not samples:
+        return {}
+    values = np.percentile(samples, qs).tolist()
+    result = dict(('p%d' % q, v) for q, v in zip(qs, values))
+    result['max'] = max(samples)
+    return result
+
+def sketch_percentiles(sketch, maximum, qs=(50, 90, 99)):
+    '''
+    Return percentiles() of the numbers added to a QuantileSketch, given
+    their maximum, which the sketch does not keep. The estimates are
+    capped at the maximum, which they can exceed by the sketch's accuracy.
+    '''
+    if sketch.count == 0:
+        return {}
+    result = dict(('p%d' % q, min(sketch.quantile(q / 100.0), maximum)) for q in qs)
+    result['max'] = maximum
+    return result
+
+class Router:
+    """
+    class holding the live state of the road network: the graph, the
+    number of cars on each road and the routing information for the
+    resulting costs.
+
+    enter(u, v) and leave(u, v) record a car entering or leaving the road
+    from u to v, and update that road's cost and the cached routing rows
+    incrementally. next_hops(pairs) answers a batch of (node, dest) queries
+    at once, from destination-rooted trees when the batch has fewer
+    destinations than uncached junctions, and from the cache otherwise,
+    like the dynamic route algorithm in main.route_waiting.
+    """
+    def __init__(self, graph, road_cost_map):
+        self.graph = graph
+        self.traffic_state = TrafficState(graph, road_cost_map)
+        self.routing_cache = RoutingCache(self.traffic_state)
+        self.batches = 0
+        self.queries = 0
+        self.updates = 0
+
+    def node(self, value):
+        '''
+        Accept a node as its integer ID or as its [x, y] coordinates.
+        '''
+        if isinstance(value, list):
+            return self.graph.node_id[tuple(value)]
+        if not 0 <= value < self.graph.num_nodes:
+            raise ValueError('no node %r' % (value,))
+        return value
+
+    def road(self, u, v):
+        e = self.graph.edge(self.node(u), self.node(v))
+        if e is None:
+            raise ValueError('no road from %r to %r' % (u, v))
+        return e
+
+    def enter(self, u, v):
+        self.traffic_state.enter(self.road(u, v))
+        self.updates += 1
+
+    def leave(self, u, v):
+        e = self.road(u, v)
+        if self.traffic_state.traffic[e] == 0:
+            raise ValueError('no cars on the road from %r to %r' % (u, v))
+        self.traffic_state.leave(e)
+        self.updates += 1
+
+    def next_hops(self, pairs):
+        '''
+        Return the next hop for each (node, dest) pair, or None where dest
+        cannot be reached, all computed at the current traffic.
+        '''
+        pairs = [(self.node(u), self.node(d)) for u, d in pairs]
+        starts = set(u for u, d in pairs)
+        dests = set(d for u, d in pairs)
+        uncached = [u for u in starts if u not in self.routing_cache]
+        self.batches += 1
+        self.queries += len(pairs)
+
+        if len(dests) < len(uncached):
+            toward = main.gen_destination_table(self.traffic_state.cost_graph, dests)
+            return [None if u == d else toward[d][u] for u, d in pairs]
+        return [None if u == d else self.routing_cache[u][d] for u, d in pairs]
+
+    def path(self, u, d):
+        path, distance, _ = shortest_path(self.traffic_state.cost_graph, self.node(u), self.node(d))
+        return path, distance
+
+    def info(self):
+        offsets, targets = self.graph.structure
+        edges = [[u, targets[e]] for u in xrange(self.graph.num_nodes)
+                 for e in xrange(offsets[u], offsets[u+1])]
+        return {'num_nodes': self.graph.num_nodes, 'edges': edges}
+
+    def stats(self):
+        stats = {'batches': self.batches, 'queries': self.queries, 'updates': self.updates}
+        stats.update(self.routing_cache.stats())
+        return stats
+
+class RequestHandler(asynchat.async_chat):
+    """
+    One client connection. Each line is a JSON request, and each response
+    is a JSON line carrying the request's id. Responses to next_hop
+    requests can come back out of order with respect to other operations.
+    """
+    def __init__(self, sock, server):
+        asynchat.async_chat.__init__(self, sock)
+        self.server = server
+        self.buffer = []
+        self.set_terminator('\n')
+
+    def collect_incoming_data(self, data):
+        self.buffer.append(data)
+
+    def found_terminator(self):
+        line = ''.join(self.buffer)
+        self.buffer = []
+        received = time.time()
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('a request must be a JSON object')
+        except ValueError as e:
+            self.reply({'error': str(e)})
+            return
+        self.server.submit(self, request, received)
+
+    def reply(self, response):
+        # The client may have gone away while its queries were batched
+        if self.connected:
+            self.push(json.dumps(response) + '\n')
+
+class RoutingServer(asyncore.dispatcher):
+    """
+    class serving a Router over TCP or a Unix socket with asyncore.
+
+    Requests are JSON objects with an "op" and an optional "id":
+        {"op": "next_hop", "node": u, "dest": d}  ->  {"hop": v}
+        {"op": "enter", "from": u, "to": v}       ->  {"ok": true}
+        {"op": "exit", "from": u, "to": v}        ->  {"ok": true}
+        {"op": "path", "node": u, "dest": d}      ->  {"path": [...], "cost": c}
+        {"op": "info"}, {"op": "stats", "reset": false}
+
+    next_hop requests are held for up to window seconds, or until
+    max_batch of them are waiting, and then answered together by
+    Router.next_hops. Any other request first answers the waiting
+    next_hop requests, so every query sees the traffic updates sent
+    before it and none sent after it.
+
+    The time from reading a request to queueing its response is added to
+    a QuantileSketch, whose size only grows with the log of the range of
+    latencies, and stats reports its percentiles in milliseconds since the
+    server started. A stats request with "reset" set starts a new sketch
+    after reporting, so the next one covers only the requests after it.
+    """
+    def __init__(self, router, address, window=0.002, max_batch=256):
+        asyncore.dispatcher.__init__(self)
+        self.router = router
+        self.window = window
+        self.max_batch = max_batch
+        self.pending = []
+        self.deadline = None
+        self.latencies = QuantileSketch()
+        self.latency_max = 0.0
+        self.requests = 0
+        self.running = True
+
+        if isinstance(address, str):
+            if os.path.exists(address):
+                os.unlink(address)
+            self.create_socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.set_reuse_addr()
+        self.bind(address)
+        self.listen(128)
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None:
+            RequestHandler(pair[0], self)
+
+    def submit(self, handler, request, received):
+        self.requests += 1
+        if request.get('op') == 'next_hop':
+            if not self.pending:
+                self.deadline = received + self.window
+            self.pending.append((handler, request, received))
+            if len(self.pending) >= self.max_batch:
+                self.flush()
+            return
+
+        self.flush()
+        response = {'id': request.get('id')}
+        try:
+            response.update(self.execute(request))
+        except (ValueError, KeyError, TypeError) as e:
+            response['error'] = str(e)
+        handler.reply(response)
+        self.record_latency(time.time() - received)
+
+    def execute(self, request):
+        op = request.get('op')
+        router = self.router
+        if op == 'enter':
+            router.enter(request['from'], request['to'])
+            return {'ok': True}
+        if op == 'exit':
+            router.leave(request['from'], request['to'])
+            return {'ok': True}
+        if op == 'path':
+            path, cost = router.path(request['node'], request['dest'])
+            return {'path': path, 'cost': cost if path is not None else None}
+        if op == 'info':
+            return router.info()
+        if op == 'stats':
+            return self.stats(bool(request.get('reset')))
+        raise ValueError('unknown op %r' % (op,))
+
+    def flush(self):
+        '''
+        Answer all the waiting next_hop requests with one routing computation.
+        '''
+        if not self.pending:
+            return
+        pending = self.pending
+        self.pending = []
+        self.deadline = None
+        try:
+            hops = self.router.next_hops([(r['node'], r['dest']) for _, r, _ in pending])
+            responses = [{'id': r.get('id'), 'hop': hop} for (_, r, _), hop in zip(pending, hops)]
+        except (ValueError, KeyError, TypeError):
+            # Answer one at a time to find the bad requests
+            responses = []
+            for _, r, _ in pending:
+                try:
+                    responses.append({'id': r.get('id'), 'hop': self.router.next_hops([(r['node'], r['dest'])])[0]})
+                except (ValueError, KeyError, TypeError) as e:
+                    responses.append({'id': r.get('id'), 'error': str(e)})
+        now = time.time()
+        for (handler, _, received), response in zip(pending, responses):
+            handler.reply(response)
+            self.record_latency(now - received)
+
+    def record_latency(self, seconds):
+        ms = 1000 * seconds
+        self.latencies.add(ms)
+        self.latency_max = max(self.latency_max, ms)
+
+    def stats(self, reset=False):
+        stats = self.router.stats()
+        stats['requests'] = self.requests
+        stats['latency_ms'] = sketch_percentiles(self.latencies, self.latency_max)
+        if reset:
+            self.latencies = QuantileSketch()
+            self.latency_max = 0.0
+        return stats
+
+    def serve_forever(self):
+        while self.running:
+            timeout = 1.0
+            if self.deadline is not None:
+                timeout = max(0, self.deadline - time.time())
+            asyncore.loop(timeout=timeout, count=1)
+            if self.deadline is not None and time.time() >= self.deadline:
+                self.flush()
+
+class LoadClient(asynchat.async_chat):
+    """
+    One connection of the load generator. It keeps depth requests in
+    flight until it has sent its share, records each request's round-trip
+    time, and closes. A fraction of the requests are traffic updates: a
+    car entering a random road, or leaving one it entered earlier.
+    """
+    def __init__(self, address, requests, depth, edges, num_nodes, updates, rng):
+        asynchat.async_chat.__init__(self)
+        self.create_socket(socket.AF_UNIX if isinstance(address, str) else socket.AF_INET,
+                           socket.SOCK_STREAM)
+        self.set_terminator('\n')
+        self.buffer = []
+        self.remaining = requests
+        self.depth = depth
+        self.edges = edges
+        self.num_nodes = num_nodes
+        self.updates = updates
+        self.rng = rng
+        self.entered = []
+        self.sent = {}
+        self.next_id = 0
+        self.latencies = []
+        self.errors = 0
+        self.connect(address)
+
+    def handle_connect(self):
+        for _ in range(self.depth):
+            self.send_request()
+
+    def request(self):
+        rng = self.rng
+        if rng.random() < self.updates:
+            if self.entered and rng.random() < 0.5:
+                u, v = self.entered.pop(rng.randrange(len(self.entered)))
+                return {'op': 'exit', 'from': u, 'to': v}
+            u, v = rng.choice(self.edges)
+            self.entered.append((u, v))
+            return {'op': 'enter', 'from': u, 'to': v}
+        return {'op': 'next_hop', 'node': rng.randrange(self.num_nodes),
+                'dest': rng.randrange(self.num_nodes)}
+
+    def send_request(self):
+        if self.remaining == 0:
+            return
+        self.remaining -= 1
+        request = self.request()
+        request['id'] = self.next_id
+        self.sent[self.next_id] = time.time()
+        self.next_id += 1
+        self.push(json.dumps(request) + '\n')
+
+    def collect_incoming_data(self, data):
+        self.buffer.append(data)
+
+    def found_terminator(self):
+        response = json.loads(''.join(self.buffer))
+        self.buffer = []
+        self.latencies.append(time.time() - self.sent.pop(response['id']))
+        if 'error' in response:
+            self.errors += 1
+        self.send_request()
+        if not self.sent and self.remaining == 0:
+            self.close()
+
+def call(address, request):
+    '''
+    Send one request and wait for its response.
+    '''
+    sock = socket.socket(socket.AF_UNIX if isinstance(address, str) else socket.AF_INET)
+    sock.connect(address)
+    sock.sendall(json.dumps(request) + '\n')
+    data = ''
+    while not data.endswith('\n'):
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    sock.close()
+    return json.loads(data)
+
+def generate_load(address, clients=8, requests=1000, depth=4, updates=0.1, seed=0):
+    '''
+    Run the load generator against a server and return a report of the
+    throughput, the client-side latency percentiles and the server's stats.
+    '''
+    info = call(address, {'op': 'info'})
+    edges = [tuple(edge) for edge in info['edges']]
+    rng = random.Random(seed)
+    load = [LoadClient(address, requests, depth, edges, info['num_nodes'], updates,
+                       random.Random(rng.random())) for _ in range(clients)]
+    start = time.time()
+    asyncore.loop(timeout=0.1)
+    elapsed = time.time() - start
+
+    latencies = [1000 * t for client in load for t in client.latencies]
+    return {
+        'requests': len(latencies),
+        'errors': sum(client.errors for client in load),
+        'seconds': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed > 0 else 0,
+        'latency_ms': percentiles(latencies),
+        'server': call(address, {'op': 'stats'}),
+    }
+
+def parse_address(args):
+    if args.unix:
+        return args.unix
+    return (args.host, args.port)
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Routing service for a central coordinator.')
+    commands = parser.add_subparsers(dest='command')
+    serve = commands.add_parser('serve', help='run the routing service')
+    serve.add_argument('--nodes', type=int, default=400, help='size of the generated road graph')
+    serve.add_argument('--seed', type=int, default=0, help='seed for generating the graph')
+    serve.add_argument('--window', type=float, default=0.002,
+                       help='seconds to hold next_hop queries for batching (default: %(default)s)')
+    serve.add_argument('--max-batch', type=int, default=256)
+    load = commands.add_parser('load', help='generate load against a running service')
+    load.add_argument('--clients', type=int, default=8)
+    load.add_argument('--requests', type=int, default=1000, help='requests per client')
+    load.add_argument('--depth', type=int, default=4, help='requests in flight per client')
+    load.add_argument('--updates', type=float, default=0.1,
+                      help='fraction of requests that are traffic updates')
+    load.add_argument('--seed', type=int, default=0)
+    for command in (serve, load):
+        command.add_argument('--host', default='127.0.0.1')
+        command.add_argument('--port', type=int, default=8765)
+        command.add_argument('--unix', metavar='PATH', help='use a Unix socket instead of TCP')
+    args = parser.parse_args()
+    address = parse_address(args)
+
+    if args.command == 'serve':
+        random.seed(args.seed)
+        graph, road_cost_map, _ = main.get_grid_graph(args.nodes)
+        server = RoutingServer(Router(graph, road_cost_map), address, args.window, args.max_batch)
+        print 'Serving a %d-node graph on %s' % (graph.num_nodes, address)
+        sys.stdout.flush()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        print json.dumps(server.stats(), sort_keys=True)
+    else:
+        report = generate_load(address, args.clients, args.requests, args.depth, args.updates, args.seed)
+        print json.dumps(report, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main_cli()
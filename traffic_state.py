@@ -0,0 +1,64 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+#
+# Author: Brian Wong and Kevin Mu
+# Class: Computer Science 143
+# Date: December 2, 2014
+# Description: The number of cars on each road and the resulting road
+#              costs, kept up to date incrementally as cars enter and
+#              leave roads.
+#
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+class TrafficState:
+    """
+    class holding the traffic on every edge of a CSRGraph and the cost
+    graph that results from it.
+
+    enter(e) and leave(e) change the count on one edge and recompute only
+    that edge's cost, so a timestep costs O(number of cars that changed
+    roads) instead of O(E + cars). Edges whose cost changed since the last
+    begin_step() are recorded in changed.
+
+    Objects in listeners have listener.edge_changed(e, old_cost) called
+    after every change, e.g. a RoutingCache or DynamicRoutingTable.
+    """
+    def __init__(self, graph, road_cost_map, cars=(), traffic=None):
+        '''
+        The starting traffic is counted from the Car objects in cars, or
+        given directly as a per-edge traffic array.
+        '''
+        self.graph = graph
+        self.road_cost_map = road_cost_map
+        if traffic is not None:
+            self.traffic = list(traffic)
+        else:
+            self.traffic = [0] * graph.num_edges
+            for car in cars:
+                if car.next_node is not None:
+                    self.traffic[graph.edge(car.current_node, car.next_node)] += 1
+
+        self.cost_graph = graph.with_cost(road_cost_map.costs(self.traffic))
+        _, _, self.cost = self.cost_graph.lists()
+        self.changed = set()
+        self.listeners = []
+
+    def begin_step(self):
+        '''
+        Forget the edges changed during the previous timestep.
+        '''
+        self.changed = set()
+
+    def enter(self, e):
+        self.traffic[e] += 1
+        self.update(e)
+
+    def leave(self, e):
+        self.traffic[e] -= 1
+        self.update(e)
+
+    def update(self, e):
+        old_cost = self.cost[e]
+        self.cost_graph.set_cost(e, self.road_cost_map.cost(e, self.traffic[e]))
+        self.changed.add(e)
+        for listener in self.listeners:
+            listener.edge_changed(e, old_cost)
@@ -0,0 +1,284 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+#
+# Author: Brian Wong and Kevin Mu
+# Class: Computer Science 143
+# Date: December 2, 2014
+# Description: A compact log of what every car did in a run, written as
+#              fixed-width columns while the simulation runs and read
+#              back memory-mapped to rebuild routes and traffic later.
+#
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+import os
+import json
+import random
+import argparse
+import contextlib
+import numpy as np
+
+FORMAT = 1
+
+# The columns of a record, each stored in its own file of raw values.
+# Nodes and edges are CSRGraph IDs, and -1 means none.
+COLUMNS = [
+    ('step', np.int32),
+    ('car', np.int64),
+    ('node', np.int32),
+    ('next_node', np.int32),
+    ('edge', np.int32),
+    ('progress', np.int32),
+    ('event', np.int8),
+]
+
+# Event types. SPAWN has the car's source as node and its destination as
+# next_node; ENTER is a car routed from node onto edge toward next_node;
+# ARRIVE has the destination as node; MOVE, recorded only with positions,
+# is a car partway along edge with the given progress.
+SPAWN = 0
+ENTER = 1
+ARRIVE = 2
+MOVE = 3
+EVENTS = ['spawn', 'enter', 'arrive', 'move']
+
+# Records buffered in memory before they are written out
+CHUNK_SIZE = 1 << 16
+
+# The TrajectoryWriter in use, or None when nothing is being recorded.
+# As with instrument.active, the simulation checks this once per call.
+active = None
+
+class TrajectoryWriter:
+    """
+    class appending records to a trajectory directory. Records are copied
+    into preallocated column chunks with a few NumPy assignments per call,
+    and each chunk is appended to the column files when it fills up.
+
+    now is the timestep being recorded; the simulation loop calls
+    end_step() after each one. If positions is set, the timestep loop also
+    records a MOVE for every car partway along a road each timestep.
+    """
+    def __init__(self, path, positions=False, chunk_size=CHUNK_SIZE):
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.path = path
+        self.positions = positions
+        self.chunk_size = chunk_size
+        self.buffers = dict((name, np.empty(chunk_size, dtype=dtype)) for name, dtype in COLUMNS)
+        self.files = dict((name, open(os.path.join(path, name + '.bin'), 'wb')) for name, _ in COLUMNS)
+        self.fill = 0
+        self.count = 0
+        self.now = 0
+        self.write_meta()
+
+    def write_meta(self):
+        meta = {
+            'format': FORMAT,
+            'columns': [[name, np.dtype(dtype).str] for name, dtype in COLUMNS],
+            'events': EVENTS,
+            'records': self.count + self.fill,
+            'steps': self.now,
+        }
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2, sort_keys=True)
+
+    def record(self, event, cars, nodes, next_nodes=-1, edges=-1, progress=0):
+        '''
+        Record one event of type event for each car in the array cars. The
+        other arguments are arrays of the same length or single values.
+        '''
+        cars = np.asarray(cars)
+        n = len(cars)
+        values = [('car', cars), ('node', nodes), ('next_node', next_nodes),
+                  ('edge', edges), ('progress', progress)]
+        values = [(name, np.asarray(value)) for name, value in values]
+        start = 0
+        while start < n:
+            if self.fill == self.chunk_size:
+                self.flush()
+            k = min(n - start, self.chunk_size - self.fill)
+            rows = slice(self.fill, self.fill + k)
+            for name, value in values:
+                self.buffers[name][rows] = value[start:start + k] if value.ndim else value
+            self.buffers['step'][rows] = self.now
+            self.buffers['event'][rows] = event
+            self.fill += k
+            start += k
+
+    def end_step(self):
+        self.now += 1
+
+    def flush(self):
+        for name, _ in COLUMNS:
+            self.buffers[name][:self.fill].tofile(self.files[name])
+            self.files[name].flush()
+        self.count += self.fill
+        self.fill = 0
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            f.close()
+        self.write_meta()
+
+@contextlib.contextmanager
+def recording(path, positions=False):
+    '''
+    Record the trajectories of a run to the directory path for the
+    duration of a with block:
+
+        with trajectory.recording('run1'):
+            main.test(...)
+        routes = trajectory.Trajectory('run1').routes()
+    '''
+    global active
+    previous = active
+    active = TrajectoryWriter(path, positions)
+    try:
+        yield active
+    finally:
+        writer = active
+        active = previous
+        writer.close()
+
+class Trajectory:
+    """
+    class reading a trajectory directory. Each column is memory-mapped, so
+    opening a large log costs nothing until its records are used; a log
+    cut short by a crash is read up to its last whole record.
+    """
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['format'] != FORMAT:
+            raise ValueError('unsupported trajectory format %r' % (meta['format'],))
+        columns = {}
+        for name, dtype in meta['columns']:
+            filename = os.path.join(path, name + '.bin')
+            size = os.path.getsize(filename) // np.dtype(dtype).itemsize
+            if size:
+                columns[name] = np.memmap(filename, dtype=dtype, mode='r', shape=(size,))
+            else:
+                columns[name] = np.zeros(0, dtype=dtype)
+        count = min(len(column) for column in columns.values())
+        for name, column in columns.items():
+            setattr(self, name, column[:count])
+        self.count = count
+        self.steps = max(meta['steps'], int(self.step.max()) + 1 if count else 0)
+
+    def __len__(self):
+        return self.count
+
+    def counts(self):
+        '''
+        Return {event name: number of records}.
+        '''
+        found = np.bincount(self.event, minlength=len(EVENTS))
+        return dict(zip(EVENTS, found.tolist()))
+
+    def route(self, car):
+        '''
+        Return the nodes the car with the given id has visited, in order.
+        '''
+        rows = np.nonzero((self.car == car) & (self.event == ENTER))[0]
+        if len(rows) == 0:
+            return []
+        return [int(self.node[rows[0]])] + self.next_node[rows].tolist()
+
+    def routes(self):
+        '''
+        Return {car id: nodes visited} for every car that was routed.
+        '''
+        rows = np.nonzero(self.event == ENTER)[0]
+        if len(rows) == 0:
+            return {}
+        # A stable sort by car keeps each car's records in timestep order
+        rows = rows[np.argsort(self.car[rows], kind='mergesort')]
+        cars = self.car[rows]
+        starts = np.nonzero(np.r_[True, cars[1:] != cars[:-1]])[0]
+        ends = np.r_[starts[1:], len(rows)]
+        nodes = self.node[rows].tolist()
+        next_nodes = self.next_node[rows].tolist()
+        return dict((int(cars[a]), [nodes[a]] + next_nodes[a:b]) for a, b in zip(starts, ends))
+
+    def edge_traffic(self, num_edges):
+        '''
+        Return an array of shape (steps, num_edges) giving the number of cars
+        on each edge at the end of each timestep, as the simulation's
+        TrafficState held it. A car is on the edge it entered until its next
+        event, when it reaches the end of the edge.
+        '''
+        rows = np.nonzero((self.event == ENTER) | (self.event == ARRIVE))[0]
+        rows = rows[np.argsort(self.car[rows], kind='mergesort')]
+        cars = self.car[rows]
+        steps = self.step[rows].astype(np.int64)
+        entered = np.nonzero(self.event[rows] == ENTER)[0]
+        # The step each car leaves its edge: that of its next record, or
+        # never if the run ended first
+        last = np.r_[cars[1:] != cars[:-1], True]
+        leave = np.where(last[entered], self.steps, steps[np.minimum(entered + 1, len(rows) - 1)])
+        edges = self.edge[rows][entered]
+
+        change = np.zeros((self.steps + 1, num_edges), dtype=np.int64)
+        np.add.at(change, (steps[entered], edges), 1)
+        np.add.at(change, (leave, edges), -1)
+        return np.cumsum(change, axis=0)[:self.steps]
+
+def main():
+    parser = argparse.ArgumentParser(description='Record and inspect car trajectories.')
+    commands = parser.add_subparsers(dest='command')
+
+    command = commands.add_parser('record', help='run one trial on a grid graph and record it')
+    command.add_argument('path')
+    command.add_argument('--nodes', type=int, default=12,
+                         help='number of junctions (default: %(default)s)')
+    command.add_argument('--cars', type=int, default=30,
+                         help='cars to arrive before the run stops (default: %(default)s)')
+    command.add_argument('--mode', choices=['naive', 'fixed', 'dynamic', 'centralized'], default='dynamic')
+    command.add_argument('--demand', type=float, metavar='TRIPS',
+                         help='trips per timestep, as for main.py --demand')
+    command.add_argument('--positions', action='store_true',
+                         help='also record where every car is each timestep')
+    command.add_argument('--seed', type=int, default=None)
+
+    command = commands.add_parser('info', help='summarize a recorded run')
+    command.add_argument('path')
+    command.add_argument('--car', type=int, help='also print the route of this car')
+
+    args = parser.parse_args()
+    if args.command == 'record':
+        import main as simulator
+        # Run as a script, this module is __main__, so record through the
+        # module the simulator imported
+        import trajectory
+        random.seed(args.seed)
+        graph, road_cost_map, spawn_probability = simulator.get_grid_graph(args.nodes)
+        options = {
+            'naive': {'use_naive': True},
+            'fixed': {'fix_route': True},
+            'dynamic': {},
+            'centralized': {'centralized': True},
+        }[args.mode]
+        with trajectory.recording(args.path, args.positions) as writer:
+            average = simulator.test(args.cars, graph, road_cost_map, spawn_probability,
+                                     demand=args.demand, **options)
+        print 'Recorded %d events over %d timesteps to %s' % (writer.count, writer.now, args.path)
+        print 'Average travel time, %.2f' % average
+        return
+
+    if not os.path.exists(os.path.join(args.path, 'meta.json')):
+        parser.error('not a trajectory: %s' % args.path)
+    log = Trajectory(args.path)
+    print 'Records, %d' % len(log)
+    print 'Timesteps, %d' % log.steps
+    for name, n in sorted(log.counts().items()):
+        print 'Events %s, %d' % (name, n)
+    if log.counts()['enter']:
+        num_edges = int(log.edge.max()) + 1
+        traffic = log.edge_traffic(num_edges)
+        step, e = np.unravel_index(np.argmax(traffic), traffic.shape)
+        print 'Busiest road, edge %d with %d cars at timestep %d' % (e, traffic[step, e], step)
+    if args.car is not None:
+        print 'Route of car %d, %s' % (args.car, ' '.join(str(node) for node in log.route(args.car)))
+
+if __name__ == '__main__':
+    main()